@@ -1,7 +1,26 @@
 # This script downloads census data for each state in the US.
+#
+# Files are fetched concurrently, resumed with HTTP Range requests, checked with a zip
+# CRC test before being moved into place, and recorded with their SHA-256 in a
+# census_download_manifest.json next to the downloads.
+#
+# Usage:
+#     python 0.1-download_cenus_data.py
+#     python 0.1-download_cenus_data.py --layers tract --workers 16
+#     python 0.1-download_cenus_data.py --mirror_base_url file:///data/tiger
 
 import os
+import sys
 import json
+import shutil
+import hashlib
+import zipfile
+import argparse
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
 
 # Load configuration
 with open('setting.json') as f:
@@ -59,53 +78,190 @@ state_list = {"01":"ALABAMA",
 "55":"WISCONSIN",
 "56":"WYOMING"}
 
-# base_url = "https://www2.census.gov/geo/tiger/TIGER2021/TABBLOCK20/tl_2021_%s_tabblock20.zip"
-base_url = "https://www2.census.gov/geo/tiger/TIGER2020/TABBLOCK20/tl_2020_%s_tabblock20.zip"
-# https://www2.census.gov/geo/tiger/TIGER2020/TRACT/tl_2020_01_tract.zip
-outpath = config['census_data_2020'] + "/"
-os.makedirs(outpath, exist_ok=True)
+LAYERS = {
+    # layer: (path under the TIGER base URL, setting.json key of the output directory)
+    "tabblock20": ("TIGER2020/TABBLOCK20/tl_2020_{state}_tabblock20.zip", "census_data_2020"),
+    # tracts get their own directory: 0.4.3 loads every geometry file of it
+    "tract": ("TIGER2020/TRACT/tl_2020_{state}_tract.zip", "census_tracts_2020"),
+}
+DEFAULT_BASE_URL = "https://www2.census.gov/geo/tiger"
+MANIFEST_NAME = "census_download_manifest.json"
 
-from tqdm import tqdm
+
+def validate_zip(filepath):
+    """True if the file is a readable zip whose members all pass their CRC check"""
+    try:
+        with zipfile.ZipFile(filepath) as zf:
+            return zf.testzip() is None
+    except (zipfile.BadZipFile, OSError, EOFError):
+        return False
+
+
+def sha256sum(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(outpath):
+    try:
+        with open(os.path.join(outpath, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(outpath, manifest):
+    manifest_path = os.path.join(outpath, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def download_file(url, filepath, retries=3, timeout=120):
+    """
+    Download url to filepath, resuming a partial download with an HTTP Range request
+
+    Data goes to <filepath>.part and is only renamed into place once the zip validates,
+    so an interrupted or truncated download is never mistaken for a finished one.
+    Servers (and file:// mirrors) that ignore the Range header restart from byte 0.
+    """
+    part_path = filepath + ".part"
+    last_error = None
+
+    for attempt in range(1, retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if offset and getattr(response, "status", None) != 206:
+                    offset = 0
+                with open(part_path, "ab" if offset else "wb") as out:
+                    shutil.copyfileobj(response, out, 1 << 20)
+        except urllib.error.HTTPError as e:
+            # 416: nothing left to fetch past offset, so the part file may already be complete
+            if e.code != 416:
+                last_error = e
+                continue
+        except (urllib.error.URLError, OSError) as e:
+            last_error = e
+            continue
+
+        if validate_zip(part_path):
+            os.replace(part_path, filepath)
+            return
+        # Corrupt data cannot be fixed by resuming; start the next attempt from scratch
+        last_error = RuntimeError(f"invalid zip after attempt {attempt}")
+        os.remove(part_path)
+
+    raise RuntimeError(f"{url}: {last_error}")
+
+
+def process_file(task, manifest_entry, verify):
+    """
+    Make sure one zip is present and valid, downloading it if needed
+
+    Returns (status, manifest entry) where status is 'skipped' or 'downloaded'
+    """
+    filepath = task["filepath"]
+
+    if os.path.exists(filepath):
+        size = os.path.getsize(filepath)
+        # A manifest entry with a matching size is trusted unless --verify is given
+        if manifest_entry and manifest_entry["size"] == size and not verify:
+            return "skipped", manifest_entry
+        if validate_zip(filepath):
+            entry = {"url": task["url"], "size": size, "sha256": sha256sum(filepath)}
+            if manifest_entry and manifest_entry["sha256"] != entry["sha256"] and verify:
+                raise RuntimeError(f"{filepath}: checksum differs from manifest")
+            return "skipped", entry
+        os.remove(filepath)
+
+    download_file(task["url"], filepath)
+    return "downloaded", {"url": task["url"], "size": os.path.getsize(filepath),
+                          "sha256": sha256sum(filepath)}
+
+
+parser = argparse.ArgumentParser(description="Download TIGER/Line 2020 census shapefiles for all states")
+parser.add_argument("--layers", nargs="+", choices=sorted(LAYERS), default=sorted(LAYERS),
+                    help="Layers to download (default: all)")
+parser.add_argument("--workers", type=int, default=8,
+                    help="Number of concurrent downloads (default: 8)")
+parser.add_argument("--mirror_base_url", type=str, default=DEFAULT_BASE_URL,
+                    help="Base URL with the census TIGER directory layout, "
+                         "e.g. http://fileserver/tiger or file:///data/tiger")
+parser.add_argument("--verify", action="store_true",
+                    help="Re-validate and re-hash existing files instead of trusting the manifest")
+args = parser.parse_args()
+
+base_url = args.mirror_base_url.rstrip("/")
+
+tasks = []
+for layer in args.layers:
+    path_template, config_key = LAYERS[layer]
+    outpath = config[config_key] + "/"
+    os.makedirs(outpath, exist_ok=True)
+    for state in state_list:
+        relative_path = path_template.format(state=state)
+        tasks.append({
+            "layer": layer,
+            "state": state,
+            "outpath": outpath,
+            "url": f"{base_url}/{relative_path}",
+            "filepath": os.path.join(outpath, os.path.basename(relative_path)),
+        })
+
+manifests = {outpath: load_manifest(outpath) for outpath in {t["outpath"] for t in tasks}}
 
 # Track download statistics
 downloaded = 0
 skipped = 0
 failed = 0
 
-print(f"\nChecking and downloading census data to: {outpath}")
-print(f"Total states to process: {len(state_list)}\n")
+print(f"\nChecking and downloading census data from: {base_url}")
+print(f"Layers: {', '.join(args.layers)}")
+print(f"Total files to process: {len(tasks)} ({args.workers} workers)\n")
 
-for state in tqdm(state_list, total=len(state_list), desc="Processing states"):
-    url = base_url % state
-    filename = f"tl_2020_{state}_tabblock20.zip"
-    filepath = os.path.join(outpath, filename)
+with ThreadPoolExecutor(max_workers=args.workers) as executor:
+    futures = {}
+    for task in tasks:
+        name = os.path.basename(task["filepath"])
+        entry = manifests[task["outpath"]].get(name)
+        futures[executor.submit(process_file, task, entry, args.verify)] = task
 
-    # Check if file already exists
-    if os.path.exists(filepath):
-        file_size = os.path.getsize(filepath)
-        # Only skip if file size is > 0 (valid file)
-        if file_size > 0:
-            tqdm.write(f"✓ Skipping {state_list[state]:20s} - already downloaded ({file_size:,} bytes)")
-            skipped += 1
+    for future in tqdm(as_completed(futures), total=len(futures), desc="Processing files"):
+        task = futures[future]
+        name = os.path.basename(task["filepath"])
+        label = f"{state_list[task['state']]:20s} {task['layer']:10s}"
+        try:
+            status, entry = future.result()
+        except Exception as e:
+            tqdm.write(f"✗ Failed {label} - {e}")
+            failed += 1
             continue
-        else:
-            tqdm.write(f"⚠ Re-downloading {state_list[state]:20s} - existing file is empty")
-            os.remove(filepath)
 
-    # Download the file
-    tqdm.write(f"↓ Downloading {state_list[state]:20s}...")
-    result = os.system(f"wget -q {url} -P {outpath}")
+        manifests[task["outpath"]][name] = entry
+        if status == "downloaded":
+            tqdm.write(f"↓ Downloaded {label} ({entry['size']:,} bytes)")
+            downloaded += 1
+        else:
+            skipped += 1
 
-    if result == 0:
-        downloaded += 1
-    else:
-        tqdm.write(f"✗ Failed to download {state_list[state]}")
-        failed += 1
+for outpath, manifest in manifests.items():
+    save_manifest(outpath, manifest)
 
 print("\n" + "="*60)
 print("Download Summary:")
 print(f"  Downloaded: {downloaded}")
 print(f"  Skipped:    {skipped}")
 print(f"  Failed:     {failed}")
-print(f"  Total:      {len(state_list)}")
+print(f"  Total:      {len(tasks)}")
 print("="*60)
+
+if failed:
+    sys.exit(1)
@@ -6,20 +6,109 @@ This script scans all geotagged tweet files and checks if corresponding
 BERT sentiment files exist. Missing sentiment files are saved to CSV for
 further investigation or re-processing.
 
+Each directory is listed once with os.scandir, and the listing (with sentiment file
+sizes and mtimes) is cached in outputs/sentiment_inventory_cache.json. Later runs
+reuse the cached listing for every directory whose mtime has not changed, so an
+unchanged year costs a single stat instead of one metadata call per file.
+
 Usage:
     python 0.1.5-find-missing-sentiment-files.py
 
+    # Ignore the cached inventory and re-scan every directory
+    python 0.1.5-find-missing-sentiment-files.py --refresh_inventory
+
 Output:
     - outputs/missing_sentiment_files.csv: List of missing sentiment files
     - outputs/missing_sentiment_summary.txt: Summary statistics
+    - outputs/sentiment_inventory_cache.json: Cached directory inventory
 """
 
 import os
 import json
+import argparse
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
 
+from sentiment_io import find_sentiment_file, sentiment_file_name
+
+
+def load_inventory(inventory_path):
+    """Load the cached directory inventory ({} if missing or unreadable)"""
+    try:
+        with open(inventory_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_inventory(inventory_path, inventory):
+    """Write the inventory atomically so an interrupted run never leaves a broken cache"""
+    tmp_path = inventory_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(inventory, f)
+    os.replace(tmp_path, inventory_path)
+
+
+def scan_directory(path, inventory, scan_stats, with_stats=False):
+    """
+    List a directory once, reusing the cached listing when its mtime is unchanged
+
+    A directory's mtime changes whenever an entry is added, removed or renamed, so an
+    unchanged mtime means the cached file names are still current. A file rewritten in
+    place keeps the directory mtime, though: 0.1.8 --copy --overwrite replaces empty
+    sentiment files that way. Cached entries of size 0 are therefore stat'ed again
+    (there are few of them); other sizes are trusted until the directory changes.
+
+    Args:
+        path: Directory to list
+        inventory: Cached inventory dict, updated in place
+        scan_stats: Counter dict with 'scanned' and 'cached' entries
+        with_stats: Also record [size, mtime_ns] per file (one stat per file on re-scan)
+
+    Returns:
+        dict of file name -> [size, mtime_ns] (None values without with_stats),
+        or None if the directory does not exist
+    """
+    try:
+        dir_mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = inventory.get(path)
+    if cached and cached['mtime_ns'] == dir_mtime and (cached['with_stats'] or not with_stats):
+        scan_stats['cached'] += 1
+        if cached['with_stats']:
+            for name, stats in cached['files'].items():
+                if stats[0] == 0:
+                    try:
+                        st = os.stat(os.path.join(path, name))
+                    except FileNotFoundError:
+                        continue
+                    cached['files'][name] = [st.st_size, st.st_mtime_ns]
+        return cached['files']
+
+    files = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            if with_stats:
+                st = entry.stat()
+                files[entry.name] = [st.st_size, st.st_mtime_ns]
+            else:
+                files[entry.name] = None
+
+    inventory[path] = {'mtime_ns': dir_mtime, 'with_stats': with_stats, 'files': files}
+    scan_stats['scanned'] += 1
+    return files
+
+
+parser = argparse.ArgumentParser(description='Find tweet files without a BERT sentiment file')
+parser.add_argument('--refresh_inventory', action='store_true',
+                    help='Ignore the cached directory inventory and re-scan every directory')
+args = parser.parse_args()
+
 # Load configuration
 with open('setting.json') as f:
     config = json.load(f)
@@ -39,6 +128,10 @@ print(f"Sentiment files path: {sentiment_file_base_path}")
 print(f"Output directory: {outputs_dir}")
 print()
 
+inventory_path = os.path.join(outputs_dir, "sentiment_inventory_cache.json")
+inventory = {} if args.refresh_inventory else load_inventory(inventory_path)
+scan_stats = {'scanned': 0, 'cached': 0}
+
 # Initialize lists to store results
 missing_files = []
 existing_files = []
@@ -51,16 +144,20 @@ for year in range(2010, 2025):
     tweets_path_year = os.path.join(geo_tweets_archive_base_path, str(year))
     sentiment_path_year = os.path.join(sentiment_file_base_path, str(year))
 
+    # List both directories once (or reuse the cached listing)
+    tweet_listing = scan_directory(tweets_path_year, inventory, scan_stats)
+    sentiment_listing = scan_directory(sentiment_path_year, inventory, scan_stats, with_stats=True)
+
     # Check if tweet directory exists
-    if not os.path.exists(tweets_path_year):
+    if tweet_listing is None:
         print(f"  ⚠️  Tweet directory does not exist: {tweets_path_year}")
         continue
 
     # Check if sentiment directory exists
-    if not os.path.exists(sentiment_path_year):
+    if sentiment_listing is None:
         print(f"  ⚠️  Sentiment directory does not exist: {sentiment_path_year}")
         # Mark all tweet files as missing sentiment
-        tweet_files = [f for f in os.listdir(tweets_path_year) if f.endswith(".csv.gz")]
+        tweet_files = [f for f in tweet_listing if f.endswith(".csv.gz")]
         for tweet_file in tweet_files:
             missing_files.append({
                 'year': year,
@@ -73,7 +170,7 @@ for year in range(2010, 2025):
         continue
 
     # Get all tweet files in this year
-    tweet_files = [f for f in os.listdir(tweets_path_year) if f.endswith(".csv.gz")]
+    tweet_files = [f for f in tweet_listing if f.endswith(".csv.gz")]
     print(f"  Found {len(tweet_files)} tweet files")
 
     # Check each tweet file for corresponding sentiment file
@@ -81,18 +178,36 @@ for year in range(2010, 2025):
     year_existing = 0
 
     for tweet_file in tweet_files:
-        expected_sentiment_file = f"bert_sentiment_{tweet_file}"
+        expected_sentiment_file = sentiment_file_name(tweet_file)
         sentiment_file_path = os.path.join(sentiment_path_year, expected_sentiment_file)
         tweet_file_path = os.path.join(tweets_path_year, tweet_file)
 
-        if os.path.exists(sentiment_file_path):
+        # Recomputed sentiment may have been written as parquet instead of gzip TSV;
+        # the lookup is a set membership test against the listing, not a stat per file
+        found_path = find_sentiment_file(sentiment_path_year, tweet_file, names=sentiment_listing)
+        found_size = sentiment_listing[os.path.basename(found_path)][0] if found_path else None
+
+        if found_path and found_size > 0:
+            sentiment_file_path = found_path
             year_existing += 1
             existing_files.append({
                 'year': year,
                 'tweet_file': tweet_file,
-                'sentiment_file': expected_sentiment_file,
+                'sentiment_file': os.path.basename(found_path),
                 'tweet_file_path': tweet_file_path,
-                'sentiment_file_path': sentiment_file_path
+                'sentiment_file_path': sentiment_file_path,
+                'sentiment_file_size': found_size
+            })
+        elif found_path:
+            # A zero-byte sentiment file cannot be merged, so treat it as missing
+            year_missing += 1
+            missing_files.append({
+                'year': year,
+                'tweet_file': tweet_file,
+                'tweet_file_path': tweet_file_path,
+                'expected_sentiment_file': os.path.basename(found_path),
+                'expected_sentiment_path': found_path,
+                'reason': 'sentiment_file_empty'
             })
         else:
             year_missing += 1
@@ -117,6 +232,11 @@ for year in range(2010, 2025):
         'coverage_percentage': (year_existing / len(tweet_files) * 100) if len(tweet_files) > 0 else 0
     })
 
+# Persist the directory inventory for the next run
+save_inventory(inventory_path, inventory)
+print(f"\nDirectory inventory: {scan_stats['scanned']} scanned, {scan_stats['cached']} reused from cache")
+print(f"✓ Saved inventory cache to: {inventory_path}")
+
 # Convert to DataFrames
 missing_df = pd.DataFrame(missing_files)
 existing_df = pd.DataFrame(existing_files)
@@ -7,6 +7,9 @@ from the geotweet-sentiment-geography repository.
 
 Usage:
     python 0.1.6-recompute-missing-sentiment-direct.py --year 2020
+
+    # Convert the TSV output of the original script to typed parquet
+    python 0.1.6-recompute-missing-sentiment-direct.py --year 2020 --output_format parquet
 """
 
 import os
@@ -17,6 +20,9 @@ import shutil
 import subprocess
 from pathlib import Path
 
+from sentiment_io import (SENTIMENT_PREFIX, TWEET_SUFFIX, read_sentiment, write_sentiment,
+                          sentiment_file_name, tweet_file_name)
+
 def prepare_data_for_year(config, year, missing_df, args):
     """
     Prepare missing tweet files for a specific year for sentiment computation
@@ -125,6 +131,33 @@ def run_sentiment_analysis_direct(year_input_dir, year_output_dir, repo_path, ar
         return False
 
 
+def convert_output_to_parquet(year_output_dir):
+    """
+    Convert the gzip TSV files written by the original script to typed parquet
+
+    The original main_sentiment_imputer.py only writes TSV, so parquet output is
+    produced afterwards; each TSV is removed once its parquet copy is written.
+    """
+    tsv_files = [f for f in os.listdir(year_output_dir)
+                 if f.startswith(SENTIMENT_PREFIX) and f.endswith(TWEET_SUFFIX)]
+    print(f"\nConverting {len(tsv_files)} sentiment files to parquet...")
+
+    converted_count = 0
+    for file in tsv_files:
+        tsv_path = os.path.join(year_output_dir, file)
+        parquet_path = os.path.join(year_output_dir, sentiment_file_name(tweet_file_name(file), 'parquet'))
+        try:
+            write_sentiment(read_sentiment(tsv_path, columns=['message_id', 'score']),
+                            parquet_path + '.tmp', fmt='parquet')
+            os.replace(parquet_path + '.tmp', parquet_path)
+            os.remove(tsv_path)
+            converted_count += 1
+        except Exception as e:
+            print(f"  ✗ Error converting {file}: {e}")
+
+    print(f"✓ Converted {converted_count}/{len(tsv_files)} files")
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Recompute missing sentiment files (direct call version)')
@@ -136,6 +169,8 @@ if __name__ == '__main__':
                         help='Use symbolic links instead of copying files')
     parser.add_argument('--dry_run', action='store_true',
                         help='Show what would be done without actually processing')
+    parser.add_argument('--output_format', choices=['csv.gz', 'parquet'], default='csv.gz',
+                        help='Sentiment output format: gzip TSV (default) or typed parquet')
 
     args = parser.parse_args()
 
@@ -160,6 +195,7 @@ if __name__ == '__main__':
     print(f"Batch size: {args.batch_size}")
     print(f"Use symlinks: {args.use_symlink}")
     print(f"Dry run: {args.dry_run}")
+    print(f"Output format: {args.output_format}")
 
     # Read missing files
     missing_df = pd.read_csv(missing_files_path)
@@ -210,6 +246,8 @@ if __name__ == '__main__':
 
             if not success:
                 print(f"\n⚠️  Warning: Sentiment analysis failed for year {year}")
+            elif args.output_format == 'parquet':
+                convert_output_to_parquet(year_output_dir)
 
         except Exception as e:
             print(f"\n✗ Error processing year {year}: {e}")
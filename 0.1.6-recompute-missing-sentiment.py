@@ -8,6 +8,12 @@ sentiment analysis using the geotweet-sentiment-geography pipeline.
 Usage:
     python 0.1.6-recompute-missing-sentiment.py --year 2014 --batch_size 100
 
+    # Streaming mode: score each file in chunks and resume mid-file after preemption
+    python 0.1.6-recompute-missing-sentiment.py --year 2014 --streaming --chunk_size 250000
+
+    # Write typed parquet (int64 message_id, float32 score) instead of gzip TSV
+    python 0.1.6-recompute-missing-sentiment.py --year 2014 --output_format parquet
+
 Output:
     Sentiment scores saved to sentiment_computing_path organized by year
 """
@@ -17,9 +23,12 @@ import json
 import pandas as pd
 import argparse
 import shutil
+import copy
 from pathlib import Path
 import sys
 
+from sentiment_io import sentiment_file_name, find_sentiment_file, write_sentiment, concat_sentiment_parts
+
 # Add the geotweet-sentiment-geography repo to path
 sys.path.insert(0, '/n/home11/xiaokangfu/xiaokang/geotweet-sentiment-geography/src')
 
@@ -96,6 +105,108 @@ def prepare_data_for_year(config, year, missing_df, args):
     return year_input_dir, year_output_dir
 
 
+def _write_checkpoint(checkpoint_path, state):
+    """Atomically replace the checkpoint file so a kill never leaves it half-written"""
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def stream_sentiment_file(file, year_input_dir, output_file, sentiment_args, chunk_size):
+    """
+    Score a tweet file chunk by chunk with bounded memory, checkpointing after each chunk
+
+    Each chunk is read from the source .csv.gz, scored, and written as its own gzip
+    part under <output_dir>/.streaming/<file>/. A checkpoint records how many chunks
+    are done, so a killed job resumes at the next chunk instead of from zero. Once all
+    chunks are scored the parts are concatenated (gzip members or parquet row groups,
+    no re-parsing) into the final bert_sentiment_ file and the work directory is removed.
+
+    Args:
+        file: Tweet file name inside year_input_dir
+        year_input_dir: Input directory with tweet files
+        output_file: Final sentiment file path (.csv.gz or .parquet); a resumed file keeps
+                     the format recorded in its checkpoint
+        sentiment_args: Args object for the imputer (models, batch size, ...)
+        chunk_size: Number of tweets read and scored per chunk
+
+    Returns:
+        Number of sentiment scores written
+    """
+    from utils.emb_sentiment_imputer import embedding_imputation
+
+    part_ext = '.parquet' if output_file.endswith('.parquet') else '.csv.gz'
+
+    # Hidden directory so 0.1.8 never picks up partial results as bert_sentiment_ files
+    work_dir = os.path.join(os.path.dirname(output_file), '.streaming', file)
+    os.makedirs(work_dir, exist_ok=True)
+    checkpoint_path = os.path.join(work_dir, 'checkpoint.json')
+
+    state = {'source': file, 'chunk_size': chunk_size, 'part_ext': part_ext, 'chunks_done': 0,
+             'rows_read': 0, 'rows_written': 0}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            state = json.load(f)
+        if state['chunk_size'] != chunk_size:
+            print(f"  ⚠️  Checkpoint was written with chunk_size={state['chunk_size']}, using it to resume")
+        # Checkpoints from before part_ext was recorded only ever hold parts of one format
+        if 'part_ext' not in state:
+            state['part_ext'] = '.parquet' if os.path.exists(
+                os.path.join(work_dir, 'part-00000.parquet')) else '.csv.gz'
+        # The parts already written fix the format; finish in it rather than mixing formats
+        if state['part_ext'] != part_ext:
+            print(f"  ⚠️  Checkpoint was written with {state['part_ext']} parts, resuming in that format")
+            part_ext = state['part_ext']
+            output_file = os.path.join(os.path.dirname(output_file),
+                                       sentiment_file_name(file, part_ext.lstrip('.')))
+        print(f"  ↻ Resuming after chunk {state['chunks_done']} ({state['rows_read']:,} tweets already scored)")
+
+    # The imputer reads from data_path, so point it at the per-file work directory
+    chunk_args = copy.copy(sentiment_args)
+    chunk_args.data_path = work_dir
+    chunk_args.output_path = work_dir
+    chunk_args.max_rows = state['chunk_size']
+
+    reader = pd.read_csv(os.path.join(year_input_dir, file), sep='\t', lineterminator='\n',
+                         dtype=str, compression='gzip', chunksize=state['chunk_size'])
+
+    for chunk_idx, chunk in enumerate(reader):
+        if chunk_idx < state['chunks_done']:
+            continue
+
+        chunk_file = f'chunk-{chunk_idx:05d}.csv.gz'
+        chunk_path = os.path.join(work_dir, chunk_file)
+        chunk.to_csv(chunk_path, sep='\t', index=False, compression='gzip')
+
+        scored = embedding_imputation(chunk_file, chunk_args)
+
+        # Only the first TSV part carries the header, so parts concatenate into one valid file
+        part_path = os.path.join(work_dir, f'part-{chunk_idx:05d}{part_ext}')
+        write_sentiment(scored, part_path + '.tmp', fmt=part_ext.lstrip('.'),
+                        header=(chunk_idx == 0))
+        os.replace(part_path + '.tmp', part_path)
+        os.remove(chunk_path)
+
+        state['chunks_done'] = chunk_idx + 1
+        state['rows_read'] += len(chunk)
+        state['rows_written'] += len(scored)
+        _write_checkpoint(checkpoint_path, state)
+        print(f"    chunk {chunk_idx + 1}: {state['rows_read']:,} tweets scored")
+
+        del chunk, scored
+
+    # Concatenate the parts in order; a multi-member gzip is read as one stream
+    tmp_output = os.path.join(work_dir, f'output{part_ext}.tmp')
+    part_paths = [os.path.join(work_dir, f'part-{chunk_idx:05d}{part_ext}')
+                  for chunk_idx in range(state['chunks_done'])]
+    concat_sentiment_parts(part_paths, tmp_output, fmt=part_ext.lstrip('.'))
+    os.replace(tmp_output, output_file)
+    shutil.rmtree(work_dir)
+
+    return state['rows_written']
+
+
 def run_sentiment_analysis(year_input_dir, year_output_dir, args):
     """
     Run sentiment analysis using the geotweet-sentiment-geography pipeline
@@ -157,8 +268,10 @@ def run_sentiment_analysis(year_input_dir, year_output_dir, args):
         for i, file in enumerate(files, 1):
             try:
                 # Check if output file already exists
-                output_file = os.path.join(year_output_dir, f'bert_sentiment_{file}')
-                if os.path.exists(output_file):
+                output_file = os.path.join(year_output_dir, sentiment_file_name(file, args.output_format))
+                # A file finished in the other format is done as well; an empty one is not
+                found_file = find_sentiment_file(year_output_dir, file)
+                if found_file is not None and os.path.getsize(found_file) > 0:
                     print(f"\n[{i}/{len(files)}] Skipping (already exists): {file}")
                     skipped_count += 1
                     success_count += 1  # Count as success
@@ -166,11 +279,18 @@ def run_sentiment_analysis(year_input_dir, year_output_dir, args):
 
                 print(f"\n[{i}/{len(files)}] Processing: {file}")
 
+                if args.streaming:
+                    n_scores = stream_sentiment_file(file, year_input_dir, output_file,
+                                                     sentiment_args, args.chunk_size)
+                    print(f"  ✓ Saved {n_scores} sentiment scores")
+                    success_count += 1
+                    continue
+
                 # Run sentiment imputation
                 df = embedding_imputation(file, sentiment_args)
 
                 # Save output with 'bert_sentiment_' prefix
-                df.to_csv(output_file, sep='\t', index=False, compression='gzip')
+                write_sentiment(df, output_file)
 
                 print(f"  ✓ Saved {len(df)} sentiment scores")
                 success_count += 1
@@ -210,6 +330,12 @@ if __name__ == '__main__':
                         help='Use symbolic links instead of copying files (saves disk space)')
     parser.add_argument('--dry_run', action='store_true',
                         help='Show what would be done without actually processing')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Score files in chunks with checkpointing (bounded memory, resumable)')
+    parser.add_argument('--chunk_size', type=int, default=250000,
+                        help='Tweets per chunk in streaming mode (default: 250000)')
+    parser.add_argument('--output_format', choices=['csv.gz', 'parquet'], default='csv.gz',
+                        help='Sentiment output format: gzip TSV (default) or typed parquet')
 
     args = parser.parse_args()
 
@@ -234,6 +360,8 @@ if __name__ == '__main__':
     print(f"Batch size: {args.batch_size}")
     print(f"Use symlinks: {args.use_symlink}")
     print(f"Dry run: {args.dry_run}")
+    print(f"Streaming: {args.streaming}" + (f" (chunk size {args.chunk_size:,})" if args.streaming else ""))
+    print(f"Output format: {args.output_format}")
 
     # Read missing files
     missing_df = pd.read_csv(missing_files_path)
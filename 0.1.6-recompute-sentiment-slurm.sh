@@ -37,6 +37,8 @@ echo ""
 
 # Get year to process from command line (optional)
 YEAR=${1:-""}  # If no argument, process all years
+[ $# -gt 0 ] && shift
+EXTRA_ARGS=("$@")  # Passed through to 0.1.6, e.g. --streaming --chunk_size 250000
 
 # Create output directory
 mkdir -p outputs/logs
@@ -50,13 +52,15 @@ if [ -z "$YEAR" ]; then
     echo "Processing all missing years..."
     python 0.1.6-recompute-missing-sentiment.py \
         --batch_size 100 \
-        --use_symlink
+        --use_symlink \
+        "${EXTRA_ARGS[@]}"
 else
     echo "Processing year: $YEAR"
     python 0.1.6-recompute-missing-sentiment.py \
         --year $YEAR \
         --batch_size 100 \
-        --use_symlink
+        --use_symlink \
+        "${EXTRA_ARGS[@]}"
 fi
 
 EXIT_CODE=$?
@@ -5,7 +5,8 @@ Script to verify recomputed sentiment files and copy them to the main sentiment
 This script:
 1. Verifies that recomputed sentiment files are valid
 2. Compares file counts and basic statistics
-3. Optionally copies verified files to the main sentiment directory
+3. Optionally checks that every message_id in the source tweet file got a score
+4. Optionally copies verified files to the main sentiment directory
 
 Usage:
     # Dry run (check without copying)
@@ -16,54 +17,159 @@ Usage:
 
     # Verify specific year
     python 0.1.8-verify-and-copy-sentiment.py --year 2014 --dry_run
+
+    # Also cross-check message_id coverage against the source tweet files
+    python 0.1.8-verify-and-copy-sentiment.py --year 2014 --check_coverage --dry_run
 """
 
 import os
 import json
+import gzip
+import zlib
+import numpy as np
 import pandas as pd
 import argparse
 from pathlib import Path
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-def verify_sentiment_file(file_path):
+from sentiment_io import is_sentiment_file, iter_sentiment_chunks, sentiment_columns, tweet_file_name
+
+def read_source_message_ids(tweet_path, chunksize=1_000_000):
+    """
+    Stream the message_id column of a source tweet file
+
+    Returns:
+        (sorted unique int64 ids, number of ids that could not be parsed as integers)
+    """
+    ids = []
+    unparsed = 0
+    reader = pd.read_csv(tweet_path, sep='\t', lineterminator='\n', compression='gzip',
+                         usecols=['message_id'], dtype=str, chunksize=chunksize)
+    for chunk in reader:
+        parsed = pd.to_numeric(chunk['message_id'], errors='coerce')
+        unparsed += int(parsed.isna().sum())
+        ids.append(parsed.dropna().to_numpy(dtype='int64'))
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype='int64')
+    return np.unique(ids), unparsed
+
+
+def check_coverage(sentiment_ids, tweet_path, chunksize=1_000_000):
+    """
+    Compare the message_ids scored in a sentiment file with its source tweet file
+
+    Both id sets are sorted and de-duplicated once, then differenced with a sorted
+    merge (np.setdiff1d on unique arrays).
+
+    Args:
+        sentiment_ids: int64 array of message_ids read from the sentiment file
+        tweet_path: Path to the source tweet .csv.gz
+
+    Returns:
+        dict with source row count, missing/extra/duplicate id counts and a few samples
+    """
+    if not os.path.exists(tweet_path):
+        return {'coverage_error': f'Source tweet file not found: {tweet_path}'}
+
+    source_ids, unparsed = read_source_message_ids(tweet_path, chunksize)
+    scored_ids = np.unique(sentiment_ids)
+
+    missing = np.setdiff1d(source_ids, scored_ids, assume_unique=True)
+    extra = np.setdiff1d(scored_ids, source_ids, assume_unique=True)
+
+    return {
+        'coverage_error': None,
+        'source_ids': len(source_ids),
+        'source_unparsed_ids': unparsed,
+        'missing_ids': len(missing),
+        'extra_ids': len(extra),
+        'duplicate_ids': len(sentiment_ids) - len(scored_ids),
+        'missing_sample': ' '.join(str(i) for i in missing[:5]),
+        'extra_sample': ' '.join(str(i) for i in extra[:5]),
+    }
+
+
+def verify_sentiment_file(file_path, source_path=None, chunksize=1_000_000):
     """
-    Verify that a sentiment file is valid
+    Verify that a sentiment file is valid in a single streaming pass
+
+    Only message_id and score are read, chunk by chunk, while row count, null scores
+    and running mean/variance are accumulated, so each file is decompressed once and
+    memory is bounded by the chunk size. A gzip stream that ends early (e.g. a job
+    killed mid-write) is reported as truncated.
 
     Args:
-        file_path: Path to sentiment file
+        file_path: Path to sentiment file (.csv.gz or .parquet)
+        source_path: Optional source tweet file; when given, the message_ids seen in
+                     the same pass are checked for coverage against it
+        chunksize: Rows read per chunk
 
     Returns:
         dict with verification results
     """
     try:
-        # Try to read the file
-        df = pd.read_csv(file_path, sep='\t', compression='gzip', nrows=10)
-
-        # Check for required columns
-        if 'message_id' not in df.columns or 'score' not in df.columns:
+        # Check for required columns (header line / parquet schema only)
+        columns = sentiment_columns(file_path)
+        if 'message_id' not in columns or 'score' not in columns:
             return {
                 'valid': False,
                 'error': 'Missing required columns (message_id, score)',
                 'row_count': 0
             }
 
-        # Read full file to get row count
-        df_full = pd.read_csv(file_path, sep='\t', compression='gzip')
-        row_count = len(df_full)
-
-        # Check for null scores
-        null_scores = df_full['score'].isna().sum()
-
-        return {
+        row_count = 0
+        null_scores = 0
+        # Running statistics over non-null scores (Chan et al. pairwise update)
+        n_scores = 0
+        mean = 0.0
+        m2 = 0.0
+        message_ids = []
+
+        for chunk in iter_sentiment_chunks(file_path, chunksize=chunksize):
+            if source_path is not None:
+                message_ids.append(chunk['message_id'].to_numpy(dtype='int64'))
+            scores = chunk['score'].to_numpy(dtype='float64')
+            scores = scores[~np.isnan(scores)]
+            row_count += len(chunk)
+            null_scores += len(chunk) - len(scores)
+
+            if len(scores) > 0:
+                chunk_mean = scores.mean()
+                chunk_m2 = ((scores - chunk_mean) ** 2).sum()
+                delta = chunk_mean - mean
+                total = n_scores + len(scores)
+                mean += delta * len(scores) / total
+                m2 += chunk_m2 + delta ** 2 * n_scores * len(scores) / total
+                n_scores = total
+
+        result = {
             'valid': True,
             'row_count': row_count,
             'null_scores': null_scores,
-            'score_mean': df_full['score'].mean(),
-            'score_std': df_full['score'].std(),
+            'score_mean': mean if n_scores > 0 else np.nan,
+            'score_std': np.sqrt(m2 / (n_scores - 1)) if n_scores > 1 else np.nan,
             'error': None
         }
 
+        if source_path is not None:
+            message_ids = np.concatenate(message_ids) if message_ids else np.empty(0, dtype='int64')
+            # An unreadable source file leaves coverage unknown; the sentiment file itself
+            # verified fine, so only --strict_coverage turns this into a failure
+            try:
+                result.update(check_coverage(message_ids, source_path, chunksize))
+            except Exception as e:
+                result['coverage_error'] = f'Coverage unknown, could not read {source_path}: {e}'
+
+        return result
+
+    except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+        return {
+            'valid': False,
+            'truncated': True,
+            'error': f'Truncated or corrupt gzip stream: {e}',
+            'row_count': 0
+        }
     except Exception as e:
         return {
             'valid': False,
@@ -96,7 +202,7 @@ def verify_year(config, year, args):
         return None
 
     # Get all sentiment files
-    sentiment_files = [f for f in os.listdir(year_output_dir) if f.startswith('bert_sentiment_')]
+    sentiment_files = [f for f in os.listdir(year_output_dir) if is_sentiment_file(f)]
 
     if len(sentiment_files) == 0:
         print(f"⚠️  No sentiment files found in {year_output_dir}")
@@ -104,30 +210,65 @@ def verify_year(config, year, args):
 
     print(f"Found {len(sentiment_files)} sentiment files")
 
-    # Verify each file
+    # Verify each file (one streaming pass per file, files spread over a process pool)
     valid_files = []
     invalid_files = []
     verification_results = []
 
-    for i, file in enumerate(sentiment_files, 1):
-        file_path = os.path.join(year_output_dir, file)
-
-        if i % 100 == 0:
-            print(f"  Verifying file {i}/{len(sentiment_files)}...")
-
-        result = verify_sentiment_file(file_path)
-        result['filename'] = file
-        result['year'] = year
-        verification_results.append(result)
-
-        if result['valid']:
-            valid_files.append(file)
-        else:
-            invalid_files.append(file)
-            print(f"  ✗ Invalid file: {file} - {result['error']}")
+    file_paths = [os.path.join(year_output_dir, file) for file in sentiment_files]
+    if args.check_coverage:
+        tweets_dir = os.path.join(config['geo_tweets_archive_base_path'], str(year))
+        source_paths = [os.path.join(tweets_dir, tweet_file_name(file)) for file in sentiment_files]
+    else:
+        source_paths = [None] * len(sentiment_files)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = executor.map(verify_sentiment_file, file_paths, source_paths, chunksize=4)
+
+        for i, (file, result) in enumerate(zip(sentiment_files, results), 1):
+            if i % 100 == 0:
+                print(f"  Verifying file {i}/{len(sentiment_files)}...")
+
+            result['filename'] = file
+            result['year'] = year
+            verification_results.append(result)
+
+            # With --strict_coverage a file that leaves source tweets unscored is not copied
+            if args.strict_coverage and result['valid']:
+                if result.get('coverage_error'):
+                    result['valid'] = False
+                    result['error'] = result['coverage_error']
+                elif result.get('missing_ids', 0) > 0:
+                    result['valid'] = False
+                    result['error'] = f"{result['missing_ids']:,} source message_ids have no score"
+
+            if result['valid']:
+                valid_files.append(file)
+            else:
+                invalid_files.append(file)
+                print(f"  ✗ Invalid file: {file} - {result['error']}")
 
     print(f"\n✓ Valid files: {len(valid_files)}")
     print(f"✗ Invalid files: {len(invalid_files)}")
+    truncated_count = sum(1 for r in verification_results if r.get('truncated'))
+    if truncated_count > 0:
+        print(f"  of which truncated gzip streams: {truncated_count}")
+
+    if args.check_coverage:
+        checked = [r for r in verification_results if 'coverage_error' in r]
+        gaps = [r for r in checked if r.get('missing_ids', 0) > 0]
+        extras = [r for r in checked if r.get('extra_ids', 0) > 0]
+        no_source = [r for r in checked if r['coverage_error']]
+        print(f"\nCoverage (vs source tweet files):")
+        print(f"  Files checked: {len(checked)}")
+        print(f"  Files with unscored tweets: {len(gaps)} "
+              f"({sum(r['missing_ids'] for r in gaps):,} message_ids)")
+        print(f"  Files with ids not in source: {len(extras)} "
+              f"({sum(r['extra_ids'] for r in extras):,} message_ids)")
+        if no_source:
+            print(f"  Files with unknown coverage (source tweet file missing or unreadable): {len(no_source)}")
+        for r in gaps[:10]:
+            print(f"  ⚠️  {r['filename']}: {r['missing_ids']:,} missing (e.g. {r['missing_sample']})")
 
     if len(valid_files) > 0:
         # Show statistics
@@ -240,8 +381,16 @@ if __name__ == '__main__':
                         help='Show what would be done without actually copying')
     parser.add_argument('--overwrite', action='store_true',
                         help='Overwrite existing files in destination')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of processes verifying files in parallel (default: all cores)')
+    parser.add_argument('--check_coverage', action='store_true',
+                        help='Check every source tweet message_id has a score (reports missing/extra ids)')
+    parser.add_argument('--strict_coverage', action='store_true',
+                        help='Treat files with unscored source tweets as invalid (implies --check_coverage)')
 
     args = parser.parse_args()
+    if args.strict_coverage:
+        args.check_coverage = True
 
     # Load configuration
     with open('setting.json') as f:
@@ -256,6 +405,8 @@ if __name__ == '__main__':
     print(f"Copy mode: {args.copy}")
     print(f"Dry run: {args.dry_run}")
     print(f"Overwrite: {args.overwrite}")
+    print(f"Workers: {args.workers}")
+    print(f"Check coverage: {args.check_coverage}" + (" (strict)" if args.strict_coverage else ""))
 
     # Get years to process
     output_base = os.path.join(config['sentiment_computing_path'], 'output')
@@ -326,6 +477,18 @@ if __name__ == '__main__':
 
         print(f"\n✓ Verification report saved to: {report_path}")
 
+        # Per-file coverage against the source tweet files
+        if args.check_coverage:
+            coverage_columns = ['year', 'filename', 'source_ids', 'source_unparsed_ids', 'missing_ids',
+                                'extra_ids', 'duplicate_ids', 'missing_sample', 'extra_sample', 'coverage_error']
+            coverage_df = pd.DataFrame([
+                {c: r.get(c) for c in coverage_columns}
+                for result in all_results for r in result['verification_results'] if 'coverage_error' in r
+            ], columns=coverage_columns)
+            coverage_path = os.path.join(config['outputs_dir'], 'recomputed_sentiment_coverage.csv')
+            coverage_df.to_csv(coverage_path, index=False)
+            print(f"✓ Coverage report saved to: {coverage_path}")
+
     print("\n" + "=" * 80)
     print("Verification Complete")
     print("=" * 80)
@@ -3,6 +3,7 @@ import json
 import pandas as pd
 from tqdm import tqdm
 from pandarallel import pandarallel
+from sentiment_io import find_sentiment_file, read_sentiment
 pandarallel.initialize()
 tqdm.pandas()
 
@@ -47,7 +48,8 @@ def merge_tweets_and_sentiment(row):
     try:
         tweets = pd.read_csv(row["tweets_path"], sep = "\t", lineterminator="\n", dtype="unicode", index_col=None,  compression = "gzip")
         # print(tweets.dtypes)
-        sentiment = pd.read_csv(row["sentiment_file_path"], compression='gzip', sep = "\t", dtype={'message_id': str, 'score': float})
+        sentiment_path = find_sentiment_file(os.path.dirname(row["sentiment_file_path"]), row["file_name"]) or row["sentiment_file_path"]
+        sentiment = read_sentiment(sentiment_path)
         # print(sentiment.dtypes)
         merged_df = pd.merge(tweets, sentiment, on=['message_id'])
         merged_df.to_parquet(row["output_file"], index=False)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Run every spatial join engine on the same points and blocks, time them and check
+that they agree.
+
+The engines (spatial_join_engines.py: geopandas, duckdb, grid) all return
+point_index -> block_id + confidence; the first engine that can run is the
+reference, and every other engine must produce exactly the same (point, block)
+pairs and confidence scores. Engines that cannot run here (e.g. DuckDB without the
+spatial extension, which needs network access to install) are reported and skipped.
+
+Data:
+  - synthetic (default): census-like blocks and tweets from synthetic_data.py, with
+    GPS / spatialerror drawn so every confidence level occurs
+  - real: --census_file (national geoparquet of 0.3.8) and --tweets (parquet files of
+    geotweets_with_sentiment), optionally restricted to --bbox
+
+Outputs:
+  - prints seconds, points/s, matched pairs and disagreements per engine
+  - --output CSV (appended, one row per engine and run)
+  - exit status 1 if an engine disagrees with the reference
+
+Usage:
+    python 0.3.10-compare-spatial-join-engines.py
+    python 0.3.10-compare-spatial-join-engines.py --n_blocks 200000 --n_tweets 2000000 --repeat 3
+    python 0.3.10-compare-spatial-join-engines.py --engines geopandas grid --grid_cell_size 0.01
+    python 0.3.10-compare-spatial-join-engines.py --census_file .../us_census_blocks_2020.geoparquet \\
+        --tweets '.../geotweets_with_sentiment/2020/2020_03_0*.parquet' --bbox -74.3 40.5 -73.7 40.9
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from spatial_join_engines import (ENGINE_NAMES, block_store, load_block_store, engine_unavailable, timed_join,
+                                  compare_joins, GRID_MAX_CELLS_PER_BLOCK)
+
+
+def synthetic_points(n_blocks, n_tweets, seed):
+    """Synthetic block store and tweet points with GPS / spatialerror"""
+    from synthetic_data import synthetic_blocks, synthetic_tweets
+
+    blocks = synthetic_blocks(n_blocks, seed=seed)
+    tweets, _ = synthetic_tweets(blocks, n_tweets, years=(2020,), n_days=1, seed=seed)
+    rng = np.random.default_rng(seed + 2)
+    # Raw tweets store GPS as strings and often lack spatialerror (0.3.9 defaults it)
+    gps = np.where(rng.random(n_tweets) < 0.2, 'True', 'False').astype(object)
+    spatialerror = rng.lognormal(np.log(300.0), 1.5, n_tweets)
+    spatialerror[rng.random(n_tweets) < 0.05] = np.nan
+    points = pa.table({'longitude': tweets['longitude'].to_numpy(), 'latitude': tweets['latitude'].to_numpy(),
+                       'GPS': gps, 'spatialerror': spatialerror})
+    return points, block_store(blocks)
+
+
+def read_points(pattern):
+    """Coordinate, GPS and spatialerror columns of the tweet parquet files matching pattern"""
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        sys.exit(f"No tweet files match {pattern}")
+    tables = []
+    for path in paths:
+        names = pq.read_schema(path).names
+        table = pq.read_table(path, columns=[c for c in ['longitude', 'latitude', 'GPS', 'spatialerror']
+                                             if c in names])
+        # The same column can be a string in one file and numeric in another
+        tables.append(table.cast(pa.schema([pa.field(name, pa.string()) for name in table.column_names])))
+    return pa.concat_tables(tables, promote_options='default')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the spatial join engines on the same data")
+    parser.add_argument("--engines", nargs="+", choices=ENGINE_NAMES, default=ENGINE_NAMES,
+                        help="Engines to run; the first one that runs is the reference (default: all)")
+    parser.add_argument("--n_blocks", type=int, default=20000, help="Synthetic blocks (default: 20000)")
+    parser.add_argument("--n_tweets", type=int, default=200000, help="Synthetic tweets (default: 200000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument("--census_file", type=str, help="Real block geoparquet (0.3.8) instead of synthetic data")
+    parser.add_argument("--tweets", type=str, help="Glob of real tweet parquet files (with --census_file)")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=('MINX', 'MINY', 'MAXX', 'MAXY'),
+                        help="Only load blocks intersecting this lon/lat window (real data)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per engine; the median time is reported")
+    parser.add_argument("--grid_cell_size", type=float, default=None,
+                        help="Grid engine cell size in degrees (default: median block bbox side)")
+    parser.add_argument("--grid_max_cells", type=int, default=GRID_MAX_CELLS_PER_BLOCK,
+                        help="Grid cells a block may cover before it is kept out of the grid "
+                             f"(default: {GRID_MAX_CELLS_PER_BLOCK})")
+    parser.add_argument("--duckdb_threads", type=int, default=None, help="DuckDB threads (default: all)")
+    parser.add_argument("--output", type=str, default=None, help="CSV to append the results to")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.census_file:
+        if not args.tweets:
+            parser.error("--census_file needs --tweets")
+        blocks = load_block_store(args.census_file, bbox=tuple(args.bbox) if args.bbox else None)
+        points = read_points(args.tweets)
+        source = f"{args.census_file} / {args.tweets}"
+    else:
+        points, blocks = synthetic_points(args.n_blocks, args.n_tweets, args.seed)
+        source = f"synthetic (seed {args.seed})"
+    print(f"Loaded {len(blocks):,} blocks and {points.num_rows:,} points in {time.time() - start:.1f}s")
+
+    options = {'grid': {'cell_size': args.grid_cell_size, 'max_cells_per_block': args.grid_max_cells}, 'duckdb': {'threads': args.duckdb_threads}}
+    run_at = datetime.now().isoformat(timespec='seconds')
+    records, reference = [], None
+    for engine in args.engines:
+        record = {'run_at': run_at, 'source': source, 'n_blocks': len(blocks), 'n_points': points.num_rows,
+                  'engine': engine, 'seconds': np.nan, 'points_per_s': np.nan, 'pairs': np.nan,
+                  'missing': np.nan, 'extra': np.nan, 'confidence_mismatch': np.nan}
+        reason = engine_unavailable(engine)
+        if reason:
+            print(f"  {engine:<10} unavailable ({reason})")
+            records.append({**record, 'status': 'unavailable'})
+            continue
+
+        seconds = []
+        for _ in range(args.repeat):
+            result, s = timed_join(points, blocks, engine, **options.get(engine, {}))
+            seconds.append(s)
+        record['seconds'] = float(np.median(seconds))
+        record['points_per_s'] = points.num_rows / record['seconds'] if record['seconds'] > 0 else np.nan
+        if reference is None:
+            reference, reference_engine = result, engine
+            record.update(pairs=result.num_rows, missing=0, extra=0, confidence_mismatch=0, status='reference')
+        else:
+            diff = compare_joins(reference, result)
+            record.update(diff, status='ok' if not (diff['missing'] or diff['extra'] or diff['confidence_mismatch'])
+                          else 'DISAGREES')
+        print(f"  {engine:<10} {record['seconds']:8.2f}s  {record['points_per_s']:>12,.0f} points/s  "
+              f"{record['pairs']:>10,} pairs  {record['status']}")
+        records.append(record)
+
+    results = pd.DataFrame(records)
+    counts = ['pairs', 'missing', 'extra', 'confidence_mismatch']
+    results[counts] = results[counts].astype('Int64')
+    print(f"\n{'='*60}")
+    print(f"Spatial join engines: {len(blocks):,} blocks, {points.num_rows:,} points ({args.repeat} run(s))")
+    if reference is not None:
+        print(f"Reference: {reference_engine}")
+    print(f"{'='*60}")
+    print(results[['engine', 'seconds', 'points_per_s', 'pairs', 'missing', 'extra', 'confidence_mismatch',
+                   'status']].to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        results.to_csv(args.output, mode='a', header=not os.path.exists(args.output), index=False)
+        print(f"\n✓ Results appended to {args.output}")
+
+    if reference is None:
+        sys.exit("No engine could run")
+    if (results['status'] == 'DISAGREES').any():
+        print("\n✗ Engines disagree")
+        sys.exit(1)
+    print("\n✓ All engines that ran agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+End-to-end check of the key-only join path: 0.3.9 --block_key_only -> 0.3.3.
+
+On a synthetic workspace (synthetic_data.py) this runs the real pipeline steps:
+
+  1. 0.3.8 builds the national block files, the block attribute arrays and the build id
+  2. 0.2.1 merges tweets and sentiment
+  3. 0.3.2 joins the merged tweets per state (the reference, GEOID20 in every row)
+  4. 0.3.9 --block_key_only joins the same tweets, emitting block_id only
+  5. 0.3.3 aggregates both join outputs, attaching GEOID20 to the key-only one from the
+     block attribute arrays
+
+and checks that the day / month / year statistics agree (tweet counts exactly, score
+statistics to 1e-9). 0.3.9 needs the duckdb command line tool with the spatial
+extension; without it the check reports that it could not run and exits 2.
+
+Outputs:
+  - prints the rows compared and mismatches per grouping level
+  - exit status 1 if the statistics differ, 2 if a step could not run
+
+Usage:
+    python 0.3.11-check-block-key-only-join.py
+    python 0.3.11-check-block-key-only-join.py --n_blocks 20000 --n_tweets 200000 --root /tmp/key_only_check
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import importlib.util
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+from synthetic_data import write_synthetic_workspace  # noqa: E402
+from census_io import block_attributes_dir  # noqa: E402
+
+YEAR = 2020
+GROUPINGS = ['day_GEOID20', 'year_month_GEOID20', 'year_GEOID20']
+STAT_COLUMNS = ['avg_score', 'max_score', 'min_score', 'score_50q']
+
+
+def load_script(file_name):
+    """Import a numbered script (hyphenated name) as a module; its __main__ block does not run"""
+    spec = importlib.util.spec_from_file_location(file_name.replace('-', '_').replace('.', '_')[:-3],
+                                                  os.path.join(REPO_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(cmd, root):
+    """Run a repository script with cwd = root (it reads the synthetic setting.json)"""
+    print(f"$ {' '.join(cmd)}")
+    return subprocess.run([sys.executable] + cmd, cwd=root).returncode
+
+
+def compare_statistics(reference_dir, key_only_dir):
+    """
+    Compare the 0.3.3 statistics files of the reference and key-only runs
+
+    Returns:
+        Number of mismatching rows over all grouping levels
+    """
+    mismatches = 0
+    for grouping in GROUPINGS:
+        name = f"statistics-{YEAR}_{grouping}__no_topic.parquet"
+        keys = grouping.replace('year_month', 'year|month').replace('_GEOID20', '|GEOID20').split('|')
+        reference = pd.read_parquet(os.path.join(reference_dir, name))
+        key_only = pd.read_parquet(os.path.join(key_only_dir, name))
+        merged = reference.merge(key_only, on=keys, how='outer', suffixes=('_ref', '_key'), indicator=True)
+        unmatched = merged['_merge'] != 'both'
+        both = merged[~unmatched]
+        differ = both['tweet_count_ref'] != both['tweet_count_key']
+        for column in STAT_COLUMNS:
+            differ |= ~np.isclose(both[f'{column}_ref'], both[f'{column}_key'], rtol=0, atol=1e-9, equal_nan=True)
+        bad = int(unmatched.sum() + differ.sum())
+        mismatches += bad
+        print(f"  {grouping:<20} {len(merged):>8,} rows  {bad:>6,} mismatches")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check 0.3.9 --block_key_only -> 0.3.3 against the 0.3.2 join")
+    parser.add_argument("--n_blocks", type=int, default=2000, help="Synthetic blocks (default: 2000)")
+    parser.add_argument("--n_tweets", type=int, default=20000, help="Synthetic tweets (default: 20000)")
+    parser.add_argument("--n_days", type=int, default=3, help="Day files (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument("--root", type=str, default="key_only_check_workspace",
+                        help="Directory for synthetic inputs and outputs")
+    args = parser.parse_args()
+
+    if shutil.which('duckdb') is None:
+        print("✗ Cannot run: the duckdb command line tool (used by 0.3.9) is not on PATH")
+        sys.exit(2)
+
+    root = os.path.abspath(args.root)
+    config, _ = write_synthetic_workspace(root, n_blocks=args.n_blocks, n_tweets=args.n_tweets, years=(YEAR,),
+                                          n_days=args.n_days, seed=args.seed)
+    shutil.rmtree(config['workspace'], ignore_errors=True)
+    check_dir = os.path.join(config['workspace'], 'key_only_check')
+    census_file = os.path.join(config['census_data_2020'], 'us_census_blocks_2020.geoparquet')
+
+    # 1) National blocks, attribute arrays and build id
+    if run([os.path.join(REPO_DIR, '0.3.8-merge-census-to-parquet.py'), '--rebuild_parts', '--workers', '1'],
+           root) != 0:
+        sys.exit(2)
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        # 2) Tweets + sentiment
+        merge = load_script('0.2.1-combine-geo-tweets-archive-and-sentiment.py')
+        files_df = merge.list_tweet_files(config['geo_tweets_archive_base_path'], config['sentiment_file_base_path'],
+                                          config['geotweets_with_sentiment'], years=[YEAR])
+        status = [merge.merge_tweets_and_sentiment(row) for row in files_df.to_dict('records')]
+        if 'failed' in status:
+            sys.exit(2)
+
+        # 3) Reference join, one state at a time as in 0.3.2
+        import geopandas as gpd
+
+        join = load_script('0.3.2-xiaokang-sjoin-geopandas-us-census-script-version.py')
+        reference_join = os.path.join(check_dir, 'join_reference')
+        rows = join.list_input_files(config['geotweets_with_sentiment'], reference_join, [YEAR]).to_dict('records')
+        for census_file_name in sorted(f for f in os.listdir(config['census_data_2020'])
+                                       if f.endswith('_tabblock20.zip')):
+            block = gpd.read_file(os.path.join(config['census_data_2020'], census_file_name)).to_crs("EPSG:4326")
+            for row in rows:
+                join.spatial_join(row, block, census_file_name.split(".zip")[0])
+    finally:
+        os.chdir(cwd)
+
+    # 4) Key-only join of the months that have tweet files
+    key_only_join = os.path.join(check_dir, 'join_key_only')
+    months = sorted({int(name[5:7]) for name in os.listdir(os.path.join(config['geotweets_with_sentiment'], str(YEAR)))
+                     if name.endswith('.parquet')})
+    run([os.path.join(REPO_DIR, '0.3.9-run-2020-spatial-join.py'), '--year', str(YEAR),
+         '--months', *map(str, months), '--block_key_only', '--input_dir', config['geotweets_with_sentiment'],
+         '--output_dir', key_only_join, '--census_file', census_file], root)
+    missing = [m for m in months if not os.path.exists(os.path.join(key_only_join, str(YEAR), f"{YEAR}_{m:02d}.parquet"))]
+    if missing:
+        print(f"✗ Cannot run: 0.3.9 wrote no output for months {missing} (duckdb spatial extension missing?)")
+        sys.exit(2)
+
+    # 5) Aggregate both
+    aggregation = load_script('0.3.3-xiaokang-tweets_sentiment_score_aggregation_v2.py')
+    reference_stats = os.path.join(check_dir, 'statistics_reference') + os.sep
+    key_only_stats = os.path.join(check_dir, 'statistics_key_only') + os.sep
+    aggregation.main(reference_join, reference_stats, start_year=YEAR, end_year=YEAR)
+    aggregation.main(key_only_join, key_only_stats, start_year=YEAR, end_year=YEAR,
+                     block_attributes_path=block_attributes_dir(config))
+
+    print(f"\n{'='*60}")
+    print("0.3.3 statistics: 0.3.9 --block_key_only vs 0.3.2 reference")
+    print(f"{'='*60}")
+    mismatches = compare_statistics(reference_stats, key_only_stats)
+    if mismatches:
+        print(f"\n✗ {mismatches:,} rows differ")
+        sys.exit(1)
+    print("\n✓ Key-only join statistics match the reference")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,25 +5,10 @@ import argparse
 
 os.environ["USE_PYGEOS"] = "0"
 import geopandas as gpd
-from pandarallel import pandarallel
-
-pandarallel.initialize(progress_bar=False)
 import pandas as pd
 from tqdm import tqdm
 import datetime
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Spatial join between tweets and census blocks')
-parser.add_argument('--year', type=int, help='Process only specific year (e.g., 2010 for testing)')
-parser.add_argument('--start-year', type=int, default=2010, help='Start year (default: 2010)')
-parser.add_argument('--end-year', type=int, default=2023, help='End year (default: 2023)')
-parser.add_argument('--dry-run', action='store_true', help='Verify inputs without processing (safe for login node)')
-args = parser.parse_args()
-
-# Load configuration
-with open('setting.json') as f:
-    config = json.load(f)
-
 
 def spatial_join(row, blocks_gdf, block_suffix):
     # Read parquet file (sentiment tweets already merged)
@@ -47,132 +32,185 @@ def spatial_join(row, blocks_gdf, block_suffix):
     )
 
 
-input_path_base = config['geotweets_with_sentiment']
-output_path_base = config['tweets_with_census_blocks']
-census_data_path = config['census_data_2020']
+def list_input_files(input_path_base, output_path_base, years_to_process):
+    # read file paths
+    files_df = pd.DataFrame()
+    for year in years_to_process:
+        input_path = os.path.join(input_path_base, str(year))
+
+        # Check if directory exists
+        if not os.path.exists(input_path):
+            print(f"Warning: Directory {input_path} does not exist, skipping year {year}")
+            continue
+
+        output_path = os.path.join(output_path_base, str(year))
+        os.makedirs(output_path, exist_ok=True)
+
+        input_file_list = [
+            os.path.join(input_path, file)
+            for file in os.listdir(input_path)
+            if file.endswith(".parquet")
+        ]
+
+        if len(input_file_list) == 0:
+            print(f"Warning: No parquet files found in {input_path}")
+            continue
+
+        print(f"Found {len(input_file_list)} files for year {year}")
+
+        file_names = [file.split("/")[-1] for file in input_file_list]
+        output_file_names = [os.path.join(output_path, file) for file in file_names]
+        files_df = pd.concat(
+            [
+                files_df,
+                pd.DataFrame(
+                    {
+                        "input_file": input_file_list,
+                        "output_file": output_file_names,
+                        "file_name": file_names,
+                        "year": year,
+                    }
+                ),
+            ],
+            ignore_index=True
+        )
+    return files_df
+
+
+def main():
+    from pandarallel import pandarallel
+
+    pandarallel.initialize(progress_bar=False)
+
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Spatial join between tweets and census blocks')
+    parser.add_argument('--year', type=int, help='Process only specific year (e.g., 2010 for testing)')
+    parser.add_argument('--start-year', type=int, default=2010, help='Start year (default: 2010)')
+    parser.add_argument('--end-year', type=int, default=2023, help='End year (default: 2023)')
+    parser.add_argument('--dry-run', action='store_true', help='Verify inputs without processing (safe for login node)')
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('MINX', 'MINY', 'MAXX', 'MAXY'),
+                        help='Join only against blocks in this lon/lat window, read from the national '
+                             'geoparquet written by 0.3.8 (row groups outside the window are skipped); '
+                             'outputs go to <tweets_with_census_blocks>/bbox_<window>/<year>/')
+    args = parser.parse_args()
+
+    # Load configuration
+    with open('setting.json') as f:
+        config = json.load(f)
+
+    input_path_base = config['geotweets_with_sentiment']
+    output_path_base = config['tweets_with_census_blocks']
+    census_data_path = config['census_data_2020']
+    census_geoparquet = os.path.join(census_data_path, 'us_census_blocks_2020.geoparquet')
+
+    # Only the state block zips; the directory also holds 0.3.8 outputs and the download manifest
+    census_files = sorted(f for f in os.listdir(census_data_path) if f.endswith('_tabblock20.zip'))
+
+    # Determine which years to process
+    if args.year:
+        years_to_process = [args.year]
+        print(f"\n{'='*60}")
+        print(f"TEST MODE: Processing only year {args.year}")
+        print(f"{'='*60}\n")
+    else:
+        years_to_process = range(args.start_year, args.end_year + 1)
+        print(f"\n{'='*60}")
+        print(f"FULL MODE: Processing years {args.start_year} to {args.end_year}")
+        print(f"{'='*60}\n")
+
+    if args.bbox:
+        # Regional outputs get their own tree: 0.3.3 reads <tweets_with_census_blocks>/<year>/*.parquet
+        # and would otherwise count the window's tweets twice
+        output_path_base = os.path.join(output_path_base, "bbox_" + "_".join(f"{v:g}" for v in args.bbox))
+
+    t1 = datetime.datetime.now()
+    files_df = list_input_files(input_path_base, output_path_base, years_to_process)
+
+    # Check if we have any files to process
+    if len(files_df) == 0:
+        print("Error: No files to process!")
+        sys.exit(1)
 
-# Determine which years to process
-if args.year:
-    years_to_process = [args.year]
-    print(f"\n{'='*60}")
-    print(f"TEST MODE: Processing only year {args.year}")
-    print(f"{'='*60}\n")
-else:
-    years_to_process = range(args.start_year, args.end_year + 1)
     print(f"\n{'='*60}")
-    print(f"FULL MODE: Processing years {args.start_year} to {args.end_year}")
+    print(f"Total files to process: {len(files_df)}")
+    print(f"Years covered: {sorted(files_df['year'].unique())}")
+    print(f"Census states to load: {len(census_files)}")
     print(f"{'='*60}\n")
 
-t1 = datetime.datetime.now()
-# read file paths
-files_df = pd.DataFrame()
-for year in years_to_process:
-    input_path = os.path.join(input_path_base, str(year))
-
-    # Check if directory exists
-    if not os.path.exists(input_path):
-        print(f"Warning: Directory {input_path} does not exist, skipping year {year}")
-        continue
-
-    output_path = os.path.join(output_path_base, str(year))
-    os.makedirs(output_path, exist_ok=True)
-
-    input_file_list = [
-        os.path.join(input_path, file)
-        for file in os.listdir(input_path)
-        if file.endswith(".parquet")
-    ]
-
-    if len(input_file_list) == 0:
-        print(f"Warning: No parquet files found in {input_path}")
-        continue
-
-    print(f"Found {len(input_file_list)} files for year {year}")
-
-    file_names = [file.split("/")[-1] for file in input_file_list]
-    output_file_names = [os.path.join(output_path, file) for file in file_names]
-    files_df = pd.concat(
-        [
-            files_df,
-            pd.DataFrame(
-                {
-                    "input_file": input_file_list,
-                    "output_file": output_file_names,
-                    "file_name": file_names,
-                    "year": year,
-                }
+    # Dry-run mode: verify inputs only
+    if args.dry_run:
+        print("🔍 DRY-RUN MODE: Verifying inputs without processing")
+        print("=" * 60)
+
+        # Check a few sample input files
+        print("\n📁 Checking sample input files:")
+        for idx, row in files_df.head(3).iterrows():
+            exists = os.path.exists(row['input_file'])
+            size = os.path.getsize(row['input_file']) / 1024 / 1024 if exists else 0
+            status = "✓" if exists else "✗"
+            print(f"  {status} {row['file_name']}: {size:.2f} MB")
+
+        # Check census files
+        print(f"\n🗺️  Checking census files:")
+        for cf in census_files[:3]:
+            cf_path = os.path.join(census_data_path, cf)
+            size = os.path.getsize(cf_path) / 1024 / 1024
+            print(f"  ✓ {cf}: {size:.2f} MB")
+
+        # Check output directory
+        print(f"\n📤 Output directories:")
+        for year in files_df['year'].unique():
+            output_dir = os.path.join(output_path_base, str(year))
+            exists = os.path.exists(output_dir)
+            status = "✓ exists" if exists else "✗ will be created"
+            print(f"  {status}: {output_dir}")
+
+        # Estimate output
+        total_outputs = len(files_df) * len(census_files)
+        print(f"\n📊 Estimated output files: {total_outputs:,}")
+        print(f"   ({len(files_df)} input files × {len(census_files)} states)")
+
+        print("\n" + "=" * 60)
+        print("✓ DRY-RUN COMPLETE - All inputs verified!")
+        print("  To run actual processing, remove --dry-run flag")
+        print("  Recommended: Submit to SLURM with appropriate resources")
+        print("=" * 60)
+        sys.exit(0)
+
+    # process data
+    # files_df = files_df[files_df["year"] == year]  # Uncomment to test with single year
+    if args.bbox:
+        # Regional run: one block table for the window instead of one per state
+        block = gpd.read_parquet(census_geoparquet, bbox=tuple(args.bbox))
+        print(f"Loaded {len(block):,} blocks inside bbox {args.bbox}")
+        suffix = "bbox_" + "_".join(f"{v:g}" for v in args.bbox)
+        files_df.parallel_apply(
+            spatial_join,
+            args=(
+                block,
+                suffix,
             ),
-        ],
-        ignore_index=True
-    )
+            axis=1,
+        )
+        census_files = []
+
+    for census_file_name in tqdm(census_files):
+        suffix = census_file_name.split(".zip")[0]
+        block = gpd.read_file(os.path.join(census_data_path, census_file_name)).to_crs(
+            "EPSG:4326"
+        )
+        files_df.parallel_apply(
+            spatial_join,
+            args=(
+                block,
+                suffix,
+            ),
+            axis=1,
+        )
+    t2 = datetime.datetime.now()
+    print("all done!")
+    print("time used:", t2 - t1)
 
-# Check if we have any files to process
-if len(files_df) == 0:
-    print("Error: No files to process!")
-    exit(1)
-
-print(f"\n{'='*60}")
-print(f"Total files to process: {len(files_df)}")
-print(f"Years covered: {sorted(files_df['year'].unique())}")
-print(f"Census states to load: {len(os.listdir(census_data_path))}")
-print(f"{'='*60}\n")
-
-# Dry-run mode: verify inputs only
-if args.dry_run:
-    print("🔍 DRY-RUN MODE: Verifying inputs without processing")
-    print("=" * 60)
-
-    # Check a few sample input files
-    print("\n📁 Checking sample input files:")
-    for idx, row in files_df.head(3).iterrows():
-        exists = os.path.exists(row['input_file'])
-        size = os.path.getsize(row['input_file']) / 1024 / 1024 if exists else 0
-        status = "✓" if exists else "✗"
-        print(f"  {status} {row['file_name']}: {size:.2f} MB")
-
-    # Check census files
-    print(f"\n🗺️  Checking census files:")
-    census_files = list(os.listdir(census_data_path))[:3]
-    for cf in census_files:
-        cf_path = os.path.join(census_data_path, cf)
-        size = os.path.getsize(cf_path) / 1024 / 1024
-        print(f"  ✓ {cf}: {size:.2f} MB")
-
-    # Check output directory
-    print(f"\n📤 Output directories:")
-    for year in files_df['year'].unique():
-        output_dir = os.path.join(output_path_base, str(year))
-        exists = os.path.exists(output_dir)
-        status = "✓ exists" if exists else "✗ will be created"
-        print(f"  {status}: {output_dir}")
-
-    # Estimate output
-    total_outputs = len(files_df) * len(os.listdir(census_data_path))
-    print(f"\n📊 Estimated output files: {total_outputs:,}")
-    print(f"   ({len(files_df)} input files × {len(os.listdir(census_data_path))} states)")
-
-    print("\n" + "=" * 60)
-    print("✓ DRY-RUN COMPLETE - All inputs verified!")
-    print("  To run actual processing, remove --dry-run flag")
-    print("  Recommended: Submit to SLURM with appropriate resources")
-    print("=" * 60)
-    exit(0)
-
-# process data
-# files_df = files_df[files_df["year"] == year]  # Uncomment to test with single year
-for census_file_name in tqdm(list(os.listdir(census_data_path))):
-    suffix = census_file_name.split(".zip")[0]
-    block = gpd.read_file(os.path.join(census_data_path, census_file_name)).to_crs(
-        "EPSG:4326"
-    )
-    files_df.parallel_apply(
-        spatial_join,
-        args=(
-            block,
-            suffix,
-        ),
-        axis=1,
-    )
-t2 = datetime.datetime.now()
-print("all done!")
-print("time used:", t2 - t1)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,30 @@
 import polars as pl
+import glob
 import os
 
+from census_io import load_block_attributes, lookup_block_attributes, check_block_build
+
+def block_key_column(census_path):
+    # Key-only join outputs (0.3.9 --block_key_only) carry block_id instead of GEOID20
+    names = pl.scan_parquet(census_path).collect_schema().names()
+    return "GEOID20" if "GEOID20" in names else "block_id"
+
 def load_yearly_data(year, census_base_path):
     # Define paths for the year-specific files
     census_path = os.path.join(census_base_path, str(year), "*.parquet")
 
     df = pl.read_parquet(census_path,columns = ["message_id",
                                                 "text","user_id",
-                                                "GEOID20",
+                                                block_key_column(census_path),
                                                 "date",
                                                 "score"
                                                 ]).lazy()
+    # Join outputs written straight from the merged tweets (0.3.2, 0.3.9) keep date as text
+    schema = df.collect_schema()
+    if schema["date"] == pl.String:
+        df = df.with_columns(pl.col("date").str.to_datetime())
+    if schema["score"] == pl.String:
+        df = df.with_columns(pl.col("score").cast(pl.Float64))
 
 
     # Add temporal columns
@@ -46,7 +60,13 @@ def compute_statistics(df, group_by_vars=["day", "census_id"], aggregate_var="sc
     stats_results = df.group_by(group_by_vars).agg(basic_aggregations).collect()
     return stats_results
 
-def main( census_base_path, out_path, start_year=2022, end_year=2023):
+def attach_block_attributes(stats_result, block_attributes):
+    # Add GEOID20 (and block area) to statistics grouped by the integer block_id
+    values = lookup_block_attributes(stats_result["block_id"].to_numpy(), block_attributes,
+                                     columns=("GEOID20", "block_area_m2"))
+    return stats_result.with_columns([pl.Series(name, value) for name, value in values.items()])
+
+def main( census_base_path, out_path, start_year=2022, end_year=2023, block_attributes_path=None):
     # Create output directory if it doesn't exist
     os.makedirs(out_path, exist_ok=True)
     # Define keyword groups and group by variables
@@ -54,12 +74,23 @@ def main( census_base_path, out_path, start_year=2022, end_year=2023):
     keywords_group = [None]
     aggregate_var = "score"
     group_by_vars_list = [["day", "GEOID20"], ["year", "month", "GEOID20"],["year","GEOID20"]]
+    # Memory-mapped block attribute arrays from 0.3.8, loaded only for key-only join outputs
+    block_attributes = None
     # Process each year
     for year in range(start_year, end_year + 1):
         print(f"Processing year: {year}")
 
         # Load data for the specific year
         df = load_yearly_data(year, census_base_path)
+        key_column = "block_id" if "block_id" in df.collect_schema().names() else "GEOID20"
+        if key_column == "block_id":
+            if block_attributes_path is None:
+                raise ValueError("Key-only join outputs need block_attributes_path to attach GEOID20")
+            # block_id is a row position of one 0.3.8 build; refuse outputs joined against another
+            check_block_build(sorted(glob.glob(os.path.join(census_base_path, str(year), "*.parquet"))),
+                              block_attributes_path)
+            if block_attributes is None:
+                block_attributes = load_block_attributes(block_attributes_path)
         # Process and compute statistics for each keyword group
         for keywords in keywords_group:
             print(f"Processing keywords: {keywords}")
@@ -70,7 +101,11 @@ def main( census_base_path, out_path, start_year=2022, end_year=2023):
                 prefix = "_".join(group_by_vars)
                 suffix = f"{year}_{prefix}_{name_suffix}"
                 print(f"Processing group by: {suffix}")
-                stats_result = compute_statistics(df_filtered, group_by_vars, aggregate_var)
+                # Group on the integer key, then attach GEOID20 once per group
+                key_vars = [key_column if v == "GEOID20" else v for v in group_by_vars]
+                stats_result = compute_statistics(df_filtered, key_vars, aggregate_var)
+                if key_column == "block_id":
+                    stats_result = attach_block_attributes(stats_result, block_attributes)
                 stats_result.write_parquet(out_path + f"statistics-{suffix}.parquet")
                 # write to csv
                 stats_result.write_csv(out_path + f"statistics-{suffix}.csv")
@@ -80,4 +115,5 @@ def main( census_base_path, out_path, start_year=2022, end_year=2023):
 if __name__ == "__main__":
     census_base_path = "/n/netscratch/cga/Lab/xiaokang/merged_sentiments_tweets_convert_types/"
     out_path = "/n/netscratch/cga/Lab/xiaokang/tweets_us_census_sentiment_stastic/"
-    main(census_base_path, out_path)
+    block_attributes_path = "/n/netscratch/cga/Lab/xiaokang/US-Census-TGSI-workspace/data/census_data_2020/block_attributes"
+    main(census_base_path, out_path, block_attributes_path=block_attributes_path)
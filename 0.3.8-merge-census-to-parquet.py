@@ -2,114 +2,322 @@
 """
 Merge all 51 US state census block shapefiles into a single GeoParquet file.
 This creates a unified census blocks dataset for efficient spatial joins.
+
+States are processed in parallel: each worker reads one state zip, computes block
+area/diameter in EPSG:5070 and writes the state as a GeoParquet part under
+<census_data_2020>/block_parts/. Parts are written to a temp file and renamed, so an
+interrupted run resumes with the states that are still missing. Each part has a
+.source.json sidecar with the size / mtime of the zip it was built from, and a part
+whose zip has changed (e.g. re-downloaded) is rebuilt. The parts are then
+streamed into the national file one state at a time, so the whole nation is never
+held in memory.
+
+Every block carries a GeoParquet 1.1 `bbox` covering column (xmin/ymin/xmax/ymax) and
+the national file is written in fixed-size row groups, so parquet min/max statistics
+on bbox.* let readers skip row groups outside a query window. With --spatial_sort,
+blocks are ordered along a Hilbert curve within each state and states are ordered by
+the Hilbert value of their bbox center, which keeps each row group spatially compact.
+
+Every block also gets a dense integer block_id (its row in the national file), and
+GEOID20/area/diameter are written as NumPy arrays indexed by block_id to
+<census_data_2020>/block_attributes/ (see census_io.py), so joins can emit only the
+block key and attach attributes afterwards. A build id over the part order and sort
+mode is written to the file metadata and meta.json, so join outputs keyed on
+block_id can be checked against the numbering they were made with.
+
+Usage:
+    python 0.3.8-merge-census-to-parquet.py --workers 16
+
+    # Hilbert-sorted output for regional (bbox) queries in 0.3.2 / 0.3.9
+    python 0.3.8-merge-census-to-parquet.py --spatial_sort
+
+    # Rebuild every state part instead of reusing existing ones
+    python 0.3.8-merge-census-to-parquet.py --rebuild_parts
 """
 
 import os
 import json
-import pandas as pd
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 import geopandas as gpd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm import tqdm
+
+from census_io import BUILD_ID_KEY, block_attributes_dir, block_build_id, create_block_attribute_arrays
 import warnings
 warnings.filterwarnings('ignore')
 
-# Load configuration
-with open('setting.json') as f:
-    config = json.load(f)
+BLOCK_COLUMNS = ['GEOID20', 'STATEFP20', 'COUNTYFP20', 'TRACTCE20', 'BLOCKCE20', 'geometry']
+
+# Fixed extent for Hilbert distances, so block and state orders agree across states
+# (longitudes up to +180 cover the Aleutian blocks west of the antimeridian)
+NATIONAL_BOUNDS = (-180.0, 17.0, 180.0, 72.0)
+
+
+def zip_signature(zip_path):
+    """Size and mtime of a state zip, recorded with the part built from it"""
+    st = os.stat(zip_path)
+    return {'source': os.path.basename(zip_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def part_source_path(part_path):
+    """Sidecar file recording which zip a part was built from"""
+    return part_path[:-len('.parquet')] + '.source.json'
+
+
+def part_is_current(zip_path, part_path):
+    """True if the part exists and was built from the zip as it is now"""
+    if not os.path.exists(part_path) or not os.path.exists(part_source_path(part_path)):
+        return False
+    with open(part_source_path(part_path)) as f:
+        return json.load(f) == zip_signature(zip_path)
+
+
+def process_state(zip_path, part_path, spatial_sort=False):
+    """
+    Read one state zip and write it as a GeoParquet part with a bbox covering column
+
+    With spatial_sort, blocks are ordered by the Hilbert distance of their bbox center.
+    The zip's size / mtime are written to the part's .source.json sidecar.
+
+    Returns:
+        Number of blocks in the state
+    """
+    # Taken before reading, so a zip replaced mid-read is rebuilt on the next run
+    source = zip_signature(zip_path)
+    # Read from ZIP using geopandas (automatically handles /vsizip/)
+    gdf = gpd.read_file(f'zip://{zip_path}')
+
+    # Select and compute fields
+    gdf = gdf[BLOCK_COLUMNS]
+
+    # Compute block area in square meters (project to EPSG:5070 - NAD83/Conus Albers)
+    gdf_projected = gdf.to_crs('EPSG:5070')
+    gdf['block_area_m2'] = gdf_projected.geometry.area
+    gdf['block_diameter_m'] = (gdf['block_area_m2'] / 3.14159) ** 0.5 * 2
+
+    # Keep geometry in EPSG:4326 (WGS84) for consistency
+    gdf = gdf.to_crs('EPSG:4326')
+
+    if spatial_sort:
+        hilbert = gdf.geometry.hilbert_distance(total_bounds=NATIONAL_BOUNDS)
+        gdf = gdf.iloc[np.argsort(hilbert.to_numpy(), kind='stable')]
+
+    tmp_path = part_path + '.tmp'
+    gdf.to_parquet(tmp_path, compression='snappy', index=False, write_covering_bbox=True)
+    os.replace(tmp_path, part_path)
+    with open(part_source_path(part_path), 'w') as f:
+        json.dump(source, f)
+    return len(gdf)
+
 
-census_dir = config['census_data_2020']
-output_dir = config['census_data_2020']
+def part_geo_metadata(part_path):
+    """GeoParquet 'geo' metadata of a part file"""
+    return json.loads(pq.read_schema(part_path).metadata[b'geo'])
 
-# Output files
-output_parquet = os.path.join(output_dir, 'us_census_blocks_2020.parquet')
-output_geoparquet = os.path.join(output_dir, 'us_census_blocks_2020.geoparquet')
 
-print("=" * 60)
-print("Merging US Census Blocks (All 51 States)")
-print("=" * 60)
-print(f"Source: {census_dir}")
-print(f"Output: {output_parquet}")
-print()
+def hilbert_order(part_paths):
+    """Order state parts by the Hilbert distance of their bbox center"""
+    centers = []
+    for part_path in part_paths:
+        geo = part_geo_metadata(part_path)
+        minx, miny, maxx, maxy = geo['columns'][geo['primary_column']]['bbox']
+        centers.append(((minx + maxx) / 2, (miny + maxy) / 2))
+    points = gpd.GeoSeries(gpd.points_from_xy(*zip(*centers)))
+    distances = points.hilbert_distance(total_bounds=NATIONAL_BOUNDS).to_numpy()
+    return [part_paths[i] for i in np.argsort(distances, kind='stable')]
 
-# Find all census ZIP files
-census_files = sorted([f for f in os.listdir(census_dir) if f.endswith('_tabblock20.zip')])
-print(f"Found {len(census_files)} state files")
 
+def combine_parts(part_paths, output_geoparquet, output_parquet, row_group_size, attributes_dir, build_id):
+    """
+    Stream state parts into the national GeoParquet and geometry-free Parquet files
 
-# Read and merge all states
-gdfs = []
-total_blocks = 0
+    A block_id column numbering blocks in output order is appended, and the block
+    attribute arrays in attributes_dir are filled in the same pass. build_id
+    (census_io.block_build_id) goes into both files' metadata and the arrays' meta.json.
 
-for census_file in tqdm(census_files, desc="Loading states"):
-    state_fips = census_file.split('_')[2]
-    zip_path = os.path.join(census_dir, census_file)
-    
+    The GeoParquet metadata is taken from the first part, with the bbox replaced by
+    the union of all part bboxes and geometry_types by the union of all parts' types.
+    Only one state table is in memory at a time. Row groups hold at most
+    row_group_size blocks and never span two states.
+
+    Returns:
+        Total number of blocks written
+    """
+    geo = part_geo_metadata(part_paths[0])
+    geom_col = geo['primary_column']
+    bboxes = []
+    geometry_types = set()
+    for part_path in part_paths:
+        column_meta = part_geo_metadata(part_path)['columns'][geom_col]
+        bboxes.append(column_meta['bbox'])
+        geometry_types.update(column_meta['geometry_types'])
+    geo['columns'][geom_col]['bbox'] = [
+        min(b[0] for b in bboxes), min(b[1] for b in bboxes),
+        max(b[2] for b in bboxes), max(b[3] for b in bboxes),
+    ]
+    geo['columns'][geom_col]['geometry_types'] = sorted(geometry_types)
+
+    schema = pq.read_schema(part_paths[0]).append(pa.field('block_id', pa.int32()))
+    build_metadata = {BUILD_ID_KEY.encode(): build_id.encode()}
+    geo_schema = schema.with_metadata({**schema.metadata, b'geo': json.dumps(geo).encode(), **build_metadata})
+    spatial_cols = [geom_col, 'bbox']
+    plain_schema = schema
+    for col in spatial_cols:
+        plain_schema = plain_schema.remove(plain_schema.get_field_index(col))
+    plain_schema = plain_schema.with_metadata(build_metadata)
+
+    n_blocks = sum(pq.ParquetFile(part_path).metadata.num_rows for part_path in part_paths)
+    attributes = create_block_attribute_arrays(attributes_dir, n_blocks, source=output_geoparquet,
+                                               build_id=build_id)
+
+    total_blocks = 0
+    geo_writer = pq.ParquetWriter(output_geoparquet + '.tmp', geo_schema, compression='snappy')
+    plain_writer = pq.ParquetWriter(output_parquet + '.tmp', plain_schema, compression='snappy')
     try:
-        # Read from ZIP using geopandas (automatically handles /vsizip/)
-        gdf = gpd.read_file(f'zip://{zip_path}')
-        
-        # Select and compute fields
-        gdf = gdf[['GEOID20', 'STATEFP20', 'COUNTYFP20', 'TRACTCE20', 'BLOCKCE20', 'geometry']]
-        
-        # Compute block area in square meters (project to EPSG:5070 - NAD83/Conus Albers)
-        gdf_projected = gdf.to_crs('EPSG:5070')
-        gdf['block_area_m2'] = gdf_projected.geometry.area
-        gdf['block_diameter_m'] = (gdf['block_area_m2'] / 3.14159) ** 0.5 * 2
-        
-        # Keep geometry in EPSG:4326 (WGS84) for consistency
-        gdf = gdf.to_crs('EPSG:4326')
-        
-        gdfs.append(gdf)
-        total_blocks += len(gdf)
-        
-    except Exception as e:
-        print(f"\n⚠ Warning: Failed to load {census_file}: {e}")
-        continue
-
-print()
-print(f"Loaded {total_blocks:,} census blocks from {len(gdfs)} states")
-print()
-
-# Concatenate all states
-print("Merging all states...")
-merged_gdf = gpd.GeoDataFrame(
-    pd.concat(gdfs, ignore_index=True),
-    crs='EPSG:4326'
-)
-
-print(f"✓ Total blocks: {len(merged_gdf):,}")
-print()
-
-# Save as GeoParquet (includes geometry)
-print(f"Saving as GeoParquet...")
-merged_gdf.to_parquet(output_geoparquet, compression='snappy')
-print(f"✓ Saved: {output_geoparquet}")
-
-# Also save without geometry column for non-spatial queries (smaller file)
-print(f"Saving as regular Parquet (no geometry)...")
-merged_df = merged_gdf.drop(columns=['geometry'])
-merged_df.to_parquet(output_parquet, compression='snappy')
-print(f"✓ Saved: {output_parquet}")
-
-print()
-print("=" * 60)
-print("Summary Statistics")
-print("=" * 60)
-print(f"Total census blocks: {len(merged_gdf):,}")
-print(f"Total states: {merged_gdf['STATEFP20'].nunique()}")
-print(f"Total counties: {merged_gdf['COUNTYFP20'].nunique()}")
-print()
-print("Blocks by state (top 10):")
-print(merged_gdf['STATEFP20'].value_counts().head(10))
-print()
-print("File sizes:")
-os.system(f"ls -lh {output_geoparquet} {output_parquet}")
-print()
-print("=" * 60)
-print("✓ Census data merge complete!")
-print("=" * 60)
-print()
-print("Usage in DuckDB:")
-print(f"  SELECT * FROM read_parquet('{output_geoparquet}');")
-print()
-print("Usage in Python:")
-print(f"  gdf = gpd.read_parquet('{output_geoparquet}')")
+        for part_path in tqdm(part_paths, desc="Combining states"):
+            table = pq.read_table(part_path)
+            block_ids = np.arange(total_blocks, total_blocks + table.num_rows, dtype=np.int32)
+            table = table.append_column('block_id', pa.array(block_ids)).select(geo_schema.names)
+
+            block_slice = slice(total_blocks, total_blocks + table.num_rows)
+            attributes['geoid20'][block_slice] = table['GEOID20'].to_numpy().astype(np.int64)
+            attributes['block_area_m2'][block_slice] = table['block_area_m2'].to_numpy()
+            attributes['block_diameter_m'][block_slice] = table['block_diameter_m'].to_numpy()
+
+            geo_writer.write_table(table.replace_schema_metadata(geo_schema.metadata),
+                                   row_group_size=row_group_size)
+            # Also save without geometry column for non-spatial queries (smaller file)
+            plain_writer.write_table(table.drop(spatial_cols).replace_schema_metadata(plain_schema.metadata),
+                                     row_group_size=row_group_size)
+            total_blocks += table.num_rows
+    finally:
+        geo_writer.close()
+        plain_writer.close()
+        for array in attributes.values():
+            array.flush()
+
+    os.replace(output_geoparquet + '.tmp', output_geoparquet)
+    os.replace(output_parquet + '.tmp', output_parquet)
+    return total_blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge state census block shapefiles into national (Geo)Parquet')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of states processed in parallel (default: all CPUs)')
+    parser.add_argument('--rebuild_parts', action='store_true',
+                        help='Re-process every state even if its part is up to date with its zip')
+    parser.add_argument('--spatial_sort', action='store_true',
+                        help='Order blocks (and states) along a Hilbert curve')
+    parser.add_argument('--row_group_size', type=int, default=65536,
+                        help='Maximum blocks per parquet row group (default: 65536)')
+    args = parser.parse_args()
+
+    # Load configuration
+    with open('setting.json') as f:
+        config = json.load(f)
+
+    census_dir = config['census_data_2020']
+    output_dir = config['census_data_2020']
+    # Sorted and unsorted parts live apart so a resumed run never mixes the two
+    parts_dir = os.path.join(output_dir, 'block_parts_hilbert' if args.spatial_sort else 'block_parts')
+    os.makedirs(parts_dir, exist_ok=True)
+
+    # Output files
+    output_parquet = os.path.join(output_dir, 'us_census_blocks_2020.parquet')
+    output_geoparquet = os.path.join(output_dir, 'us_census_blocks_2020.geoparquet')
+
+    print("=" * 60)
+    print("Merging US Census Blocks (All 51 States)")
+    print("=" * 60)
+    print(f"Source: {census_dir}")
+    print(f"Parts:  {parts_dir}")
+    print(f"Output: {output_parquet}")
+    print()
+
+    # Find all census ZIP files
+    census_files = sorted([f for f in os.listdir(census_dir) if f.endswith('_tabblock20.zip')])
+    print(f"Found {len(census_files)} state files")
+
+    part_paths = {}
+    pending = {}
+    for census_file in census_files:
+        state_fips = census_file.split('_')[2]
+        part_path = os.path.join(parts_dir, f'tl_2020_{state_fips}_tabblock20.parquet')
+        part_paths[state_fips] = part_path
+        zip_path = os.path.join(census_dir, census_file)
+        # Parts of a changed (or re-downloaded) zip are stale
+        if args.rebuild_parts or not part_is_current(zip_path, part_path):
+            pending[state_fips] = (zip_path, part_path)
+
+    print(f"States to process: {len(pending)} ({len(census_files) - len(pending)} parts reused)")
+    print()
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(process_state, zip_path, part_path, args.spatial_sort): state_fips
+                   for state_fips, (zip_path, part_path) in pending.items()}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Loading states"):
+            state_fips = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"\n⚠ Warning: Failed to load state {state_fips}: {e}")
+                failed.append(state_fips)
+
+    ready = [part_paths[s] for s in sorted(part_paths) if s not in failed]
+    print()
+    print(f"State parts ready: {len(ready)} (failed: {len(failed)})")
+    if not ready:
+        print("✗ No state parts available, nothing to merge")
+        return
+    print()
+
+    if args.spatial_sort:
+        ready = hilbert_order(ready)
+
+    # Stream all states into the national files
+    print("Merging all states...")
+    attributes_dir = block_attributes_dir(config)
+    # block_id is the row position, so it is tied to this exact part order
+    build_id = block_build_id(ready, args.spatial_sort)
+    total_blocks = combine_parts(ready, output_geoparquet, output_parquet, args.row_group_size, attributes_dir,
+                                 build_id)
+    print(f"✓ Total blocks: {total_blocks:,} (block build {build_id})")
+    print(f"✓ Saved: {output_geoparquet}")
+    print(f"✓ Saved: {output_parquet}")
+    print(f"✓ Saved block attribute arrays: {attributes_dir}")
+
+    summary = pq.read_table(output_parquet, columns=['STATEFP20', 'COUNTYFP20']).to_pandas()
+
+    print()
+    print("=" * 60)
+    print("Summary Statistics")
+    print("=" * 60)
+    print(f"Total census blocks: {total_blocks:,}")
+    print(f"Total states: {summary['STATEFP20'].nunique()}")
+    print(f"Total counties: {summary['COUNTYFP20'].nunique()}")
+    print()
+    print("Blocks by state (top 10):")
+    print(summary['STATEFP20'].value_counts().head(10))
+    print()
+    print("File sizes:")
+    os.system(f"ls -lh {output_geoparquet} {output_parquet}")
+    print()
+    print("=" * 60)
+    print("✓ Census data merge complete!")
+    print("=" * 60)
+    print()
+    print("Usage in DuckDB:")
+    print(f"  SELECT * FROM read_parquet('{output_geoparquet}');")
+    print()
+    print("Usage in Python:")
+    print(f"  gdf = gpd.read_parquet('{output_geoparquet}')")
+
+
+if __name__ == '__main__':
+    main()
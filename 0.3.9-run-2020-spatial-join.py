@@ -2,13 +2,41 @@
 """
 Batch process 2020 tweets spatial join by month.
 Based on logic from 0.3.8-test-spatial-join-example.sql.
+
+With --bbox, only census blocks whose bbox covering column intersects the window are
+loaded (DuckDB skips row groups using the parquet statistics written by 0.3.8), and
+only tweets inside the window are joined. Regional outputs go to their own tree,
+<output_dir>/bbox_<minx>_<miny>_<maxx>_<maxy>/<year>/, so they never overwrite the
+national monthly files and 0.3.3 (which reads <output_dir>/<year>/*.parquet) never
+counts their tweets a second time.
+
+With --block_key_only, the join loads and emits only the integer block_id (plus the
+block diameter needed for the confidence score); GEOID20, area and the FIPS parts are
+attached afterwards from the block attribute arrays (census_io.py) by 0.3.3. These
+outputs also carry the tweet columns 0.3.3 reads (text, user_id, and score under its
+own name), so they can be aggregated directly; 0.3.11 checks this path end to end.
+Outputs carry the census file's block_build_id in their parquet metadata, so 0.3.3
+can tell whether their block_id values still match the attribute arrays.
+
+Usage:
+    python 0.3.9-run-2020-spatial-join.py
+    python 0.3.9-run-2020-spatial-join.py --year 2020 --months 3 4
+    python 0.3.9-run-2020-spatial-join.py --months 7 --bbox -74.3 40.5 -73.7 40.9
+    python 0.3.9-run-2020-spatial-join.py --block_key_only
+    python 0.3.9-run-2020-spatial-join.py --input_dir .../geotweets_with_sentiment \
+        --output_dir .../tweets_with_census_blocks --census_file .../us_census_blocks_2020.geoparquet
 """
 
 import os
+import sys
+import argparse
 import subprocess
 import time
 from datetime import datetime
 
+from census_io import BUILD_ID_KEY, parquet_build_id
+from spatial_join_engines import CONFIDENCE_SQL
+
 # Configuration
 YEAR = 2020
 MONTHS = range(1, 13) # 1 to 12
@@ -16,6 +44,33 @@ BASE_INPUT_DIR = "/n/netscratch/cga/Lab/xiaokang/US-Census-TGSI-workspace/data/g
 BASE_OUTPUT_DIR = "/n/netscratch/cga/Lab/xiaokang/US-Census-TGSI-workspace/data/tweets_with_census_blocks"
 CENSUS_FILE = "/n/netscratch/cga/Lab/xiaokang/US-Census-TGSI-workspace/data/census_data_2020/us_census_blocks_2020.geoparquet"
 
+# Block columns loaded from the census file and carried into the join output
+CENSUS_COLUMNS = """GEOID20,
+    STATEFP20,
+    COUNTYFP20,
+    TRACTCE20,
+    BLOCKCE20,
+    block_area_m2,
+    block_diameter_m,"""
+OUTPUT_BLOCK_COLUMNS = """c.GEOID20,
+    c.STATEFP20,
+    c.COUNTYFP20,
+    c.TRACTCE20,
+    c.BLOCKCE20,
+    c.block_area_m2,
+    c.block_diameter_m,"""
+KEY_ONLY_CENSUS_COLUMNS = """block_id,
+    block_diameter_m,"""
+KEY_ONLY_OUTPUT_BLOCK_COLUMNS = """c.block_id,"""
+# Tweet columns: key-only outputs feed 0.3.3 directly, which needs text / user_id / score
+TWEET_COLUMNS = ""
+OUTPUT_TWEET_COLUMNS = "t.sentiment,"
+KEY_ONLY_TWEET_COLUMNS = """text,
+    user_id,"""
+KEY_ONLY_OUTPUT_TWEET_COLUMNS = """t.text,
+    t.user_id,
+    t.sentiment AS score,"""
+
 # SQL Template
 SQL_TEMPLATE = """
 .echo on
@@ -32,15 +87,9 @@ LOAD spatial;
 SELECT 'Loading census blocks...';
 CREATE OR REPLACE TABLE census_blocks AS
   SELECT
-    GEOID20,
-    STATEFP20,
-    COUNTYFP20,
-    TRACTCE20,
-    BLOCKCE20,
-    block_area_m2,
-    block_diameter_m,
+    {census_columns}
     geometry as geometry_4326
-  FROM read_parquet('{census_file}');
+  FROM read_parquet('{census_file}'){census_filter};
 
 CREATE INDEX census_geom_idx ON census_blocks USING RTREE(geometry_4326);
 
@@ -49,6 +98,7 @@ SELECT 'Loading tweets for {year}-{month}...';
 CREATE OR REPLACE TABLE tweets AS
   SELECT
     message_id,
+    {tweet_columns}
     CAST(latitude AS DOUBLE) as latitude,
     CAST(longitude AS DOUBLE) as longitude,
     score as sentiment,
@@ -62,7 +112,7 @@ CREATE OR REPLACE TABLE tweets AS
     COALESCE(CAST(spatialerror AS DOUBLE), 10000.0) as spatialerror,
     -- Implicitly treats coordinates as WGS84 (EPSG:4326)
     ST_Point(CAST(longitude AS DOUBLE), CAST(latitude AS DOUBLE)) as tweet_geom
-  FROM read_parquet('{input_pattern}');
+  FROM read_parquet('{input_pattern}'){tweet_filter};
 
 SELECT 'Tweets loaded:', COUNT(*) FROM tweets;
 
@@ -73,27 +123,13 @@ CREATE OR REPLACE TABLE tweets_with_blocks AS
     t.message_id,
     t.latitude,
     t.longitude,
-    t.sentiment,
+    {output_tweet_columns}
     t.date,
     t.GPS,
     t.spatialerror,
-    c.GEOID20,
-    c.STATEFP20,
-    c.COUNTYFP20,
-    c.TRACTCE20,
-    c.BLOCKCE20,
-    c.block_area_m2,
-    c.block_diameter_m,
-    -- Compute confidence score (Logic from 0.3.7/0.3.8)
-    CASE
-        WHEN t.GPS THEN 1.0
-        WHEN t.spatialerror < 50 THEN 1.0
-        WHEN t.spatialerror < (c.block_diameter_m / 2) THEN 0.8
-        WHEN t.spatialerror < c.block_diameter_m THEN 0.5
-        WHEN t.spatialerror < (2 * c.block_diameter_m) THEN 0.3
-        WHEN t.spatialerror < 1000 THEN 0.15
-        ELSE 0.05
-    END as confidence
+    {output_block_columns}
+    -- Compute confidence score (Logic from 0.3.7/0.3.8, spatial_join_engines.CONFIDENCE_SQL)
+    {confidence_sql} as confidence
   FROM tweets t
   JOIN census_blocks c
     ON ST_Within(t.tweet_geom, c.geometry_4326);
@@ -104,31 +140,47 @@ SELECT 'Tweets matched:', COUNT(*) FROM tweets_with_blocks;
 SELECT 'Saving results to {output_file}...';
 COPY tweets_with_blocks
 TO '{output_file}'
-(FORMAT PARQUET, COMPRESSION SNAPPY);
+(FORMAT PARQUET, COMPRESSION SNAPPY{copy_metadata});
 
 SELECT 'Done.';
 """
 
-def process_month(year, month):
+def bbox_filters(bbox):
+    """SQL WHERE clauses restricting census blocks and tweets to bbox (empty without one)"""
+    if bbox is None:
+        return "", ""
+    minx, miny, maxx, maxy = bbox
+    census_filter = (f"\n  WHERE bbox.xmax >= {minx} AND bbox.xmin <= {maxx}"
+                     f" AND bbox.ymax >= {miny} AND bbox.ymin <= {maxy}")
+    tweet_filter = (f"\n  WHERE CAST(longitude AS DOUBLE) BETWEEN {minx} AND {maxx}"
+                    f" AND CAST(latitude AS DOUBLE) BETWEEN {miny} AND {maxy}")
+    return census_filter, tweet_filter
+
+
+def process_month(year, month, bbox=None, block_key_only=False, build_id=None,
+                  input_dir=BASE_INPUT_DIR, output_dir=BASE_OUTPUT_DIR, census_file=CENSUS_FILE):
     month_str = f"{month:02d}"
     print(f"\n{'='*60}")
     print(f"Processing {year}-{month_str}")
     print(f"{'='*60}")
 
     # Define paths
-    input_pattern = os.path.join(BASE_INPUT_DIR, str(year), f"{year}_{month_str}_*.parquet")
+    input_pattern = os.path.join(input_dir, str(year), f"{year}_{month_str}_*.parquet")
     
     # Verify input exists
     # Note: wildcard check in python requires glob, but we can trust duckdb or check manually.
     # We'll just check if directory exists.
-    input_dir = os.path.dirname(input_pattern)
-    if not os.path.exists(input_dir):
-        print(f"Skipping: Input directory not found: {input_dir}")
+    year_input_dir = os.path.dirname(input_pattern)
+    if not os.path.exists(year_input_dir):
+        print(f"Skipping: Input directory not found: {year_input_dir}")
         return
 
-    output_dir = os.path.join(BASE_OUTPUT_DIR, str(year))
-    os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, f"{year}_{month_str}.parquet")
+    # Regional runs get their own directory next to the national <year>/ directories
+    if bbox:
+        output_dir = os.path.join(output_dir, "bbox_" + "_".join(f"{v:g}" for v in bbox))
+    year_output_dir = os.path.join(output_dir, str(year))
+    os.makedirs(year_output_dir, exist_ok=True)
+    output_file = os.path.join(year_output_dir, f"{year}_{month_str}.parquet")
 
     # Check if output already exists
     if os.path.exists(output_file):
@@ -137,8 +189,18 @@ def process_month(year, month):
         # return # Uncomment to skip existing
 
     # Prepare SQL
+    census_filter, tweet_filter = bbox_filters(bbox)
     sql_script = SQL_TEMPLATE.format(
-        census_file=CENSUS_FILE,
+        census_file=census_file,
+        census_columns=KEY_ONLY_CENSUS_COLUMNS if block_key_only else CENSUS_COLUMNS,
+        output_block_columns=KEY_ONLY_OUTPUT_BLOCK_COLUMNS if block_key_only else OUTPUT_BLOCK_COLUMNS,
+        tweet_columns=KEY_ONLY_TWEET_COLUMNS if block_key_only else TWEET_COLUMNS,
+        output_tweet_columns=KEY_ONLY_OUTPUT_TWEET_COLUMNS if block_key_only else OUTPUT_TWEET_COLUMNS,
+        confidence_sql=CONFIDENCE_SQL,
+        # block numbering the output's block_id refers to (checked by 0.3.3)
+        copy_metadata=f", KV_METADATA {{{BUILD_ID_KEY}: '{build_id}'}}" if build_id else "",
+        census_filter=census_filter,
+        tweet_filter=tweet_filter,
         input_pattern=input_pattern,
         output_file=output_file,
         year=year,
@@ -169,11 +231,35 @@ def process_month(year, month):
             os.remove(temp_sql_path)
 
 def main():
-    print(f"Starting batch processing for Year {YEAR}")
+    parser = argparse.ArgumentParser(description='Monthly DuckDB spatial join of tweets to census blocks')
+    parser.add_argument('--year', type=int, default=YEAR, help=f'Year to process (default: {YEAR})')
+    parser.add_argument('--months', type=int, nargs='+', default=list(MONTHS),
+                        help='Months to process (default: 1-12)')
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('MINX', 'MINY', 'MAXX', 'MAXY'),
+                        help='Only join tweets and blocks inside this lon/lat window')
+    parser.add_argument('--block_key_only', action='store_true',
+                        help='Emit only the integer block_id instead of the block attribute columns')
+    parser.add_argument('--input_dir', type=str, default=BASE_INPUT_DIR,
+                        help='Merged tweets directory with <year>/ subdirectories (0.2.1 output)')
+    parser.add_argument('--output_dir', type=str, default=BASE_OUTPUT_DIR,
+                        help='Directory the <year>/ join outputs are written to')
+    parser.add_argument('--census_file', type=str, default=CENSUS_FILE,
+                        help='National block geoparquet written by 0.3.8')
+    args = parser.parse_args()
+
+    # Block build of the census file (0.3.8); key-only outputs are useless without it
+    build_id = parquet_build_id(args.census_file) if os.path.exists(args.census_file) else None
+    if args.block_key_only and build_id is None:
+        sys.exit(f"{args.census_file} has no {BUILD_ID_KEY}; rerun 0.3.8 before a --block_key_only join")
+
+    print(f"Starting batch processing for Year {args.year}")
+    if args.bbox:
+        print(f"Restricting to bbox: {args.bbox}")
     start_total = time.time()
     
-    for month in MONTHS:
-        process_month(YEAR, month)
+    for month in args.months:
+        process_month(args.year, month, args.bbox, args.block_key_only, build_id,
+                      args.input_dir, args.output_dir, args.census_file)
         
     print(f"\nAll tasks finished in {time.time() - start_total:.2f} seconds")
 
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Normalize the census population parquet files into integer-keyed block / tract /
+county tables (see census_io.py).
+
+The raw files carry GEO_ID strings like '1000000US010010201001000'; every stage that
+needed population used to strip them with a regex and re-aggregate all rows on each
+run. This writes, once per change of the source files:
+
+    <workspace>/data/census_population/block_population.parquet    geoid20, tract_id, county_id, population
+    <workspace>/data/census_population/tract_population.parquet    tract_id, population
+    <workspace>/data/census_population/county_population.parquet   county_id, population
+
+0.4.2 (CR) calls the same update itself, so running this first is optional.
+
+Usage:
+    python 0.4.0-build-census-population-cache.py
+    python 0.4.0-build-census-population-cache.py --rebuild
+"""
+
+import json
+import time
+import argparse
+
+from census_io import ensure_population_cache, population_cache_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the normalized census population cache")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild even if the source files are unchanged")
+    args = parser.parse_args()
+
+    # Load configuration
+    with open("setting.json") as f:
+        config = json.load(f)
+
+    start = time.time()
+    manifest = ensure_population_cache(config, rebuild=args.rebuild)
+
+    print(f"\n{'='*60}")
+    print(f"Census population cache: {population_cache_dir(config)}")
+    print(f"{'='*60}")
+    print(f"  Source files: {len(manifest['sources'])}")
+    print(f"  Blocks:   {manifest['blocks']:,}")
+    print(f"  Tracts:   {manifest['tracts']:,}")
+    print(f"  Counties: {manifest['counties']:,}")
+    print(f"\n✓ Population cache up to date in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+-- NOTE: the pipeline computes these outputs in one scan with
+--       0.4.2-coverage-ratio-single-pass.py; this script is kept for interactive use.
 -- =============================================================================
 -- Aggregate tweet_count by GEOID20 using JSON configuration
 -- =============================================================================
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Coverage ratio (CR) in one pass: replaces 0.4.1 + 0.4.2.
+
+0.4.1 summed the day files per GEOID20 and wrote two parquet files (tweet counts,
+then tweet counts joined with population); 0.4.2 re-read them, computed the totals
+and CR, wrote the CR file and re-read it to write the filtered copy. Here the day
+files are scanned once into an in-memory (year, GEOID20) tweet table, block population
+(normalized once by census_io.ensure_population_cache) is joined on the integer
+GEOID20, and T_i, P_i, totals, CR, log2CR and mask_low_coverage are computed with
+window sums before both outputs are written from the same table:
+
+    data/all_years_tweet_count_with_pop_CR.parquet            all blocks, pooled years
+    data/all_years_tweet_count_with_pop_CR_filtered.parquet   mask_low_coverage = 0
+
+With --per_year, the same table also yields CR per year (totals per year):
+
+    data/per_year_tweet_count_with_pop_CR.parquet             year, GEOID20, T_i, P_i, CR, ...
+    data/per_year_tweet_count_with_pop_CR_filtered.parquet
+
+Definitions are unchanged from 0.4.2: CR = (T_i / T_tot) / (P_i / P_tot), mask when
+T_i < 20 or P_i <= 0.
+
+Usage:
+    python 0.4.2-coverage-ratio-single-pass.py
+    python 0.4.2-coverage-ratio-single-pass.py --per_year
+"""
+
+import os
+import json
+import time
+import argparse
+
+import duckdb
+
+from census_io import ensure_population_cache, population_path
+
+MIN_TWEETS = 20
+
+# Day files -> tweets per (year, block); the only scan of the day files
+TWEETS_BY_YEAR = """
+CREATE TEMP TABLE tweets_by_year AS
+SELECT
+    EXTRACT('year' FROM CAST(day AS DATE))::INT AS year,
+    GEOID20::VARCHAR                              AS GEOID20,
+    SUM(tweet_count)                              AS tweet_count
+FROM read_parquet(?)
+GROUP BY 1, 2
+"""
+
+# Normalized block population (census_io.ensure_population_cache): integer GEOID20,
+# one row per block, so no GEO_ID regex or re-aggregation here
+POPULATION = """
+CREATE TEMP TABLE census_pop AS
+SELECT geoid20, population FROM read_parquet(?)
+"""
+
+# T_i / P_i per key, totals over the partition, CR, log2CR and the mask in one select
+CR_TEMPLATE = """
+CREATE TEMP TABLE {table} AS
+WITH base AS (
+    SELECT {keys}, CAST(SUM(t.tweet_count) AS DOUBLE) AS T_i, CAST(ANY_VALUE(p.population) AS DOUBLE) AS P_i
+    FROM tweets_by_year t
+    LEFT JOIN census_pop p ON TRY_CAST(t.GEOID20 AS BIGINT) = p.geoid20
+    GROUP BY {keys}
+),
+cr AS (
+    SELECT *, (T_i / SUM(T_i) OVER w) / (P_i / SUM(P_i) OVER w) AS CR
+    FROM base
+    WINDOW w AS ({partition})
+)
+SELECT
+    *,
+    CASE WHEN CR > 0 THEN ln(CR) / ln(2) END                  AS log2CR,
+    CASE WHEN T_i < {min_tweets} OR P_i <= 0 THEN 1 ELSE 0 END AS mask_low_coverage
+FROM cr
+"""
+
+
+def write_outputs(con, table, full_path, filtered_path, order):
+    """Write the full table and its reportable rows (both from memory)"""
+    for path, where in ((full_path, ""), (filtered_path, "WHERE mask_low_coverage = 0")):
+        con.execute(f"COPY (SELECT * FROM {table} {where} ORDER BY {order}) TO '{path}' (FORMAT PARQUET)")
+    n_total, n_reportable = con.execute(
+        f"SELECT COUNT(*), COUNT(*) FILTER (WHERE mask_low_coverage = 0) FROM {table}").fetchone()
+    print(f"✓ {table}: {n_total:,} rows ({n_reportable:,} reportable)")
+    print(f"    -> {full_path}")
+    print(f"    -> {filtered_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute CR / log2CR from the day files in a single scan")
+    parser.add_argument("--per_year", action="store_true",
+                        help="Also write CR per year (year totals) next to the pooled CR")
+    parser.add_argument("--threads", type=int, default=None, help="DuckDB threads (default: all CPUs)")
+    args = parser.parse_args()
+
+    # Load configuration
+    with open("setting.json") as f:
+        config = json.load(f)
+
+    data_dir = os.path.join(config["workspace"], "data")
+    os.makedirs(data_dir, exist_ok=True)
+
+    con = duckdb.connect()
+    if args.threads:
+        con.execute(f"SET threads = {args.threads}")
+
+    start = time.time()
+    con.execute(TWEETS_BY_YEAR, [os.path.join(config["statistic_results"], "*day*.parquet")])
+    ensure_population_cache(config)
+    con.execute(POPULATION, [population_path(config, "block")])
+    n_rows, n_years = con.execute("SELECT COUNT(*), COUNT(DISTINCT year) FROM tweets_by_year").fetchone()
+    print(f"Scanned day files: {n_rows:,} (year, block) rows over {n_years} years in {time.time() - start:.1f}s")
+
+    # Pooled over all years: same output as 0.4.1 + 0.4.2
+    con.execute(CR_TEMPLATE.format(table="cr_pooled", keys="t.GEOID20", partition="", min_tweets=MIN_TWEETS))
+    write_outputs(con, "cr_pooled",
+                  os.path.join(data_dir, "all_years_tweet_count_with_pop_CR.parquet"),
+                  os.path.join(data_dir, "all_years_tweet_count_with_pop_CR_filtered.parquet"),
+                  order="CR DESC")
+
+    if args.per_year:
+        con.execute(CR_TEMPLATE.format(table="cr_per_year", keys="t.year, t.GEOID20",
+                                       partition="PARTITION BY year", min_tweets=MIN_TWEETS))
+        write_outputs(con, "cr_per_year",
+                      os.path.join(data_dir, "per_year_tweet_count_with_pop_CR.parquet"),
+                      os.path.join(data_dir, "per_year_tweet_count_with_pop_CR_filtered.parquet"),
+                      order="year, CR DESC")
+
+    print(f"\n✓ Coverage ratio complete in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
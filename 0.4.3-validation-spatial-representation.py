@@ -1,48 +1,127 @@
-import shapely.ops
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import argparse
 import json
 import os
-from tqdm import tqdm
-from pandarallel import pandarallel
-pandarallel.initialize(progress_bar=False)
 
-def shift_lon(lon):
-    if lon > 0:
-        return lon - 360
-    else:
-        return lon
+from census_io import census_geometry_files, load_census_geometry
+from coverage_stats import coverage_ratio
+from map_render import shift_longitudes
 
-
-def shift_geometry(geometry):
-    """Apply shift_lon to every coordinate in a geometry."""
-    def shift_func(x, y, z=None):
-        return (shift_lon(x), y) if z is None else (shift_lon(x), y, z)
-    return shapely.ops.transform(shift_func, geometry)
+parser = argparse.ArgumentParser(description='Merge census geometry with CR metrics for the validation maps')
+parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                    help='Processes reading state geometry files (default: all CPUs)')
+args = parser.parse_args()
 
 # Load configuration
 with open('setting.json') as f:
     config = json.load(f)
 
-census_tracts_path = config["census_geometry"]
+# TIGER tract files (0.1 --layers tract), one directory holding nothing else
+census_tracts_path = config["census_tracts_2020"]
+
+# The shifted geometry only depends on the census files, so it is cached and reused
+# whenever the CR metrics change; the sidecar json records the source files it was
+# built from (name -> [size, mtime_ns]) and any change rebuilds it.
+shifted_cache_path = os.path.join(config["workspace"], "data/census_geometry_shifted.geoparquet")
+shifted_sources_path = shifted_cache_path.replace(".geoparquet", ".sources.json")
+
+
+def list_sources(path):
+    sources = {}
+    for name in census_geometry_files(path):
+        st = os.stat(os.path.join(path, name))
+        sources[name] = [st.st_size, st.st_mtime_ns]
+    return sources
+
+
+def load_cached_geometry(sources):
+    try:
+        with open(shifted_sources_path) as f:
+            cached_sources = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if cached_sources != sources or not os.path.exists(shifted_cache_path):
+        return None
+    return gpd.read_parquet(shifted_cache_path)
+
+
+sources = list_sources(census_tracts_path)
+census_tracts = load_cached_geometry(sources)
+
+if census_tracts is None:
+    # read all state files in parallel, concatenated once; only the merge key is needed
+    # downstream (GEOID20 in block files, GEOID in tract files)
+    census_tracts = load_census_geometry(census_tracts_path, columns=["GEOID20", "GEOID"],
+                                         workers=args.workers, files=sorted(sources))
+    print(f"Loaded {len(census_tracts):,} geometries from {len(sources)} files")
+
+    # shift the geometry to make map (vectorized over all vertices; only geometries
+    # reaching positive longitudes are touched)
+    census_tracts["geometry"] = shift_longitudes(census_tracts.geometry)
 
-census_tracts = gpd.GeoDataFrame()
-for file_name in tqdm(list(os.listdir(census_tracts_path))):
-    state_census_tracts = gpd.read_file(
-        os.path.join(census_tracts_path, file_name))
-    # break
-    census_tracts = pd.concat([census_tracts, state_census_tracts])
+    census_tracts.to_parquet(shifted_cache_path + ".tmp")
+    os.replace(shifted_cache_path + ".tmp", shifted_cache_path)
+    with open(shifted_sources_path, "w") as f:
+        json.dump(sources, f, indent=2, sort_keys=True)
+    print(f"✓ Cached shifted geometry: {shifted_cache_path}")
+else:
+    print(f"✓ Reusing cached shifted geometry: {shifted_cache_path}")
+
+
+
+def key_width(keys, what):
+    """The single digit width of a GEOID column (raises on mixed widths)"""
+    widths = keys.dropna().str.len().unique()
+    if len(widths) != 1:
+        raise ValueError(f"{what} keys have mixed widths {sorted(widths)}; "
+                         f"block and tract files must not share one directory")
+    return int(widths[0])
+
+
+def aggregate_cr(cr_df, width):
+    """
+    CR table of 15-digit blocks summed to GEOID prefixes of width digits (11: tracts)
+
+    T_i and P_i are summed per prefix and CR / log2CR / mask_low_coverage recomputed
+    with the same definitions as 0.4.2 (totals over all rows).
+    """
+    keys = cr_df["GEOID20"].str[:width]
+    agg = (cr_df.groupby(keys)[["T_i", "P_i"]].sum(min_count=1)
+           .rename_axis("GEOID20").reset_index())
+    T = agg["T_i"].to_numpy(dtype=np.float64)
+    P = agg["P_i"].to_numpy(dtype=np.float64, na_value=np.nan)
+    agg["CR"], agg["log2CR"], agg["mask_low_coverage"] = coverage_ratio(np.zeros(len(agg), dtype=np.int64), T, P, 1)
+    return agg
+
+
+# The geometry key is GEOID20 (blocks) or GEOID (tracts), never both
+geometry_keys = [c for c in ("GEOID20", "GEOID") if c in census_tracts.columns]
+if len(geometry_keys) != 1:
+    raise ValueError(f"Expected one key column (GEOID20 or GEOID) in {census_tracts_path}, found {geometry_keys}")
+geometry_key = geometry_keys[0]
+geometry_width = key_width(census_tracts[geometry_key], "Geometry")
 
 cr_df = pd.read_parquet(
     os.path.join(config["workspace"], "data/all_years_tweet_count_with_pop_CR.parquet"))
+cr_df["GEOID20"] = cr_df["GEOID20"].astype(str)
+cr_width = key_width(cr_df["GEOID20"], "CR")
+
+if geometry_width < cr_width and geometry_width in (2, 5, 11):
+    # tract (or county / state) geometry: bring the block CR up to the same level
+    print(f"Aggregating block CR ({cr_width} digits) to the {geometry_width}-digit geometry key")
+    cr_df = aggregate_cr(cr_df, geometry_width)
+elif geometry_width != cr_width:
+    raise ValueError(f"Geometry key {geometry_key} has {geometry_width} digits but the CR table's GEOID20 has "
+                     f"{cr_width}; cannot merge")
 
-# merge geometry on GEOID20
+# merge geometry on its key; the map scripts read the key as GEOID20 whatever the level
 
-census_tracts_merged = census_tracts.merge(
-    cr_df, left_on="GEOID20", right_on="GEOID20", how="left")
-# shift the geometry to make map
-tqdm.pandas()
-census_tracts_merged["geometry"]=census_tracts_merged["geometry"].parallel_apply(shift_geometry)
+census_tracts_merged = census_tracts.rename(columns={geometry_key: "GEOID20"}).merge(
+    cr_df, on="GEOID20", how="left")
+print(f"Merged {len(census_tracts_merged):,} geometries, "
+      f"{census_tracts_merged['T_i'].notna().sum():,} with CR")
 
 # save it to parquet
 census_tracts_merged.to_parquet(os.path.join(config["workspace"], "data/census_tracts_merged_shifted_geo.parquet"))
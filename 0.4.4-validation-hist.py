@@ -2,18 +2,38 @@ import numpy as np
 import geopandas as gpd
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib import colors
+from matplotlib.cm import ScalarMappable
+from matplotlib.patches import Patch
 import numpy as np
+import argparse
 import json
 import os
 
+from map_render import load_map_frame, load_id_raster, load_map_attributes, colorize_id_raster
+
+parser = argparse.ArgumentParser(description='log2CR map by census tract')
+parser.add_argument('--dpi', type=int, default=300, help='Output resolution (default: 300)')
+parser.add_argument('--resolution', choices=['auto', 'full'], default='auto',
+                    help='auto: simplified geometry matching --dpi (from 0.4.6); full: original geometry')
+parser.add_argument('--render', choices=['vector', 'raster'], default='vector',
+                    help='raster: color a cached tract ID raster instead of drawing polygons')
+args = parser.parse_args()
+
+FIGSIZE = plt.rcParams["figure.figsize"]
+
 # Load configuration
 with open('setting.json') as f:
     config = json.load(f)
 
 # 1) 读几何 + 指标，并过滤低覆盖
-# tracts = gpd.read_parquet(
-#     os.path.join(config["workspace"], "data/census_tracts_merged_shifted_geo.parquet")
-# )
+# 按输出 DPI 选用 0.4.6 的简化几何（没有缓存时读原始几何）
+# raster 模式只读指标，几何用缓存的 tract ID 栅格
+if args.render == "raster":
+    ids, keys, extent = load_id_raster(config, FIGSIZE, args.dpi, resolution=args.resolution)
+    tracts = load_map_attributes(config, ["log2CR", "mask_low_coverage"], keys)
+else:
+    tracts = load_map_frame(config, ["log2CR", "mask_low_coverage"], FIGSIZE, args.dpi, args.resolution)
 # 如果你有“已过滤”的表，直接 merge 那个；否则在这里过滤
 # g = tracts[tracts["mask_low_coverage"] == 0]
 g = tracts.copy()
@@ -28,18 +48,30 @@ g["log2CR"] = g["log2CR"].where(g["mask_low_coverage"] == 0, np.nan)
 # plt.tight_layout()
 # plt.savefig("CR_histogram.png")
 
-plt.figure()
-g.plot(column="log2CR",
-        cmap="coolwarm",
-        vmin=-19,
-        vmax=19,
-        legend=True,
-        legend_kwds={'shrink': 0.6},
-        missing_kwds={"color": "#808080", "label": "Masked (<20 tweets)"}
-                          )
+plt.figure(figsize=FIGSIZE)
+if args.render == "raster":
+    # 每个 tract 一个颜色，再按像素查表（NumPy take），不画多边形
+    cmap = plt.get_cmap("coolwarm")
+    norm = colors.Normalize(vmin=-19, vmax=19)
+    values = g["log2CR"].to_numpy()
+    rgba = cmap(norm(values))
+    rgba[np.isnan(values)] = colors.to_rgba("#808080")
+    plt.imshow(colorize_id_raster(ids, rgba), extent=extent, interpolation="nearest")
+    plt.colorbar(ScalarMappable(norm=norm, cmap=cmap), ax=plt.gca(), shrink=0.6)
+    plt.legend(handles=[Patch(facecolor="#808080", label="Masked (<20 tweets)")], loc="lower left")
+else:
+    g.plot(column="log2CR",
+            cmap="coolwarm",
+            vmin=-19,
+            vmax=19,
+            legend=True,
+            legend_kwds={'shrink': 0.6},
+            missing_kwds={"color": "#808080", "label": "Masked (<20 tweets)"},
+            ax=plt.gca()
+                              )
 plt.title("Log2(CR) by Census Tract")
 plt.tight_layout()
-plt.savefig(os.path.join(config["outputs_dir"], "validation/log2CR_by_census_tract.png"), dpi=300)
+plt.savefig(os.path.join(config["outputs_dir"], "validation/log2CR_by_census_tract.png"), dpi=args.dpi)
 
 # plt.figure()
 # g.plot(column="CR",
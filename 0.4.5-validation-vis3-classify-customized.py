@@ -1,37 +1,67 @@
-import geopandas as gpd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib import colors
 from matplotlib.patches import Patch
+import argparse
 import json
 import os
 
+from map_render import load_map_frame, load_id_raster, load_map_attributes, colorize_id_raster
+
+parser = argparse.ArgumentParser(description='Classified log2CR map (7 user-defined classes)')
+parser.add_argument('--dpi', type=int, default=300, help='Output resolution (default: 300)')
+parser.add_argument('--resolution', choices=['auto', 'full'], default='auto',
+                    help='auto: simplified geometry matching --dpi (from 0.4.6); full: original geometry')
+parser.add_argument('--render', choices=['vector', 'raster'], default='vector',
+                    help='raster: color a cached tract ID raster (EPSG:5070) instead of drawing polygons')
+args = parser.parse_args()
+
+FIGSIZE = (11, 7)
+
 # Load configuration
 with open('setting.json') as f:
     config = json.load(f)
 
-g = gpd.read_parquet(
-    os.path.join(config["workspace"], "data/census_tracts_merged_shifted_geo.parquet")
-).to_crs(5070)
-
-mask = g[g["mask_low_coverage"] == 1]
-ok   = g[g["mask_low_coverage"] == 0].copy()
-
 # 7 档 log2 阈值（上界列表）
 bins = [-2, -1, -0.5, 0.5, 1, 2]
 labels = ["≤0.25×","0.25–0.5×","0.5–0.71×","0.71–1.41×","1.41–2×","2–4×",">4×"]
+legend_title = "log\u2082(CR)\n(−1=0.5×, 0=1×, +1=2×)"
+
+fig, ax = plt.subplots(figsize=FIGSIZE, constrained_layout=True)
+
+if args.render == "raster":
+    # tract ID 栅格（EPSG:5070，只在几何或分辨率变化时重建），按类别查表上色
+    ids, keys, extent = load_id_raster(config, FIGSIZE, args.dpi, crs=5070, resolution=args.resolution)
+    attrs = load_map_attributes(config, ["log2CR", "mask_low_coverage"], keys)
+
+    # 与 UserDefined 分级一致：x <= bins[i] 归入第 i 档
+    class_colors = plt.get_cmap("Spectral_r")(np.linspace(0, 1, len(labels)))
+    classes = np.searchsorted(bins, attrs["log2CR"].to_numpy(), side="left")
+    rgba = class_colors[np.minimum(classes, len(labels) - 1)]
+    masked = (attrs["mask_low_coverage"] != 0).to_numpy() | attrs["log2CR"].isna().to_numpy()
+    rgba[masked] = colors.to_rgba("#D9D9D9")
+
+    ax.imshow(colorize_id_raster(ids, rgba), extent=extent, interpolation="nearest")
+    ax.legend(handles=[Patch(facecolor=c, edgecolor="none", label=l) for c, l in zip(class_colors, labels)],
+              title=legend_title, frameon=False, loc="upper right", bbox_to_anchor=(1.02, 1.0))
+else:
+    # 按输出 DPI 选用 0.4.6 的简化几何，再投影（简化后顶点少，投影也快）
+    g = load_map_frame(config, ["log2CR", "mask_low_coverage"], FIGSIZE, args.dpi, args.resolution).to_crs(5070)
+
+    mask = g[g["mask_low_coverage"] == 1]
+    ok   = g[g["mask_low_coverage"] == 0].copy()
 
-fig, ax = plt.subplots(figsize=(11,7), constrained_layout=True)
-mask.plot(color="#D9D9D9", linewidth=0, ax=ax)
+    mask.plot(color="#D9D9D9", linewidth=0, ax=ax)
 
-ok.plot(column="log2CR",
-        cmap="Spectral_r", scheme="UserDefined",
-        classification_kwds={"bins": bins},
-        linewidth=0, ax=ax, legend=True,
-        legend_kwds={
-            "title": "log\u2082(CR)\n(−1=0.5×, 0=1×, +1=2×)",
-            "labels": labels,
-            "frameon": False, "loc": "upper right", "bbox_to_anchor": (1.02, 1.0)
-        })
+    ok.plot(column="log2CR",
+            cmap="Spectral_r", scheme="UserDefined",
+            classification_kwds={"bins": bins},
+            linewidth=0, ax=ax, legend=True,
+            legend_kwds={
+                "title": legend_title,
+                "labels": labels,
+                "frameon": False, "loc": "upper right", "bbox_to_anchor": (1.02, 1.0)
+            })
 
 ax.set_axis_off()
 
@@ -41,4 +71,4 @@ masked_patch = Patch(facecolor="#D9D9D9", edgecolor="none", label="Masked / No d
 leg2 = ax.legend(handles=[masked_patch], loc="lower left", frameon=False)
 ax.add_artist(leg1)     # 把原图例加回去
 
-fig.savefig(os.path.join(config["outputs_dir"], "validation/log2CR_userdefined_7class.png"), dpi=300, bbox_inches="tight")
+fig.savefig(os.path.join(config["outputs_dir"], "validation/log2CR_userdefined_7class.png"), dpi=args.dpi, bbox_inches="tight")
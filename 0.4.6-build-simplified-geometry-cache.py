@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Build the multi-resolution simplified geometry cache used by the validation maps.
+
+For each layer and tolerance in map_render.SIMPLIFY_TOLERANCES (degrees), writes a
+GeoParquet with the key column and a coverage-simplified geometry to
+<workspace>/data/simplified_geometry/<layer>_tol<tolerance>.geoparquet. Geometry is
+in EPSG:4326 with longitudes shifted like 0.4.3, so it lines up with the tract map.
+
+    tract: geometry from 0.4.3 (census_tracts_merged_shifted_geo.parquet)
+    block: national block geoparquet from 0.3.8, simplified state by state
+
+Each level gets a <layer>_tol<tolerance>.sources.json sidecar recording the files it
+was built from (map_render.layer_sources: the 0.4.3 shifted geometry cache for tracts,
+the 0.3.8 geoparquet for blocks). Levels whose sources are unchanged are skipped;
+stale ones are rebuilt, and the map scripts ignore them until then.
+
+0.4.4 / 0.4.5 pick the level matching their output DPI (map_render.load_map_geometry).
+
+Usage:
+    python 0.4.6-build-simplified-geometry-cache.py
+    python 0.4.6-build-simplified-geometry-cache.py --layers tract --tolerances 0.002 0.01
+    python 0.4.6-build-simplified-geometry-cache.py --overwrite
+"""
+
+import os
+import json
+import time
+import argparse
+
+import shapely
+import pandas as pd
+import geopandas as gpd
+from tqdm import tqdm
+
+from map_render import (SIMPLIFY_TOLERANCES, SIMPLIFIED_GEOMETRY_DIR, TRACT_MAP_FILE,
+                        shift_longitudes, simplify_coverage, simplified_geometry_path,
+                        layer_sources, level_sources_path, level_is_current)
+
+
+def load_tracts(config):
+    path = os.path.join(config["workspace"], TRACT_MAP_FILE)
+    gdf = gpd.read_parquet(path, columns=["GEOID20", "geometry"])
+    return gdf, None
+
+
+def load_blocks(config):
+    path = os.path.join(config["census_data_2020"], "us_census_blocks_2020.geoparquet")
+    gdf = gpd.read_parquet(path, columns=["GEOID20", "STATEFP20", "geometry"])
+    gdf["geometry"] = shift_longitudes(gdf.geometry)
+    # Blocks only form a coverage within a state, and per-state batches bound memory use
+    return gdf, "STATEFP20"
+
+
+LAYERS = {"tract": load_tracts, "block": load_blocks}
+
+
+def write_level(gdf, group_column, tolerance, output_path):
+    """Simplify gdf at tolerance (per group if given) and write key + geometry"""
+    if group_column is None:
+        simplified = simplify_coverage(gdf.geometry, tolerance)
+    else:
+        parts = [simplify_coverage(group.geometry, tolerance)
+                 for _, group in tqdm(gdf.groupby(group_column, sort=True), desc=f"  tol={tolerance:g}", leave=False)]
+        simplified = pd.concat(parts).reindex(gdf.index)
+
+    out = gpd.GeoDataFrame({"GEOID20": gdf["GEOID20"].to_numpy()}, geometry=simplified.to_numpy(), crs=gdf.crs)
+    tmp_path = output_path + ".tmp"
+    out.to_parquet(tmp_path, compression="snappy", index=False)
+    os.replace(tmp_path, output_path)
+    return int(shapely.get_num_coordinates(out.geometry.values).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build simplified tract/block geometry for national maps")
+    parser.add_argument("--layers", nargs="+", choices=sorted(LAYERS), default=["tract", "block"],
+                        help="Layers to simplify (default: tract block)")
+    parser.add_argument("--tolerances", type=float, nargs="+", default=list(SIMPLIFY_TOLERANCES),
+                        help="Simplification tolerances in degrees")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Rebuild levels even if their sources are unchanged")
+    args = parser.parse_args()
+
+    # Load configuration
+    with open("setting.json") as f:
+        config = json.load(f)
+
+    os.makedirs(os.path.join(config["workspace"], SIMPLIFIED_GEOMETRY_DIR), exist_ok=True)
+
+    for layer in args.layers:
+        print(f"\n{'='*60}")
+        print(f"Layer: {layer}")
+        print(f"{'='*60}")
+        # Recorded before loading, so a source rewritten while we run marks the levels stale
+        sources = layer_sources(config, layer)
+        tolerances = [t for t in sorted(args.tolerances)
+                      if args.overwrite or not level_is_current(config, layer, t, sources)]
+        for tolerance in sorted(set(args.tolerances) - set(tolerances)):
+            print(f"✓ tol={tolerance:g}: up to date, skipping")
+        if not tolerances:
+            continue
+
+        gdf, group_column = LAYERS[layer](config)
+        full_vertices = int(shapely.get_num_coordinates(gdf.geometry.values).sum())
+        print(f"Loaded {len(gdf):,} geometries, {full_vertices:,} vertices")
+
+        for tolerance in tolerances:
+            output_path = simplified_geometry_path(config, layer, tolerance)
+            start = time.time()
+            vertices = write_level(gdf, group_column, tolerance, output_path)
+            with open(level_sources_path(config, layer, tolerance), "w") as f:
+                json.dump(sources, f, indent=2, sort_keys=True)
+            print(f"✓ tol={tolerance:g}: {vertices:,} vertices "
+                  f"({vertices / full_vertices:.1%}) in {time.time() - start:.1f}s -> {output_path}")
+
+    print("\n✓ Simplified geometry cache complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,42 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Compute Lorenz curve, Gini, and summary stats for tract-level tweet coverage.
+Compute Lorenz curve, Gini, and summary stats for block-level tweet coverage,
+pooled over the US and per state.
 
 Inputs:
   - Parquet with columns: GEOID20, T_i (tweets), P_i (population),
     CR, log2CR, mask_low_coverage  (this is your *_CR.parquet from DuckDB)
 
 Outputs:
-  - lorenz_points.csv
+  - lorenz_points.csv            (--lorenz_points evenly spaced population shares, not one row per block)
   - lorenz_curve.png
-  - prints: covered_pop_share, Gini, P10/P50/P90 of log2CR (on unmasked tracts)
+  - gini_by_state.csv            (covered_pop_share, Gini, P10/P50/P90 of log2CR per state)
+  - lorenz_points_by_state.csv
+  - prints: covered_pop_share, Gini, P10/P50/P90 of log2CR (on unmasked blocks)
+
+The Gini / Lorenz numbers come from coverage_stats on NumPy arrays: one sort by
+(state, T_i / P_i) and cumulative sums give every state, and a second pass the pooled
+curve, so memory stays at a few arrays of the block count. Gini is computed from
+every block; only the written / plotted Lorenz curve is downsampled.
 """
 
-import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
 from pathlib import Path
+import argparse
 import json
 
+from coverage_stats import representativeness_summary, lorenz_points_frame
+
+parser = argparse.ArgumentParser(description="Gini / Lorenz of tweets vs population, pooled and per state")
+parser.add_argument("--lorenz_points", type=int, default=1001,
+                    help="Lorenz points written per curve (evenly spaced population shares)")
+args = parser.parse_args()
+
 # Load configuration
 with open('setting.json') as f:
     config = json.load(f)
@@ -28,46 +46,47 @@ IN = Path(config["workspace"]) / "data/all_years_tweet_count_with_pop_CR.parquet
 OUT_DIR = Path(config["outputs_dir"]) / "gini"; OUT_DIR.mkdir(exist_ok=True, parents=True)
 
 # ---------- load ----------
-df = pd.read_parquet(IN)
+# Only the needed columns, as Arrow; the state is the first two GEOID20 characters,
+# dictionary-encoded in Arrow so no per-block Python strings are created
+table = pq.read_table(IN, columns=[c for c in ["GEOID20", "T_i", "P_i", "log2CR", "mask_low_coverage"]
+                                   if c in pq.read_schema(IN).names])
 # keep valid population
-df = df[df["P_i"] > 0].copy()
+table = table.filter(pc.greater(table["P_i"], 0))
 
+T = table["T_i"].to_numpy().astype(np.float64)
+P = table["P_i"].to_numpy().astype(np.float64)
 # if CR/log2CR not present, compute them
-if "CR" not in df.columns or "log2CR" not in df.columns:
-    T_tot = df["T_i"].sum()
-    P_tot = df["P_i"].sum()
-    df["CR"] = (df["T_i"]/T_tot) / (df["P_i"]/P_tot)
-    df["log2CR"] = np.log2(df["CR"])
-
-# split by mask (sample adequacy)
-reportable = df[df["mask_low_coverage"] == 0].copy()
-suppressed  = df[df["mask_low_coverage"] == 1].copy()
-
-# ---------- summary stats ----------
-covered_pop_share = reportable["P_i"].sum() / df["P_i"].sum()
-p10, p50, p90 = np.quantile(reportable["log2CR"].dropna(), [0.10, 0.50, 0.90])
-
-# ---------- Lorenz (on reportable tracts) ----------
-# sort by per-capita tweets
-reportable["t_per_cap"] = reportable["T_i"] / reportable["P_i"]
-reportable = reportable.sort_values("t_per_cap", kind="mergesort")  # stable sort
-
-T_cov = reportable["T_i"].sum()
-P_cov = reportable["P_i"].sum()
-
-x = reportable["P_i"].cumsum().to_numpy() / P_cov   # cumulative population share
-y = reportable["T_i"].cumsum().to_numpy() / T_cov   # cumulative tweets share
-
-# prepend origin (0,0) for a proper Lorenz polygon
-x = np.concatenate([[0.0], x])
-y = np.concatenate([[0.0], y])
-
-# trapezoid rule for area under Lorenz; Gini = 1 - 2*area
-area = np.trapz(y, x)                 # same as sum(0.5*(x_i-x_{i-1})*(y_i+y_{i-1}))
-gini = 1.0 - 2.0*area
+if "log2CR" in table.column_names:
+    log2cr = table["log2CR"].to_pandas().to_numpy(dtype=np.float64, na_value=np.nan)
+else:
+    with np.errstate(divide="ignore"):
+        log2cr = np.log2((T / T.sum()) / (P / P.sum()))
+mask = table["mask_low_coverage"].to_numpy()
+states = pc.utf8_slice_codeunits(pc.cast(table["GEOID20"], pa.string()), 0, 2).combine_chunks().dictionary_encode()
+del table
+
+# ---------- pooled (reportable blocks) ----------
+pooled, pooled_points = representativeness_summary(
+    np.zeros(len(T), dtype=np.int64), T, P, 1, log2cr=log2cr, mask=mask, n_points=args.lorenz_points)
+pooled = pooled.iloc[0]
+gini = pooled["gini"]
+p10, p50, p90 = pooled["log2CR_p10"], pooled["log2CR_p50"], pooled["log2CR_p90"]
 
 # save Lorenz points
-pd.DataFrame({"cum_pop_share": x, "cum_tweet_share": y}).to_csv(OUT_DIR/"lorenz_points.csv", index=False)
+lorenz = lorenz_points_frame(pooled_points)
+lorenz.to_csv(OUT_DIR/"lorenz_points.csv", index=False)
+x, y = lorenz["cum_pop_share"].to_numpy(), lorenz["cum_tweet_share"].to_numpy()
+
+# ---------- per state (one sort for all states) ----------
+state_codes = states.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+state_labels = np.asarray(states.dictionary.to_pylist(), dtype=object)
+by_state, state_points = representativeness_summary(
+    state_codes, T, P, len(state_labels), log2cr=log2cr, mask=mask, n_points=args.lorenz_points)
+by_state.insert(0, "state", state_labels)
+order = np.argsort(state_labels)
+by_state, state_points, state_labels = by_state.iloc[order], state_points[order], state_labels[order]
+by_state.to_csv(OUT_DIR/"gini_by_state.csv", index=False)
+lorenz_points_frame(state_points, state_labels, "state").to_csv(OUT_DIR/"lorenz_points_by_state.csv", index=False)
 
 # ---------- plot ----------
 fig, ax = plt.subplots(figsize=(5.5, 5.0), constrained_layout=True)
@@ -83,10 +102,13 @@ ax.text(0.60, 0.08, f"Gini = {gini:.3f}", fontsize=11,
 fig.savefig(OUT_DIR/"lorenz_curve.png", dpi=300)
 
 # ---------- print summary ----------
+n_total, n_reportable = int(pooled["n_blocks"]), int(pooled["n_reportable"])
 print("\n=== Technical Validation (coverage/representativeness) ===")
-print(f"Tracts total       : {len(df):,}")
-print(f"Tracts reportable  : {len(reportable):,} ({len(reportable)/len(df):.1%} of tracts)")
-print(f"Covered pop. share : {covered_pop_share:.3%}")          # population still covered after masking
+print(f"Blocks total       : {n_total:,}")
+print(f"Blocks reportable  : {n_reportable:,} ({n_reportable/n_total:.1%} of blocks)")
+print(f"Covered pop. share : {pooled['covered_pop_share']:.3%}")  # population still covered after masking
 print(f"Gini (reportable)  : {gini:.3f}")                       # inequality of tweet allocation vs population
 print(f"log2(CR) quantiles : P10={p10:.2f}, P50={p50:.2f}, P90={p90:.2f}  (reportable)")
+print(f"Gini by state      : min={by_state['gini'].min():.3f}, "
+      f"median={by_state['gini'].median():.3f}, max={by_state['gini'].max():.3f} ({len(by_state)} states)")
 print(f"Outputs saved to   : {OUT_DIR.resolve()}")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CR, log2CR and Gini / Lorenz per year and per rolling window, in one pass.
+
+0.4.7 computes the representativeness numbers for the pooled years only; getting a
+time series meant re-running it on one slice at a time. Here the per-year CR table
+of 0.4.2 (--per_year; one scan of the day files) is read once and coverage_stats
+computes every year and every rolling window together: one sort by
+(group, T_i / P_i), cumulative sums per group and bincount.
+
+Inputs:
+  - data/per_year_tweet_count_with_pop_CR.parquet   (year, GEOID20, T_i, P_i, ...)
+
+Outputs (outputs/gini):
+  - representativeness_by_year.csv         year, n_blocks, n_reportable, covered_pop_share,
+                                           gini, log2CR_p10 / p50 / p90
+  - representativeness_by_<w>y_window.csv  same per window (window_start, window_end)
+  - gini_time_series.png
+  - data/rolling_<w>y_tweet_count_with_pop_CR.parquet  (with --window_cr)
+
+Per year, the CR / log2CR / mask columns of the 0.4.2 table are used as they are. Per
+window, CR and the mask are recomputed from the summed T_i with totals over every
+block of the window (zero-population blocks included, as in 0.4.2) before blocks
+without population are dropped for the Gini / quantiles. The window CSV is always
+written (empty when there are fewer years than --window), so Snakemake finds it.
+
+Usage:
+    python 0.4.8-representativeness-time-series.py
+    python 0.4.8-representativeness-time-series.py --window 3 --window_cr
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from coverage_stats import (group_codes, coverage_ratio, rolling_window_rows, sum_by_key,
+                            representativeness_summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-year and rolling-window CR / Gini time series")
+    parser.add_argument("--window", type=int, default=3, help="Rolling window width in years (0: per year only)")
+    parser.add_argument("--window_cr", action="store_true",
+                        help="Also write the per-window block CR table (parquet)")
+    args = parser.parse_args()
+
+    # Load configuration
+    with open("setting.json") as f:
+        config = json.load(f)
+
+    data_dir = os.path.join(config["workspace"], "data")
+    out_dir = os.path.join(config["outputs_dir"], "gini")
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.time()
+    df = pd.read_parquet(os.path.join(data_dir, "per_year_tweet_count_with_pop_CR.parquet"),
+                         columns=["year", "GEOID20", "T_i", "P_i", "log2CR", "mask_low_coverage"])
+    years = df["year"].to_numpy()
+    T = df["T_i"].to_numpy(dtype=np.float64)
+    P = df["P_i"].to_numpy(dtype=np.float64, na_value=np.nan)
+    log2cr = df["log2CR"].to_numpy(dtype=np.float64, na_value=np.nan)
+    mask = df["mask_low_coverage"].to_numpy()
+    print(f"Loaded {len(df):,} (year, block) rows in {time.time() - start:.1f}s")
+
+    # ---------- per year ----------
+    year_codes, year_labels = group_codes(years)
+    # per-year CR of 0.4.2 (T_tot over every block of the year)
+    by_year, _ = representativeness_summary(year_codes, T, P, len(year_labels), log2cr=log2cr, mask=mask)
+    by_year.insert(0, "year", year_labels)
+    by_year.to_csv(os.path.join(out_dir, "representativeness_by_year.csv"), index=False)
+    print("\n=== Representativeness per year ===")
+    print(by_year.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    # ---------- rolling windows ----------
+    by_window = None
+    n_years = len(year_labels)
+    window_path = os.path.join(out_dir, f"representativeness_by_{args.window}y_window.csv")
+    if args.window and args.window > n_years:
+        print(f"\nWindow of {args.window} years is longer than the {n_years} years available; "
+              f"writing an empty {os.path.basename(window_path)}")
+        pd.DataFrame(columns=["window_start", "window_end"] + list(by_year.columns[1:])).to_csv(
+            window_path, index=False)
+    elif args.window:
+        block_codes, block_labels = group_codes(df["GEOID20"].to_numpy())
+        # P_i is a property of the block, so one value per block covers every window
+        block_pop = np.full(len(block_labels), np.nan)
+        block_pop[block_codes] = P
+
+        rows, window_start = rolling_window_rows(years, args.window)
+        w_start, w_block, w_T = sum_by_key(window_start, block_codes[rows], T[rows])
+        w_P = block_pop[w_block]
+
+        window_codes, window_labels = group_codes(w_start)
+        # CR on every block of the window first, then the summary drops P <= 0
+        cr, w_log2cr, w_mask = coverage_ratio(window_codes, w_T, w_P, len(window_labels))
+        by_window, _ = representativeness_summary(window_codes, w_T, w_P, len(window_labels),
+                                                  log2cr=w_log2cr, mask=w_mask)
+        by_window.insert(0, "window_start", window_labels)
+        by_window.insert(1, "window_end", window_labels + args.window - 1)
+        by_window.to_csv(window_path, index=False)
+        print(f"\n=== Representativeness per {args.window}-year window ===")
+        print(by_window.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+        if args.window_cr:
+            out = pd.DataFrame({
+                "window_start": w_start, "window_end": w_start + args.window - 1,
+                "GEOID20": block_labels[w_block], "T_i": w_T, "P_i": w_P,
+                "CR": cr, "log2CR": w_log2cr, "mask_low_coverage": w_mask,
+            })
+            path = os.path.join(data_dir, f"rolling_{args.window}y_tweet_count_with_pop_CR.parquet")
+            out.to_parquet(path, index=False)
+            print(f"✓ Window CR table: {len(out):,} rows -> {path}")
+
+    # ---------- plot ----------
+    fig, ax = plt.subplots(figsize=(6.5, 4.0), constrained_layout=True)
+    ax.plot(by_year["year"], by_year["gini"], "o-", lw=2, label="Per year")
+    if by_window is not None:
+        centers = (by_window["window_start"] + by_window["window_end"]) / 2
+        ax.plot(centers, by_window["gini"], "s--", lw=1.5, label=f"{args.window}-year window (centered)")
+    ax.set_xlabel("Year")
+    ax.set_ylabel("Gini (reportable blocks)")
+    ax.set_xticks(by_year["year"])
+    ax.grid(alpha=0.2)
+    ax.legend(loc="best")
+    fig.savefig(os.path.join(out_dir, "gini_time_series.png"), dpi=300)
+
+    print(f"\n✓ Time series complete in {time.time() - start:.1f}s")
+    print(f"Outputs saved to   : {os.path.abspath(out_dir)}")
+
+
+if __name__ == "__main__":
+    main()
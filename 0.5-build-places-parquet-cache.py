@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Convert the CDC PLACES tract release CSVs into a typed parquet cache.
+
+Each PLACES__Census_Tract_Data_(GIS_Friendly_Format)_<year>_release_*.csv in
+places_data becomes <workspace>/data/places_cache/release_year=<year>/part-0.parquet
+(tract_id int64, TotalPopulation and all *_CrudePrev measures as float32).
+Releases whose CSV is unchanged since the last run (size + mtime in manifest.json)
+are skipped, so this is cheap to run before every correlation step.
+
+0.6 calls the same update itself; 0.6.1 reads the partitions with read_parquet.
+
+Usage:
+    python 0.5-build-places-parquet-cache.py
+    python 0.5-build-places-parquet-cache.py --rebuild
+"""
+
+import json
+import time
+import argparse
+
+from places_io import ensure_places_cache, places_cache_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the PLACES parquet cache")
+    parser.add_argument("--rebuild", action="store_true", help="Reconvert every release even if unchanged")
+    args = parser.parse_args()
+
+    # Load configuration
+    with open("setting.json") as f:
+        config = json.load(f)
+
+    start = time.time()
+    releases = ensure_places_cache(config, rebuild=args.rebuild)
+
+    print(f"\n{'='*60}")
+    print(f"PLACES cache: {places_cache_dir(config)}")
+    print(f"{'='*60}")
+    for year, entry in sorted(releases.items()):
+        print(f"  {year}: {entry['rows']:,} tracts  <- {entry['source']}")
+    print(f"\n✓ {len(releases)} releases up to date in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,10 @@ For each year, join tract-level sentiment with CDC PLACES (tract GIS-friendly wi
 compute Spearman/Pearson correlations (unweighted & population-weighted),
 and plot scatter + decile curve. Saves per-year PNGs and a CSV summary.
 
+Besides the MHLTH target and the discriminant, every *_CrudePrev measure is screened
+in one vectorized pass per year (correlation_stats.correlation_table) and written to
+places_correlation_all_measures.csv.
+
 Edit the PATHS below to your files.
 """
 
@@ -12,22 +16,19 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
-from typing import Dict
 import json
 
+from correlation_stats import correlation_table, binned_statistics
+from places_io import ensure_places_cache, load_places_release
+
 # Load configuration
 with open('setting.json') as f:
     config = json.load(f)
 
 # ========== PATHS: 修改为你的本地路径 ==========
-places_data_dir = Path(config["places_data"])
-PLACES_FILES: Dict[int, str] = {
-    2020: str(places_data_dir / "PLACES__Census_Tract_Data_(GIS_Friendly_Format),_2020_release_20250903.csv"),
-    2021: str(places_data_dir / "PLACES__Census_Tract_Data_(GIS_Friendly_Format),_2021_release_20250903.csv"),
-    2022: str(places_data_dir / "PLACES__Census_Tract_Data_(GIS_Friendly_Format),_2022_release_20250903.csv"),
-    2023: str(places_data_dir / "PLACES__Census_Tract_Data_(GIS_Friendly_Format),_2023_release_20250903.csv"),
-    2024: str(places_data_dir / "PLACES__Census_Tract_Data_(GIS_Friendly_Format),_2024_release_20250903.csv"),
-}
+# PLACES 各年发布版从 0.5 的 parquet 缓存读取（CSV 有变化时自动重新转换）
+# 分析年份：setting.json 的 analysis_years（与 Snakefile ANALYSIS_YEARS 一致），未设置时用全部发布年
+PLACES_YEARS = config.get("analysis_years", [2020, 2021, 2022, 2023, 2024])
 # 你每年的情感数据（tract 级）：文件名或模板
 SENT_DIR = Path(config["sentiment_by_tract"])
 SENT_PATTERN = "tract_sentiment_{year}.parquet"  # 文件需含列：GEOID20_tract, sent_mean, mask_low_coverage[, n_tweets]
@@ -41,21 +42,18 @@ TARGET_COL = "MHLTH_CrudePrev"
 DISCRIM_COL = "MAMMOUSE_CrudePrev"
 
 # ========== 工具函数 ==========
-def load_places(path: str) -> pd.DataFrame:
-    usecols = ["TractFIPS", "TotalPopulation", TARGET_COL, DISCRIM_COL]
-    df = pd.read_csv(path, usecols=usecols, dtype={"TractFIPS": str})
-    df.rename(columns={
-        "TractFIPS": "GEOID20_tract",
-        "TotalPopulation": "pop",
-        TARGET_COL: "mhlth",
-        DISCRIM_COL: "disc"
-    }, inplace=True)
-    # 规范类型
-    df["GEOID20_tract"] = df["GEOID20_tract"].str.zfill(11)
-    for c in ["mhlth", "disc", "pop"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+def load_places(year: int) -> pd.DataFrame:
+    # 全部 *_CrudePrev 指标（用于全指标筛查），目标/对照另存为 mhlth / disc
+    df = load_places_release(config, year)
+    df.rename(columns={"TotalPopulation": "pop"}, inplace=True)
+    df["mhlth"] = df[TARGET_COL]
+    df["disc"] = df[DISCRIM_COL]
     return df
 
+def measure_columns(df: pd.DataFrame) -> list:
+    """PLACES 粗患病率指标列（*_CrudePrev）。"""
+    return [c for c in df.columns if c.endswith("_CrudePrev")]
+
 def load_sentiment_tract(year: int) -> pd.DataFrame:
     """读取你准备的 'tract_sentiment_{year}.parquet'；如不存在，抛错。"""
     f = SENT_DIR / SENT_PATTERN.format(year=year)
@@ -94,72 +92,36 @@ def aggregate_block_to_tract(block_df: pd.DataFrame, year: int) -> pd.DataFrame:
     ).reset_index(drop=True)
     return grp
 
-def weighted_corr(x, y, w):
-    """人口加权 Pearson 相关。"""
-    x, y, w = map(lambda s: pd.Series(s, dtype=float), (x, y, w))
-    m_x = np.sum(w * x) / np.sum(w); m_y = np.sum(w * y) / np.sum(w)
-    cov = np.sum(w * (x - m_x) * (y - m_y))
-    varx = np.sum(w * (x - m_x)**2); vary = np.sum(w * (y - m_y)**2)
-    return cov / np.sqrt(varx * vary)
-
-def rank_spearman(x, y):
-    """无权 Spearman（用平均秩+Pearson）。"""
-    rx = pd.Series(x).rank(method="average")
-    ry = pd.Series(y).rank(method="average")
-    return np.corrcoef(rx, ry)[0,1]
-
-def weighted_spearman(x, y, w):
-    """人口加权 Spearman（对秩做加权 Pearson）。"""
-    rx = pd.Series(x).rank(method="average")
-    ry = pd.Series(y).rank(method="average")
-    return weighted_corr(rx, ry, w)
-
-def decile_curve(x, y, w=None, q=10):
-    """按 x 的分位数分箱，返回每箱 x 中位数与 y 的（加权）均值。"""
-    df = pd.DataFrame({"x": x, "y": y})
-    if w is not None:
-        df["w"] = w
-    # 分箱
-    df = df.dropna()
-    df["bin"] = pd.qcut(df["x"], q=q, duplicates="drop")
-    agg = (df.groupby("bin")
-           .apply(lambda g: pd.Series({
-               "x_med": g["x"].median(),
-               "y_mean": np.average(g["y"], weights=(g["w"] if "w" in g.columns else None))
-           }))
-           .sort_values("x_med")
-           .reset_index(drop=True))
-    return agg
-
 # ========== 主流程 ==========
-years = sorted(PLACES_FILES.keys())
+ensure_places_cache(config)
+years = sorted(PLACES_YEARS)
 rows = []
+screen_rows = []
 
 for year in years:
     print(f"\n=== {year} ===")
-    places = load_places(PLACES_FILES[year])
+    places = load_places(year)
 
     # 情感：如果已有 tract 文件，用 load_sentiment_tract(year)；若只有 block，请先聚合（见上）
     senti = load_sentiment_tract(year)
 
     # 合并与过滤
     df = senti.merge(places, on="GEOID20_tract", how="inner")
-    df = df[(df["mask_low_coverage"] == 0) & df["pop"].notna() & df["mhlth"].notna() & df["sent_mean"].notna()]
+    df = df[(df["mask_low_coverage"] == 0) & df["pop"].notna() & df["sent_mean"].notna()]
+
+    # 全指标筛查：一次矩阵运算得到所有 *_CrudePrev 的（加权）Pearson / Spearman，缺失按指标剔除
+    screen = correlation_table(df["sent_mean"], df[measure_columns(df)], df["pop"])
+    screen_rows.append(screen.reset_index().assign(year=year))
+
+    df = df[df["mhlth"].notna()]
     if df.empty:
         print("No data after filtering; check inputs.")
         continue
 
-    # 相关系数
-    pear_u = df[["sent_mean", "mhlth"]].corr().iloc[0,1]
-    spear_u = rank_spearman(df["sent_mean"], df["mhlth"])
-    pear_w = weighted_corr(df["sent_mean"], df["mhlth"], df["pop"])
-    spear_w = weighted_spearman(df["sent_mean"], df["mhlth"], df["pop"])
-
-    # 判别（对照指标）
-    pear_u_disc = df[["sent_mean", "disc"]].corr().iloc[0,1]
-    spear_u_disc = rank_spearman(df["sent_mean"], df["disc"])
-    pear_w_disc = weighted_corr(df["sent_mean"], df["disc"], df["pop"])
-    spear_w_disc = weighted_spearman(df["sent_mean"], df["disc"], df["pop"])
+    # 相关系数（目标 + 判别对照）
+    table = correlation_table(df["sent_mean"], df[["mhlth", "disc"]], df["pop"])
+    pear_u, spear_u, pear_w, spear_w = table.loc["mhlth", ["pearson", "spearman", "pearson_w", "spearman_w"]]
+    pear_u_disc, spear_u_disc, pear_w_disc, spear_w_disc = table.loc["disc", ["pearson", "spearman", "pearson_w", "spearman_w"]]
 
     print(f"N={len(df):,}   Pearson={pear_u:.3f} (w={pear_w:.3f})   Spearman={spear_u:.3f} (w={spear_w:.3f})")
     print(f"Discriminant → Pearson={pear_u_disc:.3f} (w={pear_w_disc:.3f})   Spearman={spear_u_disc:.3f} (w={spear_w_disc:.3f})")
@@ -175,7 +137,7 @@ for year in years:
     # —— 散点 + 十等分曲线 —— #
     # 为降低绘图负担，可抽样 100k（如需要）
     plot_df = df.sample(n=min(len(df), 100_000), random_state=42)
-    curve = decile_curve(df["mhlth"], df["sent_mean"], w=df["pop"], q=10)
+    curve = binned_statistics(df["mhlth"], df["sent_mean"], w=df["pop"], q=10)
 
     fig, ax = plt.subplots(figsize=(6.2, 5.4))
     ax.scatter(plot_df["mhlth"], plot_df["sent_mean"], s=3, alpha=0.15)  # 默认配色，避免指定颜色
@@ -198,3 +160,10 @@ for year in years:
 summary = pd.DataFrame(rows).sort_values("year")
 summary.to_csv(OUT_DIR / "places_correlation_summary.csv", index=False)
 print("\nSaved:", (OUT_DIR / 'places_correlation_summary.csv').resolve())
+
+# —— 全指标筛查表（年 × 指标） —— #
+if screen_rows:
+    screen = pd.concat(screen_rows, ignore_index=True)
+    screen = screen[["year", "measure", "N", "pearson", "pearson_w", "spearman", "spearman_w"]]
+    screen.to_csv(OUT_DIR / "places_correlation_all_measures.csv", index=False)
+    print("Saved:", (OUT_DIR / 'places_correlation_all_measures.csv').resolve())
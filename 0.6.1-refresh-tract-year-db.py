@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Materialize the 0.6.1 tract-year tables in a persistent DuckDB database, incrementally.
+
+0.6.1-agg-to-track-level-interactive.sql used to rebuild daily -> block_year ->
+tract_year (and places_all) in memory from every *day*.parquet on each run. This
+script keeps them in <workspace>/data/tract_year.duckdb and only recomputes a year
+when the day files that contain it were added, changed (size / mtime) or removed:
+
+    daily        year, GEOID20_block, t, s                       (per day, per block)
+    block_year   year, GEOID20_block, tweets_year_block, sent_mean_year_block, mask_lowcov_block
+    tract_year   year, GEOID20_tract, tweets_year_tract, sent_mean_year_tract, mask_low_coverage
+    places_all   release_year, GEOID20_tract, pop, mhlth, mammouse, *_CrudePrev
+    day_files    file, size, mtime_ns, year                      (what each year was built from)
+    refresh_meta key, value                                      (PLACES cache signature)
+
+Only analysis_years from setting.json (or --years) are refreshed; day files of other
+years are skipped by file name and never scanned.
+
+Each year is replaced in one transaction, so an interrupted run leaves every year
+either fully old or fully new. The 0.6.1 SQL then runs against this database
+(duckdb <db> < 0.6.1-agg-to-track-level-interactive.sql) and only does the join.
+
+Usage:
+    python 0.6.1-refresh-tract-year-db.py
+    python 0.6.1-refresh-tract-year-db.py --rebuild
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+
+import duckdb
+
+from places_io import ensure_places_cache, places_cache_dir
+
+TRACT_YEAR_DB = 'data/tract_year.duckdb'
+DAY_FILE_PATTERN = re.compile(r'(\d{4})_day')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily (
+    year INTEGER, GEOID20_block VARCHAR, t DOUBLE, s DOUBLE);
+CREATE TABLE IF NOT EXISTS block_year (
+    year INTEGER, GEOID20_block VARCHAR, tweets_year_block DOUBLE,
+    sent_mean_year_block DOUBLE, mask_lowcov_block INTEGER);
+CREATE TABLE IF NOT EXISTS tract_year (
+    year INTEGER, GEOID20_tract VARCHAR, tweets_year_tract DOUBLE,
+    sent_mean_year_tract DOUBLE, mask_low_coverage INTEGER);
+CREATE TABLE IF NOT EXISTS day_files (
+    file VARCHAR, size BIGINT, mtime_ns BIGINT, year INTEGER);
+CREATE TABLE IF NOT EXISTS refresh_meta (
+    key VARCHAR PRIMARY KEY, value VARCHAR);
+"""
+
+# Same aggregation as the original 0.6.1 SQL, restricted to one year
+INSERT_DAILY = """
+INSERT INTO daily
+SELECT * FROM (
+    SELECT
+        EXTRACT('year' FROM CAST(day AS DATE))::INT AS year,
+        GEOID20::VARCHAR                              AS GEOID20_block,
+        CAST(tweet_count AS DOUBLE)                   AS t,
+        CAST(avg_score  AS DOUBLE)                    AS s
+    FROM read_parquet(?)
+) WHERE year = ?
+"""
+INSERT_BLOCK_YEAR = """
+INSERT INTO block_year
+SELECT
+    year,
+    GEOID20_block,
+    SUM(t)                                   AS tweets_year_block,
+    SUM(t * s) / NULLIF(SUM(t),0)            AS sent_mean_year_block,
+    CASE WHEN SUM(t) < 20 THEN 1 ELSE 0 END  AS mask_lowcov_block
+FROM daily
+WHERE year = ?
+GROUP BY 1,2
+"""
+INSERT_TRACT_YEAR = """
+INSERT INTO tract_year
+SELECT
+    year,
+    SUBSTR(GEOID20_block, 1, 11)                   AS GEOID20_tract,
+    SUM(tweets_year_block)                         AS tweets_year_tract,
+    SUM(tweets_year_block * sent_mean_year_block)
+      / NULLIF(SUM(tweets_year_block),0)           AS sent_mean_year_tract,
+    CASE WHEN SUM(tweets_year_block) < 20 THEN 1 ELSE 0 END AS mask_low_coverage
+FROM block_year
+WHERE year = ?
+GROUP BY 1,2
+"""
+CREATE_PLACES_ALL = """
+CREATE OR REPLACE TABLE places_all AS
+SELECT
+    release_year::INT                                      AS release_year,
+    lpad(tract_id::VARCHAR, 11, '0')                       AS GEOID20_tract,
+    CAST(TotalPopulation AS DOUBLE)                        AS pop,
+    CAST(MHLTH_CrudePrev AS DOUBLE)                        AS mhlth,
+    CAST(MAMMOUSE_CrudePrev AS DOUBLE)                     AS mammouse,
+    CAST(COLUMNS('.*_CrudePrev') AS DOUBLE)
+FROM read_parquet(?, hive_partitioning=true, union_by_name=true)
+"""
+
+
+def list_day_files(directory, years=None):
+    """
+    *day*.parquet files in the statistics directory with (size, mtime_ns)
+
+    With years, files whose name carries a year outside years are skipped here, so
+    they are never opened or scanned.
+    """
+    files = {}
+    for entry in os.scandir(directory):
+        if entry.is_file() and 'day' in entry.name and entry.name.endswith('.parquet'):
+            match = DAY_FILE_PATTERN.search(entry.name)
+            if years is not None and match and int(match.group(1)) not in years:
+                continue
+            st = entry.stat()
+            files[entry.path] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def file_years(con, path, known):
+    """Years contained in a day file: from the file name, the manifest, or a scan"""
+    match = DAY_FILE_PATTERN.search(os.path.basename(path))
+    if match:
+        return [int(match.group(1))]
+    if known:
+        return known
+    rows = con.execute("SELECT DISTINCT EXTRACT('year' FROM CAST(day AS DATE))::INT FROM read_parquet(?)",
+                       [path]).fetchall()
+    return sorted(r[0] for r in rows)
+
+
+def plan_refresh(con, files, rebuild=False, years=None):
+    """
+    Compare the day files on disk with day_files
+
+    With years, only those years are planned; other years in the database are left
+    as they are.
+
+    Returns:
+        (new manifest rows, years to rebuild, years to drop)
+    """
+    old_rows = [r for r in con.execute("SELECT file, size, mtime_ns, year FROM day_files").fetchall()
+                if years is None or r[3] in years]
+    old_years_by_file = {}
+    for file, size, mtime_ns, year in old_rows:
+        if files.get(file) == (size, mtime_ns):
+            old_years_by_file.setdefault(file, []).append(year)
+
+    manifest = []
+    for path, (size, mtime_ns) in sorted(files.items()):
+        for year in file_years(con, path, old_years_by_file.get(path)):
+            if years is None or year in years:
+                manifest.append((path, size, mtime_ns, year))
+
+    def by_year(rows):
+        groups = {}
+        for file, size, mtime_ns, year in rows:
+            groups.setdefault(year, set()).add((file, size, mtime_ns))
+        return groups
+
+    old, new = by_year(old_rows), by_year(manifest)
+    rebuild_years = sorted(y for y in new if rebuild or old.get(y) != new[y])
+    drop_years = sorted(set(old) - set(new))
+    return manifest, rebuild_years, drop_years
+
+
+def refresh_year(con, year, manifest):
+    """Replace one year in daily / block_year / tract_year and its manifest rows"""
+    files = sorted(row[0] for row in manifest if row[3] == year)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for table in ("daily", "block_year", "tract_year", "day_files"):
+            con.execute(f"DELETE FROM {table} WHERE year = ?", [year])
+        if files:
+            con.execute(INSERT_DAILY, [files, year])
+            con.execute(INSERT_BLOCK_YEAR, [year])
+            con.execute(INSERT_TRACT_YEAR, [year])
+            con.executemany("INSERT INTO day_files VALUES (?, ?, ?, ?)", [r for r in manifest if r[3] == year])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+def refresh_places(con, config, rebuild=False):
+    """Rebuild places_all when the PLACES parquet cache changed"""
+    releases = ensure_places_cache(config)
+    signature = json.dumps(releases, sort_keys=True)
+    row = con.execute("SELECT value FROM refresh_meta WHERE key = 'places'").fetchone()
+    if not rebuild and row is not None and row[0] == signature:
+        return False
+    con.execute(CREATE_PLACES_ALL, [os.path.join(places_cache_dir(config), '*', '*.parquet')])
+    con.execute("INSERT OR REPLACE INTO refresh_meta VALUES ('places', ?)", [signature])
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally refresh the persistent tract-year DuckDB database")
+    parser.add_argument("--db", type=str, default=None,
+                        help=f"Database file (default: <workspace>/{TRACT_YEAR_DB})")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute every year and places_all")
+    parser.add_argument("--threads", type=int, default=None, help="DuckDB threads (default: all CPUs)")
+    parser.add_argument("--years", type=int, nargs="+", default=None,
+                        help="Years to refresh (default: analysis_years in setting.json, else all)")
+    args = parser.parse_args()
+
+    # Load configuration
+    with open("setting.json") as f:
+        config = json.load(f)
+
+    db_path = args.db or os.path.join(config["workspace"], TRACT_YEAR_DB)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    con = duckdb.connect(db_path)
+    if args.threads:
+        con.execute(f"SET threads = {args.threads}")
+    con.execute(SCHEMA)
+
+    years = args.years or config.get("analysis_years")
+    years = set(years) if years else None
+    files = list_day_files(config["statistic_results"], years)
+    manifest, rebuild_years, drop_years = plan_refresh(con, files, args.rebuild, years)
+
+    print(f"\n{'='*60}")
+    print(f"Tract-year database: {db_path}")
+    print(f"{'='*60}")
+    print(f"Analysis years: {sorted(years) if years else 'all'}")
+    print(f"Day files: {len(files)}, years: {len({r[3] for r in manifest})}")
+    print(f"Years to rebuild: {rebuild_years or 'none'}")
+    if drop_years:
+        print(f"Years without day files (dropped): {drop_years}")
+
+    for year in drop_years + rebuild_years:
+        start = time.time()
+        refresh_year(con, year, manifest)
+        n_tracts = con.execute("SELECT COUNT(*) FROM tract_year WHERE year = ?", [year]).fetchone()[0]
+        print(f"✓ {year}: {n_tracts:,} tracts in {time.time() - start:.1f}s")
+
+    if refresh_places(con, config, args.rebuild):
+        print(f"✓ places_all rebuilt: {con.execute('SELECT COUNT(*) FROM places_all').fetchone()[0]:,} rows")
+    else:
+        print("places_all up to date")
+
+    con.execute("CHECKPOINT")
+    con.close()
+    print("\n✓ Tract-year database up to date!")
+
+
+if __name__ == "__main__":
+    main()
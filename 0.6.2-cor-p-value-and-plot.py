@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import pandas as pd, numpy as np
+import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-from scipy import stats
-from statsmodels.stats.weightstats import DescrStatsW
 from pathlib import Path
+import argparse
 import json
 
+from correlation_stats import correlation_table, correlation_uncertainty, binned_statistics, CORRELATION_COLUMNS
+
+parser = argparse.ArgumentParser(description='Sentiment vs. PLACES correlations with bootstrap CIs / permutation p-values')
+parser.add_argument('--n_boot', type=int, default=2000, help='Bootstrap resamples per year (0 to skip, default: 2000)')
+parser.add_argument('--n_perm', type=int, default=2000, help='Permutations per year (0 to skip, default: 2000)')
+parser.add_argument('--cluster', choices=['none', 'state'], default='none',
+                    help='state: resample whole states (statefp) and permute within states')
+parser.add_argument('--workers', type=int, default=None, help='Worker processes for resampling (default: all CPUs)')
+parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+args = parser.parse_args()
+
 # Load configuration
 with open('setting.json') as f:
     config = json.load(f)
@@ -31,42 +41,41 @@ df = df.query("mask_low_coverage == 0").copy()
 df = df.dropna(subset=["sent_mean_year_tract","mhlth","pop"])
 df["statefp"] = df["GEOID20_tract"].astype(str).str[:2]
 
-# --- 相关系数（库函数版） ---
-def w_pearson(x, y, w):
-    # 用 statsmodels 的权重相关（也可改用 np.cov(aweights=...)）
-    dsw = DescrStatsW(np.column_stack([x, y]), weights=w, ddof=0)
-    return dsw.corrcoef[0,1]
-
-def w_spearman(x, y, w):
-    # 加权 Spearman = 对秩做加权 Pearson
-    rx = stats.rankdata(x, method="average")
-    ry = stats.rankdata(y, method="average")
-    return w_pearson(rx, ry, w)
-
-def summarize_group(g: pd.DataFrame) -> pd.Series:
-    x, y, w = g["sent_mean_year_tract"].to_numpy(), g["mhlth"].to_numpy(), g["pop"].to_numpy()
-    pear   = g["sent_mean_year_tract"].corr(g["mhlth"], method="pearson")   # 无权
-    spear  = g["sent_mean_year_tract"].corr(g["mhlth"], method="spearman")  # 无权
-    wpear  = w_pearson(x, y, w)                                             # 加权
-    wspear = w_spearman(x, y, w)                                            # 加权
-    return pd.Series(dict(N=len(g), pearson=pear, spearman=spear,
-                          pearson_w=wpear, spearman_w=wspear))
-
-summary = df.groupby("year", sort=True, group_keys=False).apply(summarize_group, include_groups=False).reset_index()
+# --- 相关系数（向量化：所有指标 × 四种相关一次算完） ---
+MEASURES = [c for c in df.columns if c.endswith("_CrudePrev")]
+
+def summarize_group(g: pd.DataFrame, cols=("mhlth",)) -> pd.DataFrame:
+    # 无权 / 人口加权 Pearson、Spearman（加权 Spearman = 对秩做加权 Pearson）
+    return correlation_table(g["sent_mean_year_tract"], g[list(cols)], g["pop"])
+
+summary = (df.groupby("year", sort=True)
+             .apply(lambda g: summarize_group(g).loc["mhlth", CORRELATION_COLUMNS], include_groups=False)
+             .reset_index())
+summary["N"] = summary["N"].astype(int)
 Path(OUT_DIR).mkdir(parents=True, exist_ok=True)
 summary.to_csv(f"{OUT_DIR}/places_correlation_summary.csv", index=False)
 
-# --- 十分位“人口加权均值”曲线（作为平滑趋势线） ---
-def decile_curve_xy(g: pd.DataFrame, x_col="mhlth", y_col="sent_mean_year_tract", w_col="pop", q=10):
-    d = g[[x_col, y_col, w_col]].dropna().copy()
-    d["bin"] = pd.qcut(d[x_col], q=q, duplicates="drop")
-    out = (d.groupby("bin")
-             .apply(lambda s: pd.Series({
-                 "x_med": s[x_col].median(),
-                 "y_wmean": np.average(s[y_col], weights=s[w_col])
-             }), include_groups=False)
-             .sort_values("x_med").reset_index(drop=True))
-    return out
+# --- 不确定性：bootstrap 置信区间 + 置换检验 p 值（四种相关一起算） ---
+if args.n_boot > 0 or args.n_perm > 0:
+    unc = []
+    for y, g in df.groupby("year", sort=True):
+        u = correlation_uncertainty(g["sent_mean_year_tract"], g["mhlth"], g["pop"],
+                                    n_boot=args.n_boot, n_perm=args.n_perm,
+                                    clusters=(g["statefp"] if args.cluster == "state" else None),
+                                    seed=args.seed, workers=args.workers)
+        print(f"\n=== {y} (bootstrap {args.n_boot}, permutations {args.n_perm}, cluster={args.cluster}) ===")
+        print(u.round(4).to_string())
+        unc.append(u.reset_index().assign(year=y))
+    unc = pd.concat(unc, ignore_index=True)
+    unc = unc[["year", "variant"] + [c for c in unc.columns if c not in ("year", "variant")]]
+    unc.to_csv(f"{OUT_DIR}/places_correlation_uncertainty.csv", index=False)
+
+# 全指标筛查（0.6.1 联结表里的全部 *_CrudePrev，缺失按指标剔除）
+if MEASURES:
+    screen = pd.concat([summarize_group(g, MEASURES).reset_index().assign(year=y)
+                        for y, g in df.groupby("year", sort=True)], ignore_index=True)
+    screen = screen[["year", "measure"] + CORRELATION_COLUMNS]
+    screen.to_csv(f"{OUT_DIR}/places_correlation_all_measures.csv", index=False)
 
 # --- 画：每年一张（散点 + LOWESS + 十分位曲线） ---
 sns.set_theme(context="talk", style="whitegrid")  # seaborn 主题与风格。:contentReference[oaicite:1]{index=1}
@@ -85,9 +94,9 @@ for y in years:
     # LOWESS 平滑线（不画散点）
     sns.regplot(data=g, x="mhlth", y="sent_mean_year_tract",
                 lowess=True, scatter=False, line_kws=dict(lw=2), ax=ax)       # regplot/lowess。:contentReference[oaicite:3]{index=3}
-    # 人口加权十分位均值曲线
-    dc = decile_curve_xy(g)
-    sns.lineplot(x="x_med", y="y_wmean", data=dc, ax=ax, linewidth=2)
+    # 人口加权十分位均值曲线（searchsorted / bincount 分箱，无 groupby.apply）
+    dc = binned_statistics(g["mhlth"], g["sent_mean_year_tract"], w=g["pop"], q=10)
+    sns.lineplot(x="x_med", y="y_mean", data=dc, ax=ax, linewidth=2)
 
     row = summary.loc[summary["year"]==y].iloc[0]
     txt = (f"N={int(row.N):,}\n"
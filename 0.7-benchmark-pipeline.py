@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of the pipeline on synthetic data.
+
+Generates census-like state block zips, tweets, sentiment, census population and PLACES
+inputs at a chosen scale (synthetic_data.py), then runs each stage in its own subprocess
+and records wall time, throughput and peak RSS (VmHWM reported by the stage process
+itself, see peak_rss_mb):
+
+    census        state zips -> national block (Geo)Parquet    (0.3.8 main, --rebuild_parts)
+    merge         tweets .csv.gz + sentiment -> parquet        (0.2.1 merge_tweets_and_sentiment)
+    join          points in blocks, GeoPandas sjoin per state  (0.3.2 spatial_join)
+    aggregate     day / month / year statistics per block      (0.3.3 main)
+    cr            CR / log2CR in one scan, per year            (0.4.2 --per_year)
+    tract         tract-year database refresh                  (0.6.1-refresh-tract-year-db.py)
+    correlation   sentiment vs PLACES per year                 (0.6, on tract_year exports)
+
+Every stage runs the repository code. 0.2.1 and 0.3.2 spread their files over
+pandarallel on the cluster; here the same per-file functions are mapped over a
+process pool of --workers. The workspace is wiped before every repeat, so caches
+(PLACES, population, tract-year database) are always built cold.
+
+Every run is appended to --history; with --compare, each stage is checked against
+the last run at the same scale and slower / larger stages are flagged.
+
+Usage:
+    python 0.7-benchmark-pipeline.py --scale tiny
+    python 0.7-benchmark-pipeline.py --scale small --repeat 3 --compare
+    python 0.7-benchmark-pipeline.py --n_blocks 100000 --n_tweets 1000000 --stages join aggregate
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import runpy
+import shutil
+import argparse
+import importlib.util
+import subprocess
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+from synthetic_data import write_synthetic_workspace  # noqa: E402
+
+STAGES = ['census', 'merge', 'join', 'aggregate', 'cr', 'tract', 'correlation']
+SCALES = {
+    'tiny':   {'n_blocks': 2_000,     'n_tweets': 20_000,     'n_days': 3},
+    'small':  {'n_blocks': 20_000,    'n_tweets': 200_000,    'n_days': 7},
+    'medium': {'n_blocks': 200_000,   'n_tweets': 2_000_000,  'n_days': 14},
+    'large':  {'n_blocks': 1_000_000, 'n_tweets': 10_000_000, 'n_days': 30},
+}
+# Stages that run a repository script's command line (everything else calls its functions below)
+STAGE_SCRIPTS = {
+    # Parts live next to the zips and survive the workspace wipe, so always rebuild them
+    'census': ['0.3.8-merge-census-to-parquet.py', '--rebuild_parts'],
+    'cr': ['0.4.2-coverage-ratio-single-pass.py', '--per_year'],
+    'tract': ['0.6.1-refresh-tract-year-db.py'],
+}
+# Scripts that take --workers (the stage's --workers is passed on)
+WORKER_SCRIPTS = {'census'}
+HISTORY_COLUMNS = ['run_at', 'commit', 'n_blocks', 'n_tweets', 'n_days', 'years', 'repeat', 'stage',
+                   'seconds', 'peak_rss_mb', 'items', 'items_per_s', 'status']
+
+
+def load_script(file_name):
+    """Import a numbered script (hyphenated name) as a module; its __main__ block does not run"""
+    spec = importlib.util.spec_from_file_location(file_name.replace('-', '_').replace('.', '_')[:-3],
+                                                  os.path.join(REPO_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------- stage kernels (run inside the stage subprocess, cwd = benchmark root) ----------
+
+_SCRIPT = None
+_BLOCKS = None
+
+
+def init_worker(file_name, blocks=None):
+    """Pool initializer: import the stage's script (and keep one state's blocks) per worker"""
+    global _SCRIPT, _BLOCKS
+    _SCRIPT = load_script(file_name)
+    _BLOCKS = blocks
+
+
+def merge_row(row, sentiment_computing_path):
+    return _SCRIPT.merge_tweets_and_sentiment(row, sentiment_computing_path)
+
+
+def join_row(row, block_suffix):
+    _SCRIPT.spatial_join(row, _BLOCKS, block_suffix)
+
+
+def stage_merge(config, workers):
+    script = '0.2.1-combine-geo-tweets-archive-and-sentiment.py'
+    merge = load_script(script)
+    files_df = merge.list_tweet_files(config['geo_tweets_archive_base_path'], config['sentiment_file_base_path'],
+                                      config['geotweets_with_sentiment'], years=config['analysis_years'])
+    rows = files_df.to_dict('records')
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(script,)) as executor:
+        status = list(executor.map(merge_row, rows, [config.get('sentiment_computing_path')] * len(rows)))
+    failed = sum(s == 'failed' for s in status)
+    print(f"merged {len(rows) - failed} of {len(rows)} files")
+    if failed:
+        sys.exit(1)
+
+
+def stage_join(config, workers):
+    import geopandas as gpd
+
+    script = '0.3.2-xiaokang-sjoin-geopandas-us-census-script-version.py'
+    join = load_script(script)
+    files_df = join.list_input_files(config['geotweets_with_sentiment'], config['tweets_with_census_blocks'],
+                                     config['analysis_years'])
+    rows = files_df.to_dict('records')
+    census_dir = config['census_data_2020']
+    census_files = sorted(f for f in os.listdir(census_dir) if f.endswith('_tabblock20.zip'))
+    # As in 0.3.2: every tweet file is joined against one state at a time
+    for census_file_name in census_files:
+        suffix = census_file_name.split(".zip")[0]
+        block = gpd.read_file(os.path.join(census_dir, census_file_name)).to_crs("EPSG:4326")
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(script, block)) as executor:
+            list(executor.map(join_row, rows, [suffix] * len(rows)))
+    print(f"joined {len(rows)} files against {len(census_files)} states")
+
+
+def stage_aggregate(config, workers):
+    aggregation = load_script('0.3.3-xiaokang-tweets_sentiment_score_aggregation_v2.py')
+    os.makedirs(config['statistic_results'], exist_ok=True)
+    aggregation.main(config['tweets_with_census_blocks'], config['statistic_results'] + os.sep,
+                     start_year=min(config['analysis_years']), end_year=max(config['analysis_years']))
+
+
+def stage_correlation(config, workers):
+    import duckdb
+
+    # 0.6 reads tract_sentiment_{year}.parquet; export them from the tract-year database
+    os.makedirs(config['sentiment_by_tract'], exist_ok=True)
+    con = duckdb.connect(os.path.join(config['workspace'], 'data', 'tract_year.duckdb'), read_only=True)
+    for year in config['analysis_years']:
+        con.execute("""
+            SELECT GEOID20_tract, sent_mean_year_tract AS sent_mean, mask_low_coverage, tweets_year_tract AS n_tweets
+            FROM tract_year WHERE year = ?""", [year]).df().to_parquet(
+            os.path.join(config['sentiment_by_tract'], f'tract_sentiment_{year}.parquet'), index=False)
+    con.close()
+    runpy.run_path(os.path.join(REPO_DIR, '0.6-cor-with-places-500-data-sentiment.py'), run_name='__main__')
+
+
+STAGE_KERNELS = {'merge': stage_merge, 'join': stage_join, 'aggregate': stage_aggregate,
+                 'correlation': stage_correlation}
+
+
+# ---------- measurement ----------
+
+def parquet_rows(pattern):
+    """Total rows of the parquet files matching pattern (from the footers only)"""
+    import pyarrow.parquet as pq
+
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in glob.glob(pattern))
+
+
+def stage_items(stage, config, params):
+    """Number of input items of a stage (for throughput)"""
+    if stage == 'census':
+        return params['n_blocks']
+    if stage == 'merge':
+        return params['n_tweets']
+    if stage == 'join':
+        return parquet_rows(os.path.join(config['geotweets_with_sentiment'], '*', '*.parquet'))
+    if stage == 'aggregate':
+        return parquet_rows(os.path.join(config['tweets_with_census_blocks'], '*', '*.parquet'))
+    if stage in ('cr', 'tract'):
+        return parquet_rows(os.path.join(config['statistic_results'], '*day*.parquet'))
+    return parquet_rows(os.path.join(config['sentiment_by_tract'], '*.parquet'))
+
+
+def peak_rss_mb():
+    """
+    Peak RSS of this process and of its finished child processes, in MB
+
+    ru_maxrss of a freshly exec'd process starts at the RSS of the process that forked
+    it (Linux carries the old high-water mark over exec), so the parent's memory would
+    leak into every stage. VmHWM belongs to the current address space and only counts
+    memory touched since exec; ru_maxrss is the fallback where /proc is missing (macOS).
+    """
+    import resource
+
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss: bytes on macOS, KB on Linux
+    own = None
+    try:
+        with open('/proc/self/status') as f:
+            own = next(int(line.split()[1]) / 1024 for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    return max(own, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+def run_stage_worker(stage, workers, report_path):
+    """
+    Body of a stage subprocess: run the kernel or repository script, then write the
+    exit status and peak RSS to report_path
+    """
+    status = 0
+    try:
+        with open("setting.json") as f:
+            config = json.load(f)
+        if stage in STAGE_SCRIPTS:
+            script, *script_args = STAGE_SCRIPTS[stage]
+            if stage in WORKER_SCRIPTS:
+                script_args += ['--workers', str(workers)]
+            sys.argv = [script] + script_args
+            runpy.run_path(os.path.join(REPO_DIR, script), run_name='__main__')
+        else:
+            STAGE_KERNELS[stage](config, workers)
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        with open(report_path, 'w') as f:
+            json.dump({'status': status, 'peak_rss_mb': peak_rss_mb()}, f)
+    return status
+
+
+def run_stage(stage, root, workers):
+    """
+    Run one stage in a subprocess (cwd = root, so it reads the synthetic setting.json)
+
+    Returns:
+        (exit code, wall seconds, peak RSS in MB of that stage)
+    """
+    report_path = os.path.join(root, 'logs', f'{stage}.json')
+    cmd = [sys.executable, os.path.abspath(__file__), '--stage_worker', stage, '--workers', str(workers),
+           '--report', report_path]
+    env = dict(os.environ, MPLBACKEND='Agg',
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    os.makedirs(os.path.join(root, 'logs'), exist_ok=True)
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    with open(os.path.join(root, 'logs', f'{stage}.log'), 'w') as log:
+        start = time.perf_counter()
+        returncode = subprocess.run(cmd, cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+        seconds = time.perf_counter() - start
+    if not os.path.exists(report_path):
+        return returncode or 1, seconds, np.nan
+    with open(report_path) as f:
+        report = json.load(f)
+    return returncode or report['status'], seconds, report['peak_rss_mb']
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare_with_history(summary, history, params, tolerance):
+    """
+    Compare per-stage median seconds / peak RSS with the last run at the same scale
+
+    Returns:
+        List of stages slower or larger than baseline * (1 + tolerance)
+    """
+    same = history[(history['n_blocks'] == params['n_blocks']) & (history['n_tweets'] == params['n_tweets'])
+                   & (history['n_days'] == params['n_days']) & (history['years'] == params['years'])
+                   & (history['status'] == 0)]
+    if same.empty:
+        print("\nNo earlier run at this scale in the history; nothing to compare")
+        return []
+    last = same[same['run_at'] == same['run_at'].max()]
+    baseline = last.groupby('stage').agg(seconds=('seconds', 'median'), peak_rss_mb=('peak_rss_mb', 'max'))
+    print(f"\n=== Compared with {last['run_at'].iloc[0]} (commit {last['commit'].iloc[0] or '?'}) ===")
+    regressions = []
+    for stage, row in summary.iterrows():
+        if stage not in baseline.index:
+            continue
+        base = baseline.loc[stage]
+        time_ratio, rss_ratio = row['seconds'] / base['seconds'], row['peak_rss_mb'] / base['peak_rss_mb']
+        flag = time_ratio > 1 + tolerance or rss_ratio > 1 + tolerance
+        if flag:
+            regressions.append(stage)
+        print(f"  {stage:<12} time x{time_ratio:5.2f}   peak RSS x{rss_ratio:5.2f}   {'⚠ REGRESSION' if flag else 'ok'}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark on synthetic data")
+    parser.add_argument("--scale", choices=list(SCALES), default='small', help="Preset data size (default: small)")
+    parser.add_argument("--n_blocks", type=int, default=None, help="Override the number of blocks")
+    parser.add_argument("--n_tweets", type=int, default=None, help="Override the number of tweets")
+    parser.add_argument("--n_days", type=int, default=None, help="Override the day files per year")
+    parser.add_argument("--years", type=int, nargs="+", default=[2020], help="Synthetic years (default: 2020)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES,
+                        help="Stages to time (earlier stages still run untimed when their outputs are needed)")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeats per stage; the median time is reported")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for census / merge / join (default: 1)")
+    parser.add_argument("--root", type=str, default="benchmark_workspace",
+                        help="Directory for synthetic inputs and stage outputs")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument("--history", type=str, default="outputs/benchmark/pipeline_benchmark_history.csv",
+                        help="CSV that every run is appended to")
+    parser.add_argument("--compare", action="store_true", help="Compare with the last run at the same scale")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown / RSS growth flagged as a regression (default: 0.2)")
+    parser.add_argument("--fail_on_regression", action="store_true", help="Exit with status 1 on a regression")
+    parser.add_argument("--stage_worker", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--report", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage_worker:
+        # Inside a stage subprocess: cwd is the benchmark root
+        sys.exit(run_stage_worker(args.stage_worker, args.workers, args.report))
+
+    params = dict(SCALES[args.scale])
+    params.update({k: getattr(args, k) for k in ('n_blocks', 'n_tweets', 'n_days') if getattr(args, k)})
+    root = os.path.abspath(args.root)
+    start = time.time()
+    config, _ = write_synthetic_workspace(root, years=args.years, seed=args.seed, **params)
+    params['years'] = ' '.join(map(str, args.years))
+    print(f"Synthetic inputs ready in {time.time() - start:.1f}s: {root}")
+
+    # Timed stages plus every earlier stage they depend on
+    last = max(STAGES.index(s) for s in args.stages)
+    run_at = datetime.now().isoformat(timespec='seconds')
+    commit = git_commit()
+    records = []
+    for repeat in range(args.repeat):
+        shutil.rmtree(config['workspace'], ignore_errors=True)
+        shutil.rmtree(config['outputs_dir'], ignore_errors=True)
+        for stage in STAGES[:last + 1]:
+            status, seconds, peak_rss_mb = run_stage(stage, root, args.workers)
+            items = stage_items(stage, config, params) if status == 0 else 0
+            print(f"[{repeat + 1}/{args.repeat}] {stage:<12} {seconds:8.2f}s  peak RSS {peak_rss_mb:8.1f} MB  "
+                  f"{items:>12,} items  {'ok' if status == 0 else f'FAILED ({status}), see logs/{stage}.log'}")
+            if stage in args.stages:
+                records.append({'run_at': run_at, 'commit': commit, **params, 'repeat': repeat, 'stage': stage,
+                                'seconds': seconds, 'peak_rss_mb': peak_rss_mb, 'items': items,
+                                'items_per_s': items / seconds if seconds > 0 else np.nan, 'status': status})
+            if status != 0:
+                break
+
+    results = pd.DataFrame(records, columns=HISTORY_COLUMNS)
+    summary = results.groupby('stage', sort=False).agg(
+        seconds=('seconds', 'median'), peak_rss_mb=('peak_rss_mb', 'max'), items=('items', 'max'),
+        items_per_s=('items_per_s', 'median'))
+
+    print(f"\n{'='*60}")
+    print(f"Benchmark: {params['n_blocks']:,} blocks, {params['n_tweets']:,} tweets, "
+          f"{params['n_days']} days x years {params['years']} ({args.repeat} repeat(s), commit {commit or '?'})")
+    print(f"{'='*60}")
+    print(summary.to_string(float_format=lambda v: f"{v:,.2f}"))
+
+    regressions = []
+    history = pd.read_csv(args.history) if os.path.exists(args.history) else pd.DataFrame(columns=HISTORY_COLUMNS)
+    if args.compare:
+        history['years'] = history['years'].astype(str)
+        regressions = compare_with_history(summary, history, params, args.tolerance)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    results.to_csv(args.history, mode='a', header=not os.path.exists(args.history), index=False)
+    print(f"\n✓ Results appended to {args.history}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+    if (results['status'] != 0).any():
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
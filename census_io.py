@@ -0,0 +1,352 @@
+"""
+Shared helpers for census block attributes and geometry
+
+0.3.8 gives every block a dense integer block_id (its row in the national block
+file) and writes the per-block attributes as flat NumPy arrays indexed by block_id:
+
+    <census_data_2020>/block_attributes/
+        geoid20.npy           int64    GEOID20 as an integer (15 digits)
+        block_area_m2.npy     float64  block area in EPSG:5070
+        block_diameter_m.npy  float64  diameter of a circle with the block's area
+        meta.json             number of blocks, the source file and the build id
+
+Join outputs can then carry only block_id, and attributes are attached afterwards
+with a single array take (the arrays are memory-mapped, so loading is free).
+block_id is only a row position: rerunning 0.3.8 with another state set or sort
+order renumbers the blocks. Each build therefore gets a build id (block_build_id),
+stored in meta.json and in the parquet metadata of the national files and of the
+key-only join outputs (0.3.9), and check_block_build refuses outputs of another build.
+STATEFP20/COUNTYFP20/TRACTCE20/BLOCKCE20 are digit slices of GEOID20 and are derived
+on lookup instead of stored.
+
+load_census_geometry reads per-state TIGER files (tract or block) in parallel and
+concatenates them once.
+
+ensure_population_cache normalizes the census population parquet files (GEO_ID like
+'1000000US010010201001000', P1_001N) once into integer-keyed tables, so the regex on
+GEO_ID and the full re-read happen only when a source file changes:
+
+    <workspace>/data/census_population/
+        block_population.parquet    geoid20 (int64, sorted), tract_id, county_id, population
+        tract_population.parquet    tract_id (int64, 11 digits), population
+        county_population.parquet   county_id (int64, 5 digits), population
+        manifest.json               source files (size, mtime) the tables were built from
+"""
+
+import os
+import json
+import glob
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+BLOCK_ATTRIBUTES_DIR = 'block_attributes'
+STORED_ATTRIBUTES = {'geoid20': np.int64, 'block_area_m2': np.float64, 'block_diameter_m': np.float64}
+# Parquet key-value metadata naming the block numbering a file's block_id refers to
+BUILD_ID_KEY = 'block_build_id'
+
+# GEOID20 digit ranges: column -> (first digit, last digit + 1)
+GEOID20_PARTS = {'STATEFP20': (0, 2), 'COUNTYFP20': (2, 5), 'TRACTCE20': (5, 11), 'BLOCKCE20': (11, 15)}
+GEOID20_WIDTH = 15
+
+POPULATION_CACHE_DIR = 'data/census_population'
+POPULATION_LEVELS = {'block': 'geoid20', 'tract': 'tract_id', 'county': 'county_id'}
+# Bump when the table layout changes, so old caches are rebuilt
+POPULATION_CACHE_VERSION = 1
+
+
+def block_attributes_dir(config):
+    """Directory holding the block attribute arrays"""
+    return os.path.join(config['census_data_2020'], BLOCK_ATTRIBUTES_DIR)
+
+
+def block_build_id(part_paths, spatial_sort=False):
+    """
+    Fingerprint of a block numbering: the parts in output order (name, rows, size)
+    and the sort mode, as a short hex digest
+    """
+    import pyarrow.parquet as pq
+
+    parts = [[os.path.basename(path), pq.ParquetFile(path).metadata.num_rows, os.path.getsize(path)]
+             for path in part_paths]
+    payload = json.dumps({'spatial_sort': bool(spatial_sort), 'parts': parts}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def create_block_attribute_arrays(directory, n_blocks, source=None, build_id=None):
+    """
+    Create writable memory-mapped attribute arrays for n_blocks blocks
+
+    Callers fill the arrays in block_id order and flush them (or drop the reference).
+
+    Returns:
+        dict of attribute name -> writable np.memmap
+    """
+    os.makedirs(directory, exist_ok=True)
+    arrays = {
+        name: np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+',
+                                        dtype=dtype, shape=(n_blocks,))
+        for name, dtype in STORED_ATTRIBUTES.items()
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'n_blocks': n_blocks, 'source': source, 'build_id': build_id}, f, indent=2)
+    return arrays
+
+
+def block_attributes_build_id(directory):
+    """Build id the attribute arrays were written with (None for arrays from before build ids)"""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        return json.load(f).get('build_id')
+
+
+def parquet_build_id(path):
+    """block_build_id from a parquet file's key-value metadata (None if absent)"""
+    import pyarrow.parquet as pq
+
+    value = (pq.ParquetFile(path).metadata.metadata or {}).get(BUILD_ID_KEY.encode())
+    return value.decode() if value is not None else None
+
+
+def check_block_build(paths, directory):
+    """
+    Raise ValueError unless every parquet file in paths carries the build id of the
+    attribute arrays in directory (block_id values are only valid within one build)
+    """
+    expected = block_attributes_build_id(directory)
+    if expected is None:
+        raise ValueError(f"{directory}/meta.json has no build_id; rerun 0.3.8 to rebuild the block attributes")
+    wrong = {path: parquet_build_id(path) for path in paths}
+    wrong = {path: build for path, build in wrong.items() if build != expected}
+    if wrong:
+        examples = ', '.join(f"{os.path.basename(p)} ({b or 'no build id'})" for p, b in list(wrong.items())[:3])
+        raise ValueError(f"{len(wrong)} of {len(paths)} key-only join outputs were not joined against block build "
+                         f"{expected}: {examples}; rerun the join (0.3.9 --block_key_only) for them")
+
+
+def load_block_attributes(directory, mmap_mode='r'):
+    """
+    Load the block attribute arrays (memory-mapped by default)
+
+    Returns:
+        dict of attribute name -> array indexed by block_id
+    """
+    with open(os.path.join(directory, 'meta.json')) as f:
+        n_blocks = json.load(f)['n_blocks']
+    attributes = {}
+    for name in STORED_ATTRIBUTES:
+        array = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+        if len(array) != n_blocks:
+            raise ValueError(f"{name}.npy has {len(array)} entries, expected {n_blocks}")
+        attributes[name] = array
+    return attributes
+
+
+def geoid_to_str(geoids, start=0, stop=GEOID20_WIDTH):
+    """Zero-padded GEOID20 strings (or a digit slice of them) from integer GEOIDs"""
+    geoids = np.asarray(geoids, dtype=np.int64)
+    part = (geoids // 10 ** (GEOID20_WIDTH - stop)) % 10 ** (stop - start)
+    return np.char.zfill(part.astype(str), stop - start).astype(object)
+
+
+def lookup_block_attributes(block_ids, attributes, columns=('GEOID20', 'block_area_m2', 'block_diameter_m')):
+    """
+    Attribute values for a vector of block ids
+
+    Args:
+        block_ids: Integer block ids (as written by 0.3.8 / the key-only join)
+        attributes: dict from load_block_attributes
+        columns: Output columns: GEOID20 (string), any GEOID20_PARTS column (string),
+                 geoid20 (int64), block_area_m2, block_diameter_m
+
+    Returns:
+        dict of column -> NumPy array aligned with block_ids, ready for
+        DataFrame.assign (pandas) or pl.Series construction (polars)
+    """
+    block_ids = np.asarray(block_ids, dtype=np.int64)
+    geoids = attributes['geoid20'][block_ids]
+    values = {}
+    for column in columns:
+        if column == 'GEOID20':
+            values[column] = geoid_to_str(geoids)
+        elif column in GEOID20_PARTS:
+            values[column] = geoid_to_str(geoids, *GEOID20_PARTS[column])
+        elif column == 'geoid20':
+            values[column] = geoids
+        else:
+            values[column] = attributes[column][block_ids]
+    return values
+
+
+GEOMETRY_FILE_SUFFIXES = ('.zip', '.shp', '.parquet', '.geoparquet')
+
+
+def census_geometry_files(directory):
+    """Per-state geometry files in a directory, sorted (manifests and other files are skipped)"""
+    return sorted(name for name in os.listdir(directory) if name.endswith(GEOMETRY_FILE_SUFFIXES))
+
+
+def read_geometry_file(path, columns=None):
+    """
+    Read one state geometry file, keeping only columns (plus geometry)
+
+    Requested columns the file does not have are skipped, so ['GEOID20', 'GEOID']
+    reads the key of block files (GEOID20) and tract files (GEOID) alike; keys are
+    never renamed, callers check which one they got (see 0.4.3).
+    """
+    import geopandas as gpd
+
+    if path.endswith(('.parquet', '.geoparquet')):
+        gdf = gpd.read_parquet(path)
+    else:
+        # pyogrio skips requested columns the file does not have
+        gdf = gpd.read_file(f'zip://{path}' if path.endswith('.zip') else path,
+                            columns=list(columns) if columns is not None else None)
+
+    if columns is not None:
+        gdf = gdf[[c for c in columns if c in gdf.columns] + [gdf.geometry.name]]
+    return gdf
+
+
+def load_census_geometry(directory, columns=None, workers=None, files=None):
+    """
+    Read all per-state geometry files in directory in parallel and concatenate once
+
+    Args:
+        directory: Directory of state files (e.g. config['census_geometry'])
+        columns: Attribute columns to keep (None keeps all); geometry is always kept
+        workers: Number of reader processes (default: all CPUs)
+        files: Optional subset of file names (default: census_geometry_files(directory))
+
+    Returns:
+        GeoDataFrame of all states with a fresh RangeIndex
+    """
+    import pandas as pd
+    import geopandas as gpd
+
+    files = census_geometry_files(directory) if files is None else files
+    paths = [os.path.join(directory, name) for name in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        frames = list(executor.map(read_geometry_file, paths, [columns] * len(paths)))
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=frames[0].crs if frames else None)
+
+
+def population_cache_dir(config):
+    """Directory holding the normalized population tables"""
+    return os.path.join(config['workspace'], POPULATION_CACHE_DIR)
+
+
+def population_path(config, level='block'):
+    """Parquet file of one geographic level (block, tract or county)"""
+    if level not in POPULATION_LEVELS:
+        raise ValueError(f"Unknown population level {level!r}, expected one of {list(POPULATION_LEVELS)}")
+    return os.path.join(population_cache_dir(config), f'{level}_population.parquet')
+
+
+def population_sources(config):
+    """Census population parquet files with their (size, mtime) signature"""
+    sources = []
+    for path in sorted(glob.glob(os.path.join(config['census_pop'], '*.parquet'))):
+        st = os.stat(path)
+        sources.append({'source': os.path.basename(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+    return sources
+
+
+def read_block_population(paths):
+    """
+    Block population from the raw census files: GEO_ID stripped to the 15-digit
+    GEOID20 (the same regexp_replace as 0.4.1), non-block rows dropped, summed per block
+
+    Returns:
+        (geoid20 int64 sorted, population int64)
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    tables = []
+    for path in paths:
+        table = pq.read_table(path, columns=['GEO_ID', 'P1_001N'])
+        geoid = pc.replace_substring_regex(pc.cast(table['GEO_ID'], pa.string()), '^.*US', '')
+        population = pc.cast(table['P1_001N'], pa.int64())
+        keep = pc.and_(pc.match_substring_regex(geoid, f'^[0-9]{{{GEOID20_WIDTH}}}$'), pc.is_valid(population))
+        tables.append(pa.table({'geoid20': pc.cast(geoid, pa.int64()), 'population': population}).filter(keep))
+    blocks = (pa.concat_tables(tables).group_by('geoid20').aggregate([('population', 'sum')])
+              .sort_by('geoid20'))
+    return blocks['geoid20'].to_numpy(), blocks['population_sum'].to_numpy()
+
+
+def sum_by_sorted_key(keys, values):
+    """Sum values over runs of equal keys (keys sorted)"""
+    if len(keys) == 0:
+        return keys, values
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(values, starts)
+
+
+def ensure_population_cache(config, rebuild=False, verbose=True):
+    """
+    Bring the normalized population tables up to date with config['census_pop']
+
+    Args:
+        config: setting.json contents (uses census_pop and workspace)
+        rebuild: Rebuild even if the source files are unchanged
+
+    Returns:
+        manifest dict (version, sources, blocks, tracts, counties)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    cache_dir = population_cache_dir(config)
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    sources = population_sources(config)
+    if not rebuild and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if (manifest.get('version') == POPULATION_CACHE_VERSION and manifest.get('sources') == sources
+                and all(os.path.exists(population_path(config, level)) for level in POPULATION_LEVELS)):
+            return manifest
+    if not sources:
+        raise FileNotFoundError(f"No census population parquet files in {config['census_pop']}")
+
+    if verbose:
+        print(f"Normalizing census population: {len(sources)} files from {config['census_pop']}")
+    geoid20, population = read_block_population(
+        [os.path.join(config['census_pop'], s['source']) for s in sources])
+    # GEOID20 = state(2) county(3) tract(6) block(4): tract and county are integer prefixes,
+    # contiguous in GEOID20 order
+    tract_id = geoid20 // 10 ** 4
+    county_id = geoid20 // 10 ** 10
+    tables = {
+        'block': pa.table({'geoid20': geoid20, 'tract_id': tract_id, 'county_id': county_id,
+                           'population': population}),
+        'tract': pa.table(dict(zip(['tract_id', 'population'], sum_by_sorted_key(tract_id, population)))),
+        'county': pa.table(dict(zip(['county_id', 'population'], sum_by_sorted_key(county_id, population)))),
+    }
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for level, table in tables.items():
+        path = population_path(config, level)
+        pq.write_table(table, path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+
+    manifest = {'version': POPULATION_CACHE_VERSION, 'sources': sources,
+                'blocks': tables['block'].num_rows, 'tracts': tables['tract'].num_rows,
+                'counties': tables['county'].num_rows}
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+def load_population(config, level='block', columns=None):
+    """
+    One level of the population cache as a DataFrame (integer keys)
+
+    Keys are integers (geoid20, tract_id, county_id); zero-pad them to 15 / 11 / 5
+    digits when joining to string GEOIDs.
+    """
+    import pandas as pd
+
+    return pd.read_parquet(population_path(config, level), columns=columns)
@@ -0,0 +1,365 @@
+"""
+Shared correlation kernels for the sentiment vs. PLACES analysis (0.6, 0.6.2)
+
+correlation_table computes unweighted and population-weighted Pearson and Spearman
+coefficients of one vector (tract sentiment) against every column of a matrix (all
+PLACES *_CrudePrev measures) with array operations, instead of one pandas /
+statsmodels call per measure and variant.
+
+Definitions match the per-measure code they replace:
+    pearson_w   weighted Pearson with population weights (DescrStatsW ddof=0)
+    spearman    Pearson on average ranks
+    spearman_w  weighted Pearson on (unweighted) average ranks
+Rows where a measure is missing are dropped for that measure only.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+CORRELATION_COLUMNS = ['N', 'pearson', 'spearman', 'pearson_w', 'spearman_w']
+
+
+def masked_pearson(X, Y, W, M):
+    """
+    Column-wise weighted Pearson correlation of X[:, j] and Y[:, j] over rows with M[:, j]
+
+    Args:
+        X, Y: [n, k] arrays (NaNs allowed where M is False)
+        W: [n] weights
+        M: [n, k] boolean mask of rows used for each column
+
+    Returns:
+        [k] correlations (NaN where fewer than two rows are valid)
+    """
+    Wm = np.where(M, W[:, None], 0.0)
+    X = np.where(M, X, 0.0)
+    Y = np.where(M, Y, 0.0)
+    sw = Wm.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = (Wm * X).sum(axis=0) / sw
+        my = (Wm * Y).sum(axis=0) / sw
+        dx = np.where(M, X - mx, 0.0)
+        dy = np.where(M, Y - my, 0.0)
+        cov = (Wm * dx * dy).sum(axis=0)
+        var_x = (Wm * dx * dx).sum(axis=0)
+        var_y = (Wm * dy * dy).sum(axis=0)
+        r = cov / np.sqrt(var_x * var_y)
+    r[M.sum(axis=0) < 2] = np.nan
+    return r
+
+
+def masked_ranks(A, M):
+    """Average ranks of each column of A among the rows selected by M (NaN elsewhere)"""
+    return stats.rankdata(np.where(M, A, np.nan), method='average', axis=0, nan_policy='omit')
+
+
+def correlation_table(x, Y, w, names=None):
+    """
+    All four correlation variants of x against every column of Y in one pass
+
+    Args:
+        x: [n] vector (e.g. tract sentiment mean)
+        Y: [n, k] matrix or DataFrame (e.g. all *_CrudePrev columns)
+        w: [n] weights (e.g. tract population)
+        names: Column names (taken from Y when it is a DataFrame)
+
+    Returns:
+        DataFrame indexed by measure name with N, pearson, spearman, pearson_w, spearman_w
+    """
+    if isinstance(Y, pd.DataFrame):
+        names = list(Y.columns) if names is None else names
+        Y = Y.to_numpy(dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    x = np.asarray(x, dtype=float)
+    w = np.asarray(w, dtype=float)
+    names = list(range(Y.shape[1])) if names is None else names
+
+    M = ~np.isnan(Y) & ~np.isnan(x)[:, None] & ~np.isnan(w)[:, None]
+    X = np.broadcast_to(x[:, None], Y.shape)
+    ones = np.ones_like(w)
+    w = np.nan_to_num(w)
+
+    rank_x = masked_ranks(X, M)
+    rank_y = masked_ranks(Y, M)
+
+    return pd.DataFrame({
+        'N': M.sum(axis=0),
+        'pearson': masked_pearson(X, Y, ones, M),
+        'spearman': masked_pearson(rank_x, rank_y, ones, M),
+        'pearson_w': masked_pearson(X, Y, w, M),
+        'spearman_w': masked_pearson(rank_x, rank_y, w, M),
+    }, index=pd.Index(names, name='measure'))
+
+
+# ---------------------------------------------------------------------------
+# Bootstrap confidence intervals and permutation p-values
+#
+# A bootstrap resample is represented by a row of per-tract counts (how often each
+# tract was drawn), so a chunk of B resamples is a [B, n] count matrix and every
+# statistic is a row-wise weighted sum: weights are the counts (unweighted variants)
+# or counts * population (weighted variants). Ranks inside a resample follow from the
+# counts of the tracts sorted once by value, so Spearman needs no re-sorting either.
+# Permutations are [B, n] index matrices applied to y (and its precomputed ranks).
+# Chunks run in parallel processes with independent SeedSequence streams, so results
+# depend only on the seed, not on the number of workers.
+# ---------------------------------------------------------------------------
+
+VARIANTS = ['pearson', 'spearman', 'pearson_w', 'spearman_w']
+
+
+def moments_to_pearson(sw, sx, sy, sxx, syy, sxy):
+    """Weighted Pearson from weighted sums (inputs should be roughly centered)"""
+    mx, my = sx / sw, sy / sw
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sxy / sw - mx * my) / np.sqrt((sxx / sw - mx * mx) * (syy / sw - my * my))
+
+
+def rowwise_pearson(W, X, Y):
+    """Weighted Pearson per row: W [B, n] weights, X / Y [B, n] values"""
+    WX, WY = W * X, W * Y
+    return moments_to_pearson(W.sum(axis=1), WX.sum(axis=1), WY.sum(axis=1),
+                              np.einsum('ij,ij->i', WX, X), np.einsum('ij,ij->i', WY, Y),
+                              np.einsum('ij,ij->i', WX, Y))
+
+
+class TieGroups:
+    """Sort order and tie groups of a vector, for computing average ranks of resamples"""
+
+    def __init__(self, values):
+        self.order = np.argsort(values, kind='stable')
+        sorted_values = values[self.order]
+        new_group = np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+        self.starts = np.flatnonzero(new_group)
+        self.group = np.empty(len(values), dtype=np.int64)
+        self.group[self.order] = np.cumsum(new_group) - 1
+
+    def resample_ranks(self, counts):
+        """
+        Average ranks of every element within each resample
+
+        Args:
+            counts: [B, n] number of copies of each element per resample
+
+        Returns:
+            [B, n] rank of each element in its resample (arbitrary where counts == 0)
+        """
+        group_counts = counts[:, self.order]
+        if len(self.starts) < len(self.order):
+            group_counts = np.add.reduceat(group_counts, self.starts, axis=1)
+        before = np.cumsum(group_counts, axis=1) - group_counts
+        return (before + (group_counts + 1) / 2.0)[:, self.group]
+
+
+def bootstrap_counts(rng, size, n, cluster_codes=None, n_clusters=None):
+    """
+    [size, n] resample counts from an index matrix of draws
+
+    Without clusters, n tracts are drawn with replacement. With cluster_codes
+    (e.g. state), n_clusters clusters are drawn with replacement and every tract
+    gets the count of its cluster.
+    """
+    m = n if cluster_codes is None else n_clusters
+    draws = rng.integers(0, m, size=(size, m)) + m * np.arange(size)[:, None]
+    counts = np.bincount(draws.ravel(), minlength=size * m).reshape(size, m).astype(float)
+    return counts if cluster_codes is None else counts[:, cluster_codes]
+
+
+def permutation_indices(rng, size, n, cluster_codes=None):
+    """[size, n] permutation index matrix (permuting only within clusters if given)"""
+    if cluster_codes is None:
+        return rng.permuted(np.broadcast_to(np.arange(n), (size, n)), axis=1)
+    # Sorting by cluster + U(0, 1) shuffles each cluster's block of the cluster-sorted order
+    within = np.argsort(cluster_codes + rng.random((size, n)), axis=1)
+    perm = np.empty((size, n), dtype=np.int64)
+    perm[:, np.argsort(cluster_codes, kind='stable')] = within
+    return perm
+
+
+def _bootstrap_chunk(x, y, w, size, seed, cluster_codes, n_clusters):
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    counts = bootstrap_counts(rng, size, n, cluster_codes, n_clusters)
+
+    # Pearson: all weighted sums of one count matrix in a single matmul
+    x, y = x - x.mean(), y - y.mean()
+    cols = np.column_stack([np.ones(n), x, y, x * x, y * y, x * y])
+    sums = counts @ np.hstack([cols, cols * w[:, None]])
+    pearson = moments_to_pearson(*sums[:, :6].T)
+    pearson_w = moments_to_pearson(*sums[:, 6:].T)
+
+    # Spearman: ranks within each resample (centered), weights counts / counts * w
+    center = (n + 1) / 2.0
+    rank_x = TieGroups(x).resample_ranks(counts) - center
+    rank_y = TieGroups(y).resample_ranks(counts) - center
+    spearman = rowwise_pearson(counts, rank_x, rank_y)
+    spearman_w = rowwise_pearson(counts * w, rank_x, rank_y)
+    return np.column_stack([pearson, spearman, pearson_w, spearman_w])
+
+
+def _permutation_chunk(x, y, w, size, seed, cluster_codes, n_clusters):
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    perm = permutation_indices(rng, size, n, cluster_codes)
+
+    # x and w stay in place and y is permuted, so every sum involving y is a
+    # matrix-vector product of the permuted y (or y**2) with a fixed vector
+    def permuted_r(a, b):
+        a, b = a - a.mean(), b - b.mean()
+        bp, bp2 = b[perm], (b * b)[perm]
+        fixed = np.column_stack([a, w, w * a])
+        s, s2 = bp @ fixed, bp2 @ w
+        ones = np.ones(size)
+        unweighted = moments_to_pearson(n * ones, a.sum() * ones, b.sum() * ones,
+                                        (a * a).sum() * ones, (b * b).sum() * ones, s[:, 0])
+        weighted = moments_to_pearson(w.sum() * ones, (w * a).sum() * ones, s[:, 1],
+                                      (w * a * a).sum() * ones, s2, s[:, 2])
+        return unweighted, weighted
+
+    pearson, pearson_w = permuted_r(x, y)
+    spearman, spearman_w = permuted_r(stats.rankdata(x), stats.rankdata(y))
+    return np.column_stack([pearson, spearman, pearson_w, spearman_w])
+
+
+def _run_chunks(chunk_fn, x, y, w, n_resamples, clusters, seed, chunk_size, workers):
+    """Split n_resamples into seeded chunks and run them (in parallel if workers != 1)"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    cluster_codes, n_clusters = None, None
+    if clusters is not None:
+        cluster_codes, uniques = pd.factorize(np.asarray(clusters))
+        n_clusters = len(uniques)
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(x, y, w, size, s, cluster_codes, n_clusters) for size, s in zip(sizes, seeds)]
+
+    if workers == 1 or len(sizes) == 1:
+        results = [chunk_fn(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(chunk_fn, *zip(*args)))
+    return np.vstack(results)
+
+
+def correlation_uncertainty(x, y, w, n_boot=2000, n_perm=2000, clusters=None, alpha=0.05,
+                            seed=0, chunk_size=50, workers=None):
+    """
+    Bootstrap CIs and permutation p-values for the four correlation variants
+
+    Args:
+        x, y, w: [n] sentiment, measure and population (rows with NaN are dropped)
+        n_boot: Number of bootstrap resamples (0 to skip)
+        n_perm: Number of permutations (0 to skip)
+        clusters: Optional [n] cluster labels (e.g. statefp); the bootstrap then
+                  resamples whole clusters and permutations stay within clusters
+        alpha: CI level (percentile interval [alpha/2, 1 - alpha/2])
+        seed: Seed for the SeedSequence the chunk streams are spawned from
+        chunk_size: Resamples per chunk (memory is ~ chunk_size * n * 8 bytes per array)
+        workers: Worker processes (default: all CPUs; 1 runs in-process)
+
+    Returns:
+        DataFrame indexed by variant with estimate, se_boot, ci_low, ci_high, p_perm
+    """
+    x, y, w = (np.asarray(v, dtype=float) for v in (x, y, w))
+    keep = ~(np.isnan(x) | np.isnan(y) | np.isnan(w))
+    x, y, w = x[keep], y[keep], w[keep]
+    if clusters is not None:
+        clusters = np.asarray(clusters)[keep]
+
+    estimate = correlation_table(x, y[:, None], w, names=['y']).loc['y', VARIANTS].to_numpy(dtype=float)
+    out = pd.DataFrame({'estimate': estimate}, index=pd.Index(VARIANTS, name='variant'))
+
+    if n_boot > 0:
+        boot = _run_chunks(_bootstrap_chunk, x, y, w, n_boot, clusters, seed, chunk_size, workers)
+        out['se_boot'] = np.nanstd(boot, axis=0, ddof=1)
+        out['ci_low'] = np.nanquantile(boot, alpha / 2, axis=0)
+        out['ci_high'] = np.nanquantile(boot, 1 - alpha / 2, axis=0)
+    if n_perm > 0:
+        perm = _run_chunks(_permutation_chunk, x, y, w, n_perm, clusters, seed + 1, chunk_size, workers)
+        # Two-sided, counting the observed statistic as one of the permutations
+        out['p_perm'] = (1 + (np.abs(perm) >= np.abs(estimate) - 1e-12).sum(axis=0)) / (1 + n_perm)
+    out['N'] = len(x)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Quantile-binned curves (decile curves in the 0.6 / 0.6.2 plots)
+# ---------------------------------------------------------------------------
+
+def quantile_bins(x, q=10):
+    """
+    Bin index of every value in q quantile bins, same bins as pd.qcut(x, q, duplicates='drop')
+
+    Bins are right-closed, (e_k, e_k+1], with the minimum in the first bin.
+
+    Returns:
+        (bin index array, bin edges)
+    """
+    edges = np.unique(np.quantile(x, np.linspace(0, 1, q + 1)))
+    bins = np.clip(np.searchsorted(edges, x, side='left') - 1, 0, max(len(edges) - 2, 0))
+    return bins, edges
+
+
+def weighted_median_by_bin(bins, y, w, n_bins):
+    """Weighted median of y within each bin (first value reaching half the bin's weight)"""
+    order = np.lexsort((y, bins))
+    cum = np.r_[0.0, np.cumsum(w[order])]
+    ends = np.cumsum(np.bincount(bins, minlength=n_bins))
+    starts = ends - np.bincount(bins, minlength=n_bins)
+    target = cum[starts] + (cum[ends] - cum[starts]) / 2
+    idx = np.clip(np.searchsorted(cum[1:], target, side='left'), starts, np.maximum(ends - 1, starts))
+    return y[order][np.minimum(idx, len(y) - 1)]
+
+
+def binned_statistics(x, Y, w=None, q=10, stats=('mean',)):
+    """
+    Median of x and (weighted) statistics of one or more y columns per quantile bin of x
+
+    Replaces pd.qcut + groupby('bin').apply(np.average ...): x is sorted once, bins are
+    found with searchsorted and per-bin sums with bincount, for all y columns.
+
+    Args:
+        x: [n] binning variable (e.g. MHLTH prevalence)
+        Y: [n] Series / array or [n, k] DataFrame of values to summarize
+        w: Optional [n] weights (e.g. population); unweighted if None
+        q: Number of quantile bins (duplicate edges are dropped like pd.qcut)
+        stats: Any of 'mean' (weighted mean) and 'median' (weighted median)
+
+    Returns:
+        DataFrame with one row per non-empty bin (ordered by x): x_med, n and
+        <column>_<stat> for every y column (a Series / 1-D array is named 'y').
+        Rows with NaN in x, w or any y column are dropped first.
+    """
+    if isinstance(Y, pd.DataFrame):
+        names, Y = list(Y.columns), Y.to_numpy(dtype=float)
+    else:
+        names, Y = ['y'], np.asarray(Y, dtype=float)[:, None]
+    Y = Y.reshape(len(Y), -1)
+    x = np.asarray(x, dtype=float)
+    w = np.ones(len(x)) if w is None else np.asarray(w, dtype=float)
+
+    keep = ~(np.isnan(x) | np.isnan(w) | np.isnan(Y).any(axis=1))
+    x, w, Y = x[keep], w[keep], Y[keep]
+    if len(x) == 0:
+        return pd.DataFrame(columns=['x_med', 'n'] + [f'{c}_{s}' for c in names for s in stats])
+
+    bins, edges = quantile_bins(x, q)
+    n_bins = max(len(edges) - 1, 1)
+    counts = np.bincount(bins, minlength=n_bins)
+
+    # Bins are contiguous in sorted x, so the median is the middle of each slice
+    xs = np.sort(x)
+    starts = np.cumsum(counts) - counts
+    x_med = (xs[starts + np.maximum(counts - 1, 0) // 2] + xs[np.minimum(starts + counts // 2, len(xs) - 1)]) / 2
+
+    out = {'x_med': x_med, 'n': counts}
+    w_sum = np.bincount(bins, weights=w, minlength=n_bins)
+    for j, name in enumerate(names):
+        if 'mean' in stats:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[f'{name}_mean'] = np.bincount(bins, weights=w * Y[:, j], minlength=n_bins) / w_sum
+        if 'median' in stats:
+            out[f'{name}_median'] = weighted_median_by_bin(bins, Y[:, j], w, n_bins)
+    return pd.DataFrame(out)[counts > 0].reset_index(drop=True)
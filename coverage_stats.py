@@ -0,0 +1,243 @@
+"""
+Vectorized coverage (CR) and Gini / Lorenz statistics for many groups at once
+
+Used by 0.4.7 (pooled and per-state Gini / Lorenz at block scale) and 0.4.8
+(per-year and rolling-window series).
+Every function takes flat NumPy arrays with one row per (group, block) and integer
+group codes, sorts once and works with cumulative sums and bincount, so per-year,
+per-window or per-state results come from one call instead of one run per slice.
+
+Definitions match 0.4.2 / 0.4.7:
+    CR           (T_i / T_tot) / (P_i / P_tot), totals per group
+    mask         T_i < 20 or P_i <= 0
+    Lorenz       blocks sorted by T_i / P_i, cumulative population share (x) vs
+                 cumulative tweet share (y), starting at (0, 0)
+    Gini         1 - 2 * trapezoid area under the Lorenz curve
+
+Memory stays at a few float64 arrays of the row count (about 8M blocks); Lorenz
+curves are returned at a fixed number of points per group instead of one per block.
+"""
+
+import numpy as np
+import pandas as pd
+
+MIN_TWEETS = 20
+
+
+def group_codes(labels):
+    """Integer codes 0..G-1 for group labels, and the labels in code order (sorted)"""
+    codes, uniques = pd.factorize(np.asarray(labels), sort=True)
+    return codes, np.asarray(uniques)
+
+
+def coverage_ratio(codes, T, P, n_groups=None):
+    """
+    CR, log2CR and mask_low_coverage per row with totals per group
+
+    As in 0.4.2, T_tot sums all rows of the group and P_tot the non-missing populations.
+    """
+    n_groups = codes.max() + 1 if n_groups is None else n_groups
+    T_tot = np.bincount(codes, weights=T, minlength=n_groups)
+    P_tot = np.bincount(codes, weights=np.nan_to_num(P), minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cr = (T / T_tot[codes]) / (P / P_tot[codes])
+        log2cr = np.where(cr > 0, np.log2(cr), np.nan)
+    mask = ((T < MIN_TWEETS) | ~(P > 0)).astype(np.int8)
+    return cr, log2cr, mask
+
+
+def grouped_lorenz(codes, T, P, n_groups=None):
+    """
+    Lorenz curve points of every group from one sort
+
+    Args:
+        codes: [n] group codes
+        T, P: [n] tweets and population (P > 0)
+
+    Returns:
+        (order, x, y): rows sorted by (group, T/P) and the cumulative population /
+        tweet shares within each group at those rows (the (0, 0) start is implicit)
+    """
+    n_groups = codes.max() + 1 if n_groups is None else n_groups
+    order = np.lexsort((T / P, codes))
+    g, Ts, Ps = codes[order], T[order], P[order]
+    T_tot = np.bincount(g, weights=Ts, minlength=n_groups)
+    P_tot = np.bincount(g, weights=Ps, minlength=n_groups)
+    # Cumulative sums over all rows minus everything in earlier groups
+    cum_T, cum_P = np.cumsum(Ts), np.cumsum(Ps)
+    before_T, before_P = np.cumsum(T_tot) - T_tot, np.cumsum(P_tot) - P_tot
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (cum_P - before_P[g]) / P_tot[g]
+        y = (cum_T - before_T[g]) / T_tot[g]
+    return order, x, y
+
+
+def grouped_lorenz_curves(codes, T, P, n_groups=None, n_points=0):
+    """
+    Gini and (optionally) a downsampled Lorenz curve of every group from one sort
+
+    The Lorenz curve is piecewise linear between the block points, so sampling it at
+    n_points evenly spaced population shares with np.interp is exact at those shares;
+    the Gini is always computed from every block.
+
+    Args:
+        codes: [n] group codes
+        T, P: [n] tweets and population (P > 0)
+        n_points: Number of Lorenz points per group (0: Gini only)
+
+    Returns:
+        (gini [n_groups], points [n_groups, n_points] cumulative tweet shares at
+        np.linspace(0, 1, n_points), or None); NaN for groups without rows
+    """
+    n_groups = codes.max() + 1 if n_groups is None else n_groups
+    order, x, y = grouped_lorenz(codes, T, P, n_groups)
+    g = codes[order]
+    del order
+    counts = np.bincount(g, minlength=n_groups)
+
+    first = np.r_[True, g[1:] != g[:-1]]
+    x_prev = np.r_[0.0, x[:-1]]
+    x_prev[first] = 0.0
+    y_prev = np.r_[0.0, y[:-1]]
+    y_prev[first] = 0.0
+    x_prev -= x
+    y_prev += y
+    # (x - x_prev) * (y + y_prev) / 2 per row, summed per group
+    area = -np.bincount(g, weights=x_prev * y_prev, minlength=n_groups) / 2
+    del x_prev, y_prev
+    gini = 1.0 - 2.0 * area
+    gini[counts == 0] = np.nan
+
+    points = None
+    if n_points:
+        grid = np.linspace(0.0, 1.0, n_points)
+        points = np.full((n_groups, n_points), np.nan)
+        ends = np.cumsum(counts)
+        for k in np.flatnonzero(counts):
+            s, e = ends[k] - counts[k], ends[k]
+            points[k] = np.interp(grid, np.r_[0.0, x[s:e]], np.r_[0.0, y[s:e]])
+    return gini, points
+
+
+def grouped_gini(codes, T, P, n_groups=None):
+    """
+    Gini coefficient of tweets vs population for every group
+
+    Returns:
+        [n_groups] Gini (NaN for groups without rows)
+    """
+    return grouped_lorenz_curves(codes, T, P, n_groups)[0]
+
+
+def grouped_quantiles(codes, values, qs, n_groups=None):
+    """
+    Quantiles of values within each group (linear interpolation, like np.quantile)
+
+    Returns:
+        [n_groups, len(qs)] array (NaN for groups without non-NaN values)
+    """
+    n_groups = codes.max() + 1 if n_groups is None else n_groups
+    keep = ~np.isnan(values)
+    codes, values = codes[keep], values[keep]
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    out = np.full((n_groups, len(qs)), np.nan)
+    has = counts > 0
+    for j, q in enumerate(qs):
+        pos = (counts[has] - 1) * q
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, counts[has] - 1)
+        frac = pos - lo
+        a, b = sorted_values[starts[has] + lo], sorted_values[starts[has] + hi]
+        out[has, j] = a + (b - a) * frac
+    return out
+
+
+def rolling_window_rows(years, width, first_year=None, last_year=None):
+    """
+    Expand (year, block) rows into (window, block) rows for width-year rolling windows
+
+    A row of year y belongs to the windows starting at y - width + 1 .. y that lie
+    completely within [first_year, last_year].
+
+    Returns:
+        (row index into the input, window start year) for every expanded row
+    """
+    years = np.asarray(years)
+    first_year = years.min() if first_year is None else first_year
+    last_year = years.max() if last_year is None else last_year
+    rows, starts = [], []
+    for k in range(width):
+        start = years - k
+        valid = (start >= first_year) & (start + width - 1 <= last_year)
+        rows.append(np.flatnonzero(valid))
+        starts.append(start[valid])
+    return np.concatenate(rows), np.concatenate(starts)
+
+
+def sum_by_key(group, block, T):
+    """
+    Sum T per (group, block) pair
+
+    Returns:
+        (group, block, T) of the unique pairs
+    """
+    keys = np.stack([group, block], axis=1)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return unique[:, 0], unique[:, 1], np.bincount(inverse.ravel(), weights=T, minlength=len(unique))
+
+
+def representativeness_summary(codes, T, P, n_groups=None, qs=(0.10, 0.50, 0.90),
+                               log2cr=None, mask=None, n_points=0):
+    """
+    0.4.7's summary numbers for every group at once
+
+    CR and the mask are computed per group on all rows unless given (e.g. the CR
+    columns of the 0.4.2 table), so T_tot includes tweets in blocks without population
+    as in 0.4.2. Rows with P <= 0 are then dropped (as in 0.4.7), and the Gini and
+    log2CR quantiles are taken over the reportable (unmasked) rows.
+
+    Returns:
+        (summary, points): DataFrame indexed by group code with n_blocks, n_reportable,
+        covered_pop_share, gini and log2CR_p10 / p50 / p90, and the reportable Lorenz
+        points of grouped_lorenz_curves (None when n_points is 0)
+    """
+    n_groups = codes.max() + 1 if n_groups is None else n_groups
+    if log2cr is None or mask is None:
+        _, log2cr, mask = coverage_ratio(codes, T, P, n_groups)
+    valid = P > 0
+    codes, T, P, log2cr, mask = codes[valid], T[valid], P[valid], log2cr[valid], mask[valid]
+    rep = mask == 0
+
+    summary = pd.DataFrame({
+        'n_blocks': np.bincount(codes, minlength=n_groups),
+        'n_reportable': np.bincount(codes[rep], minlength=n_groups),
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary['covered_pop_share'] = (np.bincount(codes[rep], weights=P[rep], minlength=n_groups)
+                                        / np.bincount(codes, weights=P, minlength=n_groups))
+    summary['gini'], points = grouped_lorenz_curves(codes[rep], T[rep], P[rep], n_groups, n_points)
+    quantiles = grouped_quantiles(codes[rep], log2cr[rep], qs, n_groups)
+    for j, q in enumerate(qs):
+        summary[f'log2CR_p{int(round(q * 100))}'] = quantiles[:, j]
+    return summary, points
+
+
+def lorenz_points_frame(points, labels=None, label_name='group'):
+    """
+    Long-format Lorenz points (cum_pop_share, cum_tweet_share) for writing to CSV
+
+    Args:
+        points: [n_groups, n_points] from grouped_lorenz_curves
+        labels: Group labels; without labels (single group) no group column is added
+    """
+    n_groups, n_points = points.shape
+    frame = pd.DataFrame({
+        'cum_pop_share': np.tile(np.linspace(0.0, 1.0, n_points), n_groups),
+        'cum_tweet_share': points.ravel(),
+    })
+    if labels is not None:
+        frame.insert(0, label_name, np.repeat(labels, n_points))
+    return frame
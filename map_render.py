@@ -0,0 +1,290 @@
+"""
+Shared helpers for national validation maps (0.4.3 - 0.4.6)
+
+Map geometry is kept in EPSG:4326 with longitudes > 0 (Aleutian islands west of the
+antimeridian) shifted by -360, so Alaska is drawn in one piece.
+
+0.4.6 caches topology-preserving simplified copies of the tract and block geometry at
+the tolerances in SIMPLIFY_TOLERANCES (degrees). Plotting scripts call
+pick_tolerance with their figure size and DPI and load the coarsest level whose
+tolerance is still below a fraction of a pixel, so vertices that would never be
+visible are not rendered. Each level has a sidecar <layer>_tol<tolerance>.sources.json
+recording the files it was simplified from (layer_sources); levels whose sources have
+changed since are ignored, and 0.4.6 rebuilds them.
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+import pyarrow.parquet as pq
+
+# Simplification levels in degrees (~50 m, ~200 m, ~1 km, ~5 km at mid latitudes)
+SIMPLIFY_TOLERANCES = (0.0005, 0.002, 0.01, 0.05)
+SIMPLIFIED_GEOMETRY_DIR = 'data/simplified_geometry'
+# Tract geometry merged with CR metrics and shifted, written by 0.4.3 (relative to workspace)
+TRACT_MAP_FILE = 'data/census_tracts_merged_shifted_geo.parquet'
+# Geometry-only cache of 0.4.3; unlike TRACT_MAP_FILE it is not rewritten when CR changes
+SHIFTED_GEOMETRY_FILE = 'data/census_geometry_shifted.geoparquet'
+
+
+def shift_longitudes(geometry):
+    """
+    Shift longitudes > 0 by -360 for every vertex of every geometry, vectorized
+
+    Only geometries whose bounds reach positive longitudes are transformed; the rest
+    are returned unchanged.
+
+    Args:
+        geometry: GeoSeries (or array of shapely geometries) in EPSG:4326
+
+    Returns:
+        Same type as the input with shifted coordinates
+    """
+    values = geometry.values if isinstance(geometry, gpd.GeoSeries) else np.asarray(geometry)
+    shifted = np.array(values, dtype=object, copy=True)
+    needs_shift = shapely.bounds(values)[:, 2] > 0
+    if needs_shift.any():
+        shifted[needs_shift] = shapely.transform(
+            values[needs_shift],
+            lambda coords: np.column_stack([np.where(coords[:, 0] > 0, coords[:, 0] - 360, coords[:, 0]),
+                                            coords[:, 1:]]),
+        )
+    if isinstance(geometry, gpd.GeoSeries):
+        return gpd.GeoSeries(shifted, index=geometry.index, crs=geometry.crs)
+    return shifted
+
+
+def simplify_coverage(geometry, tolerance):
+    """
+    Simplify a polygon coverage without opening gaps or overlaps between neighbours
+
+    Uses shapely.coverage_simplify (shapely >= 2.1, GEOS >= 3.12), which simplifies
+    shared edges once for both polygons. Older versions fall back to per-polygon
+    simplify(preserve_topology=True), which keeps each polygon valid but may leave
+    slivers along shared edges.
+    """
+    values = geometry.values if isinstance(geometry, gpd.GeoSeries) else np.asarray(geometry)
+    try:
+        simplified = shapely.coverage_simplify(values, tolerance)
+    except (AttributeError, shapely.errors.GEOSException, shapely.errors.UnsupportedGEOSVersionError):
+        simplified = shapely.simplify(values, tolerance, preserve_topology=True)
+    if isinstance(geometry, gpd.GeoSeries):
+        return gpd.GeoSeries(simplified, index=geometry.index, crs=geometry.crs)
+    return simplified
+
+
+def simplified_geometry_path(config, layer, tolerance):
+    """Cache file for a layer ('tract' or 'block') simplified at tolerance degrees"""
+    return os.path.join(config['workspace'], SIMPLIFIED_GEOMETRY_DIR, f'{layer}_tol{tolerance:g}.geoparquet')
+
+
+def layer_sources(config, layer):
+    """
+    Files a simplified layer is built from, as {path: [size, mtime_ns]} (None if missing)
+
+    Tract geometry is read from TRACT_MAP_FILE, but that file is rewritten whenever the
+    CR metrics change; its geometry only changes with the shifted geometry cache of
+    0.4.3 (and the census files recorded in its sources.json), so those identify it.
+    """
+    if layer == 'tract':
+        shifted_path = os.path.join(config['workspace'], SHIFTED_GEOMETRY_FILE)
+        paths = [shifted_path, shifted_path.replace('.geoparquet', '.sources.json')]
+    else:
+        paths = [os.path.join(config['census_data_2020'], 'us_census_blocks_2020.geoparquet')]
+    sources = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sources[path] = [st.st_size, st.st_mtime_ns]
+        except FileNotFoundError:
+            sources[path] = None
+    return sources
+
+
+def level_sources_path(config, layer, tolerance):
+    """Sidecar recording the layer_sources a cached level was built from"""
+    return simplified_geometry_path(config, layer, tolerance).replace('.geoparquet', '.sources.json')
+
+
+def level_is_current(config, layer, tolerance, sources=None):
+    """True if the cached level exists and was built from the current layer sources"""
+    if not os.path.exists(simplified_geometry_path(config, layer, tolerance)):
+        return False
+    try:
+        with open(level_sources_path(config, layer, tolerance)) as f:
+            cached_sources = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    return cached_sources == (sources if sources is not None else layer_sources(config, layer))
+
+
+def geoparquet_bounds(path):
+    """Bounding box [minx, miny, maxx, maxy] from a GeoParquet file's metadata"""
+    geo = json.loads(pq.read_schema(path).metadata[b'geo'])
+    return geo['columns'][geo['primary_column']]['bbox']
+
+
+def pick_tolerance(bounds, figsize, dpi, pixel_fraction=0.5, tolerances=SIMPLIFY_TOLERANCES):
+    """
+    Coarsest simplification tolerance that stays below pixel_fraction of a pixel
+
+    Args:
+        bounds: Map extent [minx, miny, maxx, maxy] in degrees
+        figsize: Figure size (width, height) in inches
+        dpi: Output resolution
+        pixel_fraction: Allowed vertex displacement in pixels
+
+    Returns:
+        Tolerance from tolerances, or None if full resolution is needed
+    """
+    minx, miny, maxx, maxy = bounds
+    # The map is scaled to fit the figure, so the larger degrees-per-pixel ratio applies
+    pixel_size = max((maxx - minx) / (figsize[0] * dpi), (maxy - miny) / (figsize[1] * dpi))
+    usable = [t for t in tolerances if t <= pixel_size * pixel_fraction]
+    return max(usable) if usable else None
+
+
+def cached_tolerance(config, layer, figsize, dpi):
+    """Tolerance of the cached simplified level matching figsize/dpi, or None (stale levels are skipped)"""
+    cache_dir = os.path.join(config['workspace'], SIMPLIFIED_GEOMETRY_DIR)
+    prefix, suffix = f'{layer}_tol', '.geoparquet'
+    sources = layer_sources(config, layer)
+    available = sorted(float(name[len(prefix):-len(suffix)]) for name in
+                       (os.listdir(cache_dir) if os.path.isdir(cache_dir) else [])
+                       if name.startswith(prefix) and name.endswith(suffix))
+    current = [t for t in available if level_is_current(config, layer, t, sources)]
+    if len(current) < len(available):
+        print(f"Ignoring {len(available) - len(current)} stale simplified {layer} level(s); rerun 0.4.6")
+    available = current
+    if not available:
+        return None
+    bounds = geoparquet_bounds(simplified_geometry_path(config, layer, available[0]))
+    return pick_tolerance(bounds, figsize, dpi, tolerances=available)
+
+
+def load_map_geometry(config, layer, figsize, dpi, columns=None):
+    """
+    Load the simplified geometry matching the output size, if it has been cached
+
+    Returns:
+        (GeoDataFrame, tolerance), or (None, None) when no suitable cache level exists
+    """
+    tolerance = cached_tolerance(config, layer, figsize, dpi)
+    if tolerance is None:
+        return None, None
+    return gpd.read_parquet(simplified_geometry_path(config, layer, tolerance), columns=columns), tolerance
+
+
+def load_map_frame(config, columns, figsize, dpi, resolution='auto'):
+    """
+    Tract map frame with the requested attribute columns and render-ready geometry
+
+    With resolution='auto', attributes are read from the 0.4.3 output without its
+    geometry and joined onto the cached simplified tracts picked for figsize/dpi;
+    resolution='full' (or a missing cache) reads the full-resolution geometry.
+
+    Returns:
+        GeoDataFrame with GEOID20, columns and geometry
+    """
+    path = os.path.join(config['workspace'], TRACT_MAP_FILE)
+    columns = [c for c in columns if c != 'GEOID20']
+
+    if resolution == 'auto':
+        geometry, tolerance = load_map_geometry(config, 'tract', figsize, dpi)
+        if geometry is not None:
+            print(f"Using simplified tract geometry (tolerance {tolerance:g} deg) for {dpi} dpi")
+            attributes = pd.read_parquet(path, columns=['GEOID20'] + columns)
+            return geometry.merge(attributes, on='GEOID20', how='left')
+        print("No simplified geometry cache for this resolution, using full geometry")
+
+    return gpd.read_parquet(path, columns=['GEOID20'] + columns + ['geometry'])
+
+
+RASTER_CACHE_DIR = 'data/raster_cache'
+
+
+def geometry_signature(config, resolution, figsize, dpi):
+    """Identifies the geometry a raster is built from (shifted geometry, its census sources, simplification level)"""
+    path = os.path.join(config['workspace'], SHIFTED_GEOMETRY_FILE)
+    st = os.stat(path)
+    with open(path.replace('.geoparquet', '.sources.json'), 'rb') as f:
+        sources = hashlib.sha256(f.read()).hexdigest()[:16]
+    tolerance = None if resolution == 'full' else cached_tolerance(config, 'tract', figsize, dpi)
+    return f'{st.st_size}-{st.st_mtime_ns}-{sources}-tol{tolerance}'
+
+
+def load_id_raster(config, figsize, dpi, crs=None, resolution='auto'):
+    """
+    Tract ID raster at the output resolution, built once and cached as .npz
+
+    Each pixel holds 1 + the position of the tract covering its center in keys
+    (0 = no tract), so any per-tract value can be turned into an image with a
+    single NumPy take (see colorize_id_raster).
+
+    Args:
+        config: setting.json contents
+        figsize: Figure size (width, height) in inches
+        dpi: Output resolution
+        crs: Optional CRS to project the tracts to before rasterizing (e.g. 5070)
+        resolution: Geometry level passed to load_map_frame
+
+    Returns:
+        (ids raster [height, width] int32, keys array of GEOID20, extent [minx, maxx, miny, maxy])
+    """
+    from rasterio import features, transform
+
+    width = int(figsize[0] * dpi)
+    crs_tag = 'shifted4326' if crs is None else str(crs).replace(':', '')
+    cache_path = os.path.join(config['workspace'], RASTER_CACHE_DIR, f'tract_{crs_tag}_{width}px.npz')
+    signature = geometry_signature(config, resolution, figsize, dpi)
+
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path, allow_pickle=False)
+        if str(cached['signature']) == signature:
+            return cached['ids'], cached['keys'], cached['extent']
+
+    tracts = load_map_frame(config, [], figsize, dpi, resolution)
+    if crs is not None:
+        tracts = tracts.to_crs(crs)
+    minx, miny, maxx, maxy = tracts.total_bounds
+    height = max(1, int(round(width * (maxy - miny) / (maxx - minx))))
+
+    ids = features.rasterize(
+        zip(tracts.geometry.values, range(1, len(tracts) + 1)),
+        out_shape=(height, width),
+        transform=transform.from_bounds(minx, miny, maxx, maxy, width, height),
+        fill=0,
+        dtype='int32',
+    )
+    keys = tracts['GEOID20'].to_numpy().astype(str)
+    extent = np.array([minx, maxx, miny, maxy])
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    np.savez_compressed(cache_path + '.tmp.npz', ids=ids, keys=keys, extent=extent, signature=signature)
+    os.replace(cache_path + '.tmp.npz', cache_path)
+    print(f"✓ Cached tract ID raster ({width}x{height}): {cache_path}")
+    return ids, keys, extent
+
+
+def colorize_id_raster(ids, colors, background=(1.0, 1.0, 1.0, 0.0)):
+    """
+    RGBA image from an ID raster and one RGBA color per key
+
+    Args:
+        ids: ID raster from load_id_raster
+        colors: [n_keys, 4] RGBA array aligned with the raster keys
+        background: Color of pixels outside every tract
+    """
+    lut = np.vstack([np.asarray(background, dtype=float)[None, :], np.asarray(colors, dtype=float)])
+    return lut[ids]
+
+
+def load_map_attributes(config, columns, keys):
+    """Attribute columns from the 0.4.3 output, aligned with ID raster keys (no geometry read)"""
+    attributes = pd.read_parquet(os.path.join(config['workspace'], TRACT_MAP_FILE), columns=['GEOID20'] + list(columns))
+    return attributes.drop_duplicates('GEOID20').set_index('GEOID20').reindex(keys)
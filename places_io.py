@@ -0,0 +1,170 @@
+"""
+Columnar cache of the CDC PLACES tract releases (0.5, 0.6, 0.6.1)
+
+Every PLACES__Census_Tract_Data_(GIS_Friendly_Format)_<year>_release_*.csv in
+config['places_data'] is converted once into a typed parquet partition:
+
+    <workspace>/data/places_cache/
+        release_year=2020/part-0.parquet
+        release_year=2021/part-0.parquet
+        ...
+        manifest.json        source file, size and mtime of every partition
+
+Columns: tract_id (int64, the 11-digit TractFIPS), TotalPopulation (float32) and all
+*_CrudePrev measures (float32). The CI / text columns are dropped.
+
+ensure_places_cache compares the manifest with the CSVs on disk and only reconverts
+releases whose source was added or changed (partitions of deleted CSVs are removed),
+so readers can call it unconditionally before loading.
+"""
+
+import os
+import re
+import csv
+import json
+import shutil
+
+import pandas as pd
+
+PLACES_CACHE_DIR = 'data/places_cache'
+PLACES_RELEASE_PATTERN = re.compile(r'([0-9]{4})_release')
+PLACES_MEASURE_SUFFIX = '_CrudePrev'
+# Bump when the partition layout or column types change, so old caches are rebuilt
+PLACES_CACHE_VERSION = 1
+
+
+def places_cache_dir(config):
+    """Directory holding the PLACES partitions"""
+    return os.path.join(config['workspace'], PLACES_CACHE_DIR)
+
+
+def places_partition_path(config, year):
+    """Parquet file of one release year"""
+    return os.path.join(places_cache_dir(config), f'release_year={year}', 'part-0.parquet')
+
+
+def places_release_files(places_dir):
+    """
+    Release CSVs in places_dir keyed by release year (same pattern as the 0.6.1 SQL)
+
+    Returns:
+        dict of year -> path (the last file in name order wins if a year repeats)
+    """
+    files = {}
+    for name in sorted(os.listdir(places_dir)):
+        match = PLACES_RELEASE_PATTERN.search(name)
+        if name.endswith('.csv') and match:
+            files[int(match.group(1))] = os.path.join(places_dir, name)
+    return files
+
+
+def source_signature(path):
+    """Identifies a source CSV version (name, size, mtime)"""
+    st = os.stat(path)
+    return {'source': os.path.basename(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def read_manifest(config):
+    path = os.path.join(places_cache_dir(config), 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != PLACES_CACHE_VERSION:
+        return {}
+    return manifest.get('releases', {})
+
+
+def write_manifest(config, releases):
+    path = os.path.join(places_cache_dir(config), 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': PLACES_CACHE_VERSION, 'releases': releases}, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def convert_release(csv_path, output_path):
+    """
+    Convert one release CSV to a typed parquet file
+
+    Returns:
+        Number of rows written
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+
+    with open(csv_path, newline='') as f:
+        header = next(csv.reader(f))
+    measures = [c for c in header if c.endswith(PLACES_MEASURE_SUFFIX)]
+    column_types = {'TractFIPS': pa.int64(), 'TotalPopulation': pa.float32()}
+    column_types.update({c: pa.float32() for c in measures})
+
+    table = pacsv.read_csv(csv_path, convert_options=pacsv.ConvertOptions(
+        include_columns=['TractFIPS', 'TotalPopulation'] + measures,
+        column_types=column_types,
+        strings_can_be_null=True,
+    ))
+    table = table.rename_columns(['tract_id'] + table.column_names[1:])
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    pq.write_table(table, output_path + '.tmp', compression='zstd')
+    os.replace(output_path + '.tmp', output_path)
+    return table.num_rows
+
+
+def ensure_places_cache(config, rebuild=False, verbose=True):
+    """
+    Bring the PLACES cache up to date with the release CSVs
+
+    Args:
+        config: setting.json contents (uses places_data and workspace)
+        rebuild: Reconvert every release even if unchanged
+
+    Returns:
+        dict of release year -> manifest entry
+    """
+    cache_dir = places_cache_dir(config)
+    os.makedirs(cache_dir, exist_ok=True)
+    sources = places_release_files(config['places_data'])
+    cached = {} if rebuild else read_manifest(config)
+    releases = {k: v for k, v in cached.items() if int(k) in sources}
+
+    for year, path in sorted(sources.items()):
+        signature = source_signature(path)
+        entry = releases.get(str(year))
+        if (entry is not None and os.path.exists(places_partition_path(config, year))
+                and all(entry.get(k) == v for k, v in signature.items())):
+            continue
+        if verbose:
+            print(f"Converting PLACES {year} release: {signature['source']}")
+        rows = convert_release(path, places_partition_path(config, year))
+        releases[str(year)] = dict(signature, rows=rows)
+        # Record each release as soon as it is written, so an interrupted run resumes
+        write_manifest(config, releases)
+
+    for name in os.listdir(cache_dir):
+        if name.startswith('release_year=') and int(name.split('=')[1]) not in sources:
+            if verbose:
+                print(f"Removing cached PLACES partition without source CSV: {name}")
+            shutil.rmtree(os.path.join(cache_dir, name))
+
+    write_manifest(config, releases)
+    return {int(k): v for k, v in releases.items()}
+
+
+def load_places_release(config, year, columns=None):
+    """
+    One release year from the cache as a DataFrame
+
+    Args:
+        columns: Columns to read (default: all); tract_id is always included
+
+    Returns:
+        DataFrame with GEOID20_tract (11-char string) in place of tract_id
+    """
+    if columns is not None:
+        columns = ['tract_id'] + [c for c in columns if c != 'tract_id']
+    df = pd.read_parquet(places_partition_path(config, year), columns=columns)
+    geoid = df.pop('tract_id').astype('string').str.zfill(11)
+    df.insert(0, 'GEOID20_tract', geoid.astype(object))
+    return df
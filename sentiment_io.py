@@ -0,0 +1,196 @@
+"""
+Shared helpers for locating, reading and writing BERT sentiment files
+
+Sentiment files come in two formats, both named after the tweet file they score:
+
+    bert_sentiment_<name>.csv.gz    gzip TSV with message_id and score (original format)
+    bert_sentiment_<name>.parquet   typed parquet: int64 message_id, float32 score
+
+The recompute scripts (0.1.6) can write either format, and the verify (0.1.8) and
+merge (0.2.1) stages read both, preferring parquet when both exist.
+"""
+
+import os
+import shutil
+
+import pandas as pd
+
+SENTIMENT_PREFIX = 'bert_sentiment_'
+TWEET_SUFFIX = '.csv.gz'
+FORMATS = ('csv.gz', 'parquet')
+
+
+def sentiment_file_name(tweet_file, fmt='csv.gz'):
+    """Sentiment file name for a tweet file (e.g. 2014_01_01.csv.gz) in the given format"""
+    if fmt == 'parquet':
+        stem = tweet_file[:-len(TWEET_SUFFIX)] if tweet_file.endswith(TWEET_SUFFIX) else tweet_file
+        return f'{SENTIMENT_PREFIX}{stem}.parquet'
+    return f'{SENTIMENT_PREFIX}{tweet_file}'
+
+
+def tweet_file_name(sentiment_file):
+    """Inverse of sentiment_file_name: the tweet file a sentiment file belongs to"""
+    name = os.path.basename(sentiment_file)[len(SENTIMENT_PREFIX):]
+    if name.endswith('.parquet'):
+        name = name[:-len('.parquet')] + TWEET_SUFFIX
+    return name
+
+
+def sentiment_format(path):
+    """'parquet' or 'csv.gz', inferred from the file extension"""
+    return 'parquet' if path.endswith('.parquet') else 'csv.gz'
+
+
+def is_sentiment_file(name):
+    """True for bert_sentiment_ files in either supported format"""
+    return name.startswith(SENTIMENT_PREFIX) and (name.endswith('.parquet') or name.endswith(TWEET_SUFFIX))
+
+
+def find_sentiment_file(directory, tweet_file, names=None):
+    """
+    Locate the sentiment file for a tweet file, preferring parquet over gzip TSV
+
+    A zero-byte file (e.g. left by a killed job) is only returned when the other
+    format has no non-empty file either, so it never hides a valid one.
+
+    Args:
+        directory: Sentiment directory to look in
+        tweet_file: Tweet file name (e.g. 2014_01_01.csv.gz)
+        names: Optional file names already listed from directory, either a set or a
+               dict of name -> [size, ...]; when given, no filesystem calls are made
+               (sizes are only known from a dict)
+
+    Returns:
+        Path of the sentiment file, or None if neither format exists
+    """
+    found = []
+    for fmt in ('parquet', 'csv.gz'):
+        name = sentiment_file_name(tweet_file, fmt)
+        path = os.path.join(directory, name)
+        if names is not None:
+            if name not in names:
+                continue
+            stats = names[name] if isinstance(names, dict) else None
+            size = stats[0] if stats else None
+        elif os.path.exists(path):
+            size = os.path.getsize(path)
+        else:
+            continue
+        if size != 0:
+            return path
+        found.append(path)
+    return found[0] if found else None
+
+
+def read_sentiment(path, columns=None, message_id_as_str=True):
+    """
+    Read a sentiment file in either format
+
+    Args:
+        path: Sentiment file path (.csv.gz or .parquet)
+        columns: Optional list of columns to read
+        message_id_as_str: Return message_id as str (matches tweets read with dtype=str)
+
+    Returns:
+        DataFrame with message_id and score
+    """
+    if sentiment_format(path) == 'parquet':
+        df = pd.read_parquet(path, columns=columns)
+        if message_id_as_str and 'message_id' in df.columns:
+            df['message_id'] = df['message_id'].astype(str)
+        return df
+
+    dtype = {'message_id': str if message_id_as_str else 'int64', 'score': float}
+    return pd.read_csv(path, sep='\t', compression='gzip', usecols=columns, dtype=dtype)
+
+
+def sentiment_columns(path):
+    """Column names of a sentiment file, read from the parquet schema or the TSV header line"""
+    if sentiment_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, sep='\t', compression='gzip', nrows=0).columns)
+
+
+def iter_sentiment_chunks(path, columns=('message_id', 'score'), chunksize=1_000_000):
+    """
+    Yield a sentiment file as DataFrame chunks without loading it whole
+
+    message_id is parsed as int64 in both formats, so a malformed id raises instead
+    of silently turning into text. A truncated gzip stream raises EOFError once the
+    reader reaches the cut-off point.
+
+    Args:
+        path: Sentiment file path (.csv.gz or .parquet)
+        columns: Columns to read
+        chunksize: Rows per chunk (parquet batches)
+    """
+    columns = list(columns)
+    if sentiment_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    dtype = {'message_id': 'int64', 'score': 'float64'}
+    dtype = {c: t for c, t in dtype.items() if c in columns}
+    yield from pd.read_csv(path, sep='\t', compression='gzip', usecols=columns,
+                           dtype=dtype, chunksize=chunksize)
+
+
+def write_sentiment(df, path, fmt=None, header=True):
+    """
+    Write sentiment scores as gzip TSV or typed parquet
+
+    Parquet output keeps only message_id (int64) and score (float32), so readers get
+    typed columns without parsing text.
+
+    Args:
+        df: DataFrame with message_id and score
+        path: Output path
+        fmt: 'csv.gz' or 'parquet'; inferred from path when None
+        header: Write the TSV header line (ignored for parquet)
+    """
+    fmt = fmt or sentiment_format(path)
+    if fmt == 'parquet':
+        typed = pd.DataFrame({
+            'message_id': pd.to_numeric(df['message_id']).astype('int64'),
+            'score': df['score'].astype('float32'),
+        })
+        typed.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, sep='\t', index=False, header=header, compression='gzip')
+
+
+def concat_sentiment_parts(part_paths, output_path, fmt=None):
+    """
+    Concatenate sentiment part files (in order) into one output file
+
+    gzip TSV parts are appended byte for byte as gzip members (only the first part
+    should carry a header); parquet parts are streamed into one file row group by
+    row group. Neither path holds more than one part in memory.
+    """
+    fmt = fmt or sentiment_format(output_path)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for part_path in part_paths:
+                table = pq.read_table(part_path)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            write_sentiment(pd.DataFrame({'message_id': [], 'score': []}), output_path, 'parquet')
+        return
+
+    with open(output_path, 'wb') as out:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part:
+                shutil.copyfileobj(part, out)
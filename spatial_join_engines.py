@@ -0,0 +1,347 @@
+"""
+Interchangeable point-in-block spatial join engines
+
+The pipeline has grown three ways of putting tweets into census blocks: GeoPandas
+sjoin (0.3.2), DuckDB ST_Within with the confidence score (0.3.9) and the STRtree /
+buffer experiments (0.3.5). Each engine here takes the same inputs and returns the
+same table, so they can be swapped and checked against each other (0.3.10):
+
+    points   Arrow table with longitude, latitude and optionally GPS, spatialerror
+             (strings as in the raw tweets are accepted; rows without coordinates
+             never match)
+    blocks   block store: GeoDataFrame (EPSG:4326) with block_id, block_diameter_m
+             and geometry, see block_store / load_block_store
+
+    result   Arrow table point_index (row of points), block_id, confidence,
+             sorted by (point_index, block_id); points outside every block are
+             dropped, like the inner joins of 0.3.2 / 0.3.9
+
+All engines use the ST_Within predicate: a point exactly on a block boundary matches
+no block (0.3.2's default 'intersects' would give it both neighbours). The confidence
+score is the one of 0.3.9 (CONFIDENCE_SQL), from GPS, spatialerror and the block
+diameter.
+
+Engines:
+    geopandas   GeoDataFrame.sjoin(predicate='within') on the blocks' STRtree
+    duckdb      ST_Within join in DuckDB (needs the spatial extension)
+    grid        NumPy uniform grid over the block bounding boxes; candidates from the
+                point's cell (plus the few oversized blocks kept outside the grid),
+                then an exact shapely.contains_xy test. No tree, only sorted integer
+                arrays, and points are processed in chunks
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+ENGINE_NAMES = ['geopandas', 'duckdb', 'grid']
+# Blocks whose bounding box covers more grid cells are not expanded into cells
+GRID_MAX_CELLS_PER_BLOCK = 256
+BLOCK_COLUMNS = ['block_id', 'block_diameter_m']
+# spatialerror of tweets without one (0.3.9): check-in level
+DEFAULT_SPATIALERROR = 10000.0
+
+# Confidence score of 0.3.9, for a tweet t joined to block c
+CONFIDENCE_SQL = """CASE
+        WHEN t.GPS THEN 1.0
+        WHEN t.spatialerror < 50 THEN 1.0
+        WHEN t.spatialerror < (c.block_diameter_m / 2) THEN 0.8
+        WHEN t.spatialerror < c.block_diameter_m THEN 0.5
+        WHEN t.spatialerror < (2 * c.block_diameter_m) THEN 0.3
+        WHEN t.spatialerror < 1000 THEN 0.15
+        ELSE 0.05
+    END"""
+
+
+def confidence_score(gps, spatialerror, block_diameter_m):
+    """CONFIDENCE_SQL on NumPy arrays"""
+    d = block_diameter_m
+    return np.select([gps, spatialerror < 50, spatialerror < d / 2, spatialerror < d, spatialerror < 2 * d,
+                      spatialerror < 1000],
+                     [1.0, 1.0, 0.8, 0.5, 0.3, 0.15], 0.05)
+
+
+# ---------- inputs ----------
+
+def block_store(blocks):
+    """
+    Normalize a block GeoDataFrame to the engines' block store
+
+    Keeps block_id, block_diameter_m and geometry in EPSG:4326. Without a block_id
+    column, the row number is used (as 0.3.8 assigns it).
+    """
+    if 'block_id' not in blocks.columns:
+        blocks = blocks.assign(block_id=np.arange(len(blocks), dtype=np.int32))
+    store = blocks[BLOCK_COLUMNS + [blocks.geometry.name]]
+    if store.geometry.name != 'geometry':
+        store = store.rename_geometry('geometry')
+    if store.crs is not None and not store.crs.equals('EPSG:4326'):
+        store = store.to_crs('EPSG:4326')
+    return store.reset_index(drop=True)
+
+
+def load_block_store(path, bbox=None):
+    """Block store from the national geoparquet of 0.3.8, optionally only blocks intersecting bbox"""
+    import geopandas as gpd
+
+    return block_store(gpd.read_parquet(path, columns=BLOCK_COLUMNS + ['geometry'], bbox=bbox))
+
+
+def point_table(points):
+    """
+    Normalize the points to point_index, longitude, latitude (float64), GPS (bool)
+    and spatialerror (float64), dropping rows without valid coordinates
+
+    point_index is the row in the input table, so results map back to it.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    names = points.column_names
+
+    def numeric(name):
+        return pd.to_numeric(points[name].to_pandas(), errors='coerce').to_numpy(dtype=np.float64, copy=True)
+
+    lon, lat = numeric('longitude'), numeric('latitude')
+    if 'GPS' in names:
+        # Raw tweets carry GPS as 'True' / 'true' strings (see 0.3.9); missing is False
+        gps = points['GPS']
+        if pa.types.is_string(gps.type) or pa.types.is_large_string(gps.type):
+            gps = pc.equal(pc.utf8_lower(gps), 'true')
+        gps = pc.fill_null(pc.cast(gps, pa.bool_()), False).to_numpy(zero_copy_only=False)
+    else:
+        gps = np.zeros(len(lon), dtype=bool)
+    spatialerror = numeric('spatialerror') if 'spatialerror' in names else np.full(len(lon), np.nan)
+    spatialerror[np.isnan(spatialerror)] = DEFAULT_SPATIALERROR
+
+    valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+    return pa.table({'point_index': valid.astype(np.int64), 'longitude': lon[valid], 'latitude': lat[valid],
+                     'GPS': gps[valid], 'spatialerror': spatialerror[valid]})
+
+
+def result_table(point_index, block_id, confidence):
+    """Engine output as an Arrow table sorted by (point_index, block_id)"""
+    import pyarrow as pa
+
+    point_index, block_id = np.asarray(point_index, dtype=np.int64), np.asarray(block_id, dtype=np.int32)
+    order = np.lexsort((block_id, point_index))
+    return pa.table({'point_index': point_index[order], 'block_id': block_id[order],
+                     'confidence': np.asarray(confidence, dtype=np.float64)[order]})
+
+
+# ---------- engines ----------
+
+def join_geopandas(points, blocks):
+    """GeoPandas sjoin (0.3.2) with the within predicate"""
+    import geopandas as gpd
+
+    pts = point_table(points)
+    gdf = gpd.GeoDataFrame({'GPS': pts['GPS'].to_numpy(zero_copy_only=False),
+                            'spatialerror': pts['spatialerror'].to_numpy()},
+                           geometry=gpd.points_from_xy(pts['longitude'].to_numpy(), pts['latitude'].to_numpy()),
+                           crs='EPSG:4326')
+    joined = gdf.sjoin(blocks, how='inner', predicate='within')
+    rows = joined.index.to_numpy()
+    confidence = confidence_score(joined['GPS'].to_numpy(), joined['spatialerror'].to_numpy(),
+                                  joined['block_diameter_m'].to_numpy())
+    return result_table(pts['point_index'].to_numpy()[rows], joined['block_id'].to_numpy(), confidence)
+
+
+def load_duckdb_spatial(con):
+    """LOAD (installing if needed) the DuckDB spatial extension"""
+    try:
+        con.execute("LOAD spatial")
+    except Exception:
+        con.execute("INSTALL spatial")
+        con.execute("LOAD spatial")
+
+
+def join_duckdb(points, blocks, threads=None):
+    """ST_Within join of 0.3.9: blocks in a table with an RTREE index, confidence in SQL"""
+    import duckdb
+    import shapely
+    import pyarrow as pa
+
+    con = duckdb.connect()
+    try:
+        load_duckdb_spatial(con)
+        if threads:
+            con.execute(f"SET threads TO {int(threads)}")
+        blocks_arrow = pa.table({'block_id': blocks['block_id'].to_numpy(),
+                                 'block_diameter_m': blocks['block_diameter_m'].to_numpy(dtype=np.float64),
+                                 'geometry': pa.array(shapely.to_wkb(blocks.geometry.values), pa.binary())})
+        points_arrow = point_table(points)
+        con.register('blocks_arrow', blocks_arrow)
+        con.register('points_arrow', points_arrow)
+        con.execute("""
+            CREATE TABLE census_blocks AS
+            SELECT block_id, block_diameter_m, ST_GeomFromWKB(geometry) AS geometry_4326 FROM blocks_arrow""")
+        con.execute("CREATE INDEX census_geom_idx ON census_blocks USING RTREE(geometry_4326)")
+        joined = con.execute(f"""
+            SELECT t.point_index, c.block_id, {CONFIDENCE_SQL} AS confidence
+            FROM points_arrow t
+            JOIN census_blocks c
+              ON ST_Within(ST_Point(t.longitude, t.latitude), c.geometry_4326)""").fetch_arrow_table()
+    finally:
+        con.close()
+    return result_table(joined['point_index'].to_numpy(), joined['block_id'].to_numpy(),
+                        joined['confidence'].to_numpy())
+
+
+def build_grid_index(blocks, cell_size=None, max_cells_per_block=GRID_MAX_CELLS_PER_BLOCK):
+    """
+    Uniform grid over the block bounding boxes
+
+    Every block is listed under each cell its bounding box touches; only occupied
+    cells are stored (sorted cell ids + block rows), so memory follows the number of
+    (cell, block) pairs, not the extent. The default cell size is the median block
+    bounding-box side: most blocks touch 1-4 cells and a cell has a few candidates.
+
+    Blocks touching more than max_cells_per_block cells (large rural or water blocks,
+    which would otherwise add millions of pairs each) are kept out of the grid in
+    large_rows; grid_candidates pairs them with the points inside their bounding box.
+
+    Returns:
+        dict with origin, cell_size, n_cols, cell_ids, block_rows, large_rows, bounds, geometry
+    """
+    import shapely
+
+    geometry = np.asarray(blocks.geometry.values)
+    shapely.prepare(geometry)
+    bounds = shapely.bounds(geometry)
+    if cell_size is None:
+        sides = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+        cell_size = float(np.median(sides)) if len(sides) else 1.0
+        cell_size = cell_size if cell_size > 0 else 1.0
+    x0, y0 = bounds[:, 0].min(), bounds[:, 1].min()
+    n_cols = int((bounds[:, 2].max() - x0) // cell_size) + 1
+
+    ix0 = ((bounds[:, 0] - x0) // cell_size).astype(np.int64)
+    iy0 = ((bounds[:, 1] - y0) // cell_size).astype(np.int64)
+    nx = ((bounds[:, 2] - x0) // cell_size).astype(np.int64) - ix0 + 1
+    ny = ((bounds[:, 3] - y0) // cell_size).astype(np.int64) - iy0 + 1
+    counts = nx * ny
+    large = counts > max_cells_per_block
+    counts[large] = 0
+
+    # One (cell, block) pair per cell of each bounding box
+    block_rows = np.repeat(np.arange(len(geometry), dtype=np.int64), counts)
+    k = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    nx_rep = nx[block_rows]
+    cell_ids = (iy0[block_rows] + k // nx_rep) * n_cols + ix0[block_rows] + k % nx_rep
+    order = np.argsort(cell_ids, kind='stable')
+    return {'origin': (x0, y0), 'cell_size': cell_size, 'n_cols': n_cols, 'cell_ids': cell_ids[order],
+            'block_rows': block_rows[order], 'large_rows': np.flatnonzero(large), 'bounds': bounds,
+            'geometry': geometry}
+
+
+def grid_candidates(index, x, y):
+    """(point positions, block rows) of the candidate pairs of points x, y in the grid"""
+    x0, y0 = index['origin']
+    ix = np.floor((x - x0) / index['cell_size']).astype(np.int64)
+    iy = np.floor((y - y0) / index['cell_size']).astype(np.int64)
+    inside = (ix >= 0) & (ix < index['n_cols']) & (iy >= 0)
+    cell = np.where(inside, iy * index['n_cols'] + ix, -1)
+    lo = np.searchsorted(index['cell_ids'], cell, side='left')
+    n = np.searchsorted(index['cell_ids'], cell, side='right') - lo
+    points = np.repeat(np.arange(len(x), dtype=np.int64), n)
+    pairs = np.repeat(lo, n) + np.arange(n.sum(), dtype=np.int64) - np.repeat(np.cumsum(n) - n, n)
+    points, rows = [points], [index['block_rows'][pairs]]
+
+    # Oversized blocks are not in the cells: pair each with the points in its bounding box
+    for row in index['large_rows']:
+        minx, miny, maxx, maxy = index['bounds'][row]
+        hit = np.flatnonzero((x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy))
+        points.append(hit)
+        rows.append(np.full(len(hit), row, dtype=np.int64))
+    return np.concatenate(points), np.concatenate(rows)
+
+
+def join_grid(points, blocks, cell_size=None, chunk_size=1_000_000, max_cells_per_block=GRID_MAX_CELLS_PER_BLOCK):
+    """NumPy grid lookup plus exact point-in-polygon test, chunk_size points at a time"""
+    import shapely
+
+    index = build_grid_index(blocks, cell_size, max_cells_per_block)
+    block_ids = blocks['block_id'].to_numpy()
+    diameter = blocks['block_diameter_m'].to_numpy(dtype=np.float64)
+    pts = point_table(points)
+    point_index, x, y = pts['point_index'].to_numpy(), pts['longitude'].to_numpy(), pts['latitude'].to_numpy()
+    gps, spatialerror = pts['GPS'].to_numpy(zero_copy_only=False), pts['spatialerror'].to_numpy()
+
+    out_points, out_rows = [], []
+    for start in range(0, len(x), chunk_size):
+        cx, cy = x[start:start + chunk_size], y[start:start + chunk_size]
+        p, rows = grid_candidates(index, cx, cy)
+        # Bounding box first (cheap), then the exact test; contains excludes the boundary (= within)
+        b = index['bounds'][rows]
+        px, py = cx[p], cy[p]
+        keep = (px > b[:, 0]) & (px < b[:, 2]) & (py > b[:, 1]) & (py < b[:, 3])
+        p, rows = p[keep], rows[keep]
+        keep = shapely.contains_xy(index['geometry'][rows], cx[p], cy[p])
+        out_points.append(p[keep] + start)
+        out_rows.append(rows[keep])
+
+    p = np.concatenate(out_points) if out_points else np.zeros(0, dtype=np.int64)
+    rows = np.concatenate(out_rows) if out_rows else np.zeros(0, dtype=np.int64)
+    return result_table(point_index[p], block_ids[rows], confidence_score(gps[p], spatialerror[p], diameter[rows]))
+
+
+ENGINES = {'geopandas': join_geopandas, 'duckdb': join_duckdb, 'grid': join_grid}
+
+
+def spatial_join(points, blocks, engine='geopandas', **options):
+    """Join points to blocks with one of ENGINE_NAMES; options go to the engine function"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown spatial join engine {engine!r}; choose from {', '.join(ENGINE_NAMES)}")
+    return ENGINES[engine](points, blocks, **options)
+
+
+# ---------- comparison ----------
+
+def engine_unavailable(engine):
+    """None if engine can run here, otherwise the reason (missing package or DuckDB spatial extension)"""
+    try:
+        if engine == 'duckdb':
+            import duckdb
+
+            con = duckdb.connect()
+            try:
+                load_duckdb_spatial(con)
+            finally:
+                con.close()
+        elif engine == 'geopandas':
+            import geopandas  # noqa: F401
+        else:
+            import shapely  # noqa: F401
+    except Exception as e:
+        return f"{type(e).__name__}: {str(e).splitlines()[0]}"
+    return None
+
+
+def timed_join(points, blocks, engine, **options):
+    """(result table, seconds) of one engine run"""
+    start = time.perf_counter()
+    result = spatial_join(points, blocks, engine, **options)
+    return result, time.perf_counter() - start
+
+
+def compare_joins(reference, other, atol=1e-9):
+    """
+    Compare two engine results pair by pair
+
+    Returns:
+        dict with pairs (in other), missing (reference pairs not in other), extra
+        (other pairs not in reference) and confidence_mismatch (shared pairs whose
+        confidence differs by more than atol); all zero means the engines agree
+    """
+    merged = pd.merge(reference.to_pandas(), other.to_pandas(), on=['point_index', 'block_id'], how='outer',
+                      suffixes=('_reference', '_other'), indicator=True)
+    both = merged[merged['_merge'] == 'both']
+    return {
+        'pairs': other.num_rows,
+        'missing': int((merged['_merge'] == 'left_only').sum()),
+        'extra': int((merged['_merge'] == 'right_only').sum()),
+        'confidence_mismatch': int((~np.isclose(both['confidence_reference'], both['confidence_other'],
+                                                rtol=0, atol=atol)).sum()),
+    }
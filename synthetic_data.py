@@ -0,0 +1,278 @@
+"""
+Synthetic census-like inputs for offline benchmarks (0.7) and engine comparisons
+
+Generates every raw input of the pipeline at a configurable scale, in the same file
+formats the production stages read:
+
+    <root>/
+        setting.json                                   points every config key into <root>
+        inputs/geo_tweets_archive/<year>/<YYYY_MM_DD>.csv.gz     gzip TSV tweets (0.2.1)
+        inputs/sentiment/<year>/bert_sentiment_<name>.parquet    message_id, score (sentiment_io)
+        inputs/census_data_2020/tl_2020_<fips>_tabblock20.zip    state block shapefiles (0.3.8 / 0.3.2)
+        inputs/census_pop/census_pop.parquet                     GEO_ID, P1_001N (0.4.0 / 0.4.2)
+        inputs/places/PLACES__..._<year>_release_synthetic.csv   TractFIPS, TotalPopulation, *_CrudePrev
+        workspace/                                               pipeline outputs
+        synthetic.json                                           generation parameters
+
+Blocks are rectangles on a grid with random row / column widths inside EXTENT, grouped
+into states (vertical bands), counties and tracts with valid 15-digit GEOID20s. Part of
+the grid is left empty, so some tweets fall outside every block like offshore points.
+Tweets are drawn per block with probability rising faster than population, so
+coverage is uneven (Gini well above 0). Sentiment has a tract-level component that
+PLACES MHLTH_CrudePrev is correlated with, so the correlation stage has signal.
+"""
+
+import os
+import json
+import shutil
+import zipfile
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Lon/lat window of the synthetic blocks (mid-continental US, EPSG:4326)
+EXTENT = (-100.0, 35.0, -90.0, 41.0)
+# Real state FIPS codes, used in order for the synthetic states
+STATE_FIPS = ['17', '18', '19', '20', '29', '31', '39', '40', '47', '55']
+PLACES_MEASURES = ['MHLTH', 'MAMMOUSE', 'DEPRESSION', 'BPHIGH', 'OBESITY', 'CASTHMA', 'ACCESS2', 'SLEEP']
+EMPTY_FRACTION = 0.05
+# Bumped when the generated file layout changes, so older workspaces are regenerated
+LAYOUT_VERSION = 2
+OUTSIDE_FRACTION = 0.02
+
+
+def grid_edges(rng, n, lo, hi):
+    """n + 1 cell edges between lo and hi with random cell widths"""
+    widths = rng.gamma(4.0, 1.0, n)
+    return lo + (hi - lo) * np.r_[0.0, np.cumsum(widths) / widths.sum()]
+
+
+def synthetic_blocks(n_blocks, n_states=2, blocks_per_tract=40, tracts_per_county=25, seed=0):
+    """
+    Rectangular census-like blocks
+
+    Returns:
+        GeoDataFrame (EPSG:4326) with GEOID20, STATEFP20, COUNTYFP20, TRACTCE20,
+        BLOCKCE20, block_area_m2, block_diameter_m, population, block_id and geometry
+    """
+    import shapely
+    import geopandas as gpd
+
+    if not 1 <= n_states <= len(STATE_FIPS):
+        raise ValueError(f"n_states must be between 1 and {len(STATE_FIPS)}")
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = EXTENT
+    n_cells = int(np.ceil(n_blocks / (1.0 - EMPTY_FRACTION)))
+    ny = max(1, int(np.sqrt(n_cells * (maxy - miny) / (maxx - minx))))
+    nx = int(np.ceil(n_cells / ny))
+    x_edges, y_edges = grid_edges(rng, nx, minx, maxx), grid_edges(rng, ny, miny, maxy)
+
+    # Cells in column-major order; the last cells stay empty
+    cell = np.arange(n_blocks)
+    col, row = cell // ny, cell % ny
+    state = col * n_states // nx
+    # Position of the block within its state (states are contiguous runs of columns)
+    state_start = np.searchsorted(state, np.arange(n_states))
+    k = cell - state_start[state]
+    tract, block = k // blocks_per_tract, k % blocks_per_tract
+    county, tract_in_county = tract // tracts_per_county, tract % tracts_per_county
+
+    statefp = np.asarray(STATE_FIPS)[state]
+    countyfp = np.char.zfill((2 * county + 1).astype(str), 3)
+    tractce = np.char.zfill(((tract_in_county + 1) * 100).astype(str), 6)
+    blockce = np.char.zfill((1000 + block).astype(str), 4)
+    geoid = np.char.add(np.char.add(statefp, countyfp), np.char.add(tractce, blockce))
+
+    geometry = shapely.box(x_edges[col], y_edges[row], x_edges[col + 1], y_edges[row + 1])
+    gdf = gpd.GeoDataFrame({
+        'GEOID20': geoid.astype(object), 'STATEFP20': statefp.astype(object),
+        'COUNTYFP20': countyfp.astype(object), 'TRACTCE20': tractce.astype(object),
+        'BLOCKCE20': blockce.astype(object),
+    }, geometry=geometry, crs='EPSG:4326')
+    # Same area / diameter definition as 0.3.8
+    gdf['block_area_m2'] = gdf.geometry.to_crs('EPSG:5070').area
+    gdf['block_diameter_m'] = (gdf['block_area_m2'] / 3.14159) ** 0.5 * 2
+    population = rng.lognormal(3.5, 1.2, n_blocks).round()
+    population[rng.random(n_blocks) < 0.1] = 0
+    gdf['population'] = population.astype(np.int64)
+    gdf['block_id'] = np.arange(n_blocks, dtype=np.int32)
+    return gdf
+
+
+def day_names(year, n_days):
+    """n_days evenly spaced days of a year as YYYY_MM_DD tweet file stems"""
+    days = pd.Timestamp(year=year, month=1, day=1) + pd.to_timedelta(
+        np.linspace(0, 364, n_days).astype(int), unit='D')
+    return [d.strftime('%Y_%m_%d') for d in days]
+
+
+def synthetic_tweets(blocks, n_tweets, years, n_days, seed=0):
+    """
+    Tweets with sentiment scores, spread over n_days day files per year
+
+    Returns:
+        (DataFrame with message_id, text, user_id, latitude, longitude, geom, GPS,
+        spatialerror, date, score and file (the YYYY_MM_DD stem of its day file),
+        Series of the tract sentiment effect)
+    """
+    rng = np.random.default_rng(seed + 1)
+    bounds = blocks.geometry.bounds.to_numpy()
+    population = blocks['population'].to_numpy(dtype=np.float64)
+    # Tweets grow faster than population, with block-level noise: uneven coverage
+    weights = (population + 1.0) ** 1.3 * rng.lognormal(0.0, 1.0, len(blocks))
+    n_inside = int(round(n_tweets * (1.0 - OUTSIDE_FRACTION)))
+    b = rng.choice(len(blocks), size=n_inside, p=weights / weights.sum())
+    u, v = rng.random(n_inside), rng.random(n_inside)
+    lon = np.r_[bounds[b, 0] + u * (bounds[b, 2] - bounds[b, 0]),
+                rng.uniform(EXTENT[0] - 1.0, EXTENT[2] + 1.0, n_tweets - n_inside)]
+    lat = np.r_[bounds[b, 1] + v * (bounds[b, 3] - bounds[b, 1]),
+                rng.uniform(EXTENT[1] - 1.0, EXTENT[3] + 1.0, n_tweets - n_inside)]
+
+    # Sentiment: tract effect + noise, clipped to the BERT score range
+    tract = blocks['GEOID20'].str[:11].to_numpy()
+    tract_codes, tract_labels = pd.factorize(tract)
+    tract_effect = rng.normal(0.0, 0.15, len(tract_labels))
+    latent = np.r_[tract_effect[tract_codes[b]], np.zeros(n_tweets - n_inside)]
+    score = np.clip(0.55 + latent + rng.normal(0.0, 0.25, n_tweets), 0.0, 1.0).astype(np.float32)
+
+    files = np.array([name for year in years for name in day_names(year, n_days)])
+    file = files[rng.integers(0, len(files), n_tweets)]
+    seconds = rng.integers(0, 86400, n_tweets)
+    date = (pd.to_datetime(pd.Series(file), format='%Y_%m_%d')
+            + pd.to_timedelta(seconds, unit='s')).dt.strftime('%Y-%m-%d %H:%M:%S')
+    keywords = np.array(['', '', '', ' covid', ' weather', ' traffic'])
+    # Location quality columns of the archive (0.3.9 confidence); own generator, so the
+    # columns above stay the same for a given seed
+    quality_rng = np.random.default_rng(seed + 3)
+    spatialerror = quality_rng.lognormal(np.log(300.0), 1.5, n_tweets).round(1)
+    spatialerror[quality_rng.random(n_tweets) < 0.05] = np.nan
+    lat, lon = lat.round(6), lon.round(6)
+    return pd.DataFrame({
+        'message_id': np.arange(10 ** 12, 10 ** 12 + n_tweets, dtype=np.int64),
+        'text': np.char.add('synthetic tweet', keywords[rng.integers(0, len(keywords), n_tweets)]),
+        'user_id': rng.integers(1, max(2, n_tweets // 20), n_tweets),
+        'latitude': lat, 'longitude': lon,
+        'geom': 'POINT (' + pd.Series(lon).astype(str) + ' ' + pd.Series(lat).astype(str) + ')',
+        'GPS': np.where(quality_rng.random(n_tweets) < 0.2, 'True', 'False'),
+        'spatialerror': spatialerror,
+        'date': date.to_numpy(), 'score': score, 'file': file,
+    }), pd.Series(tract_effect, index=tract_labels)
+
+
+def write_state_zips(blocks, directory):
+    """
+    Write blocks as one TIGER-style tl_2020_<fips>_tabblock20.zip shapefile per state
+
+    Only the columns 0.3.8 reads are written; area, diameter and block_id are computed
+    by 0.3.8 itself.
+    """
+    columns = ['GEOID20', 'STATEFP20', 'COUNTYFP20', 'TRACTCE20', 'BLOCKCE20', 'geometry']
+    for statefp, state in blocks[columns].groupby('STATEFP20', sort=True):
+        stem = f'tl_2020_{statefp}_tabblock20'
+        with tempfile.TemporaryDirectory() as tmp:
+            state.to_file(os.path.join(tmp, f'{stem}.shp'))
+            with zipfile.ZipFile(os.path.join(directory, f'{stem}.zip'), 'w', zipfile.ZIP_DEFLATED) as zf:
+                for name in sorted(os.listdir(tmp)):
+                    zf.write(os.path.join(tmp, name), name)
+
+
+def synthetic_places(blocks, tract_effect, year, seed=0):
+    """
+    PLACES GIS-friendly tract table: TractFIPS, TotalPopulation and *_CrudePrev
+
+    MHLTH_CrudePrev decreases with the tract sentiment effect; the other measures are noise.
+    """
+    rng = np.random.default_rng(seed + year)
+    tract_pop = blocks.groupby(blocks['GEOID20'].str[:11])['population'].sum()
+    effect = tract_effect.reindex(tract_pop.index).to_numpy()
+    places = pd.DataFrame({'TractFIPS': tract_pop.index, 'TotalPopulation': tract_pop.to_numpy()})
+    for measure in PLACES_MEASURES:
+        base = rng.normal(15.0, 4.0, len(places))
+        if measure == 'MHLTH':
+            base = 15.0 - 20.0 * effect + rng.normal(0.0, 1.5, len(places))
+        places[f'{measure}_CrudePrev'] = np.clip(base, 0.5, 60.0).round(1)
+    # A few missing values, as in the real releases
+    places.loc[rng.random(len(places)) < 0.01, 'MAMMOUSE_CrudePrev'] = np.nan
+    return places
+
+
+def workspace_config(root, years):
+    """setting.json contents pointing every pipeline path into root"""
+    inputs, workspace = os.path.join(root, 'inputs'), os.path.join(root, 'workspace')
+    return {
+        'workspace': workspace,
+        'geo_tweets_archive_base_path': os.path.join(inputs, 'geo_tweets_archive'),
+        'sentiment_file_base_path': os.path.join(inputs, 'sentiment'),
+        'census_data_2020': os.path.join(inputs, 'census_data_2020'),
+        'census_pop': os.path.join(inputs, 'census_pop'),
+        'places_data': os.path.join(inputs, 'places'),
+        'geotweets_with_sentiment': os.path.join(workspace, 'data', 'geotweets_with_sentiment'),
+        'tweets_with_census_blocks': os.path.join(workspace, 'data', 'tweets_with_census_blocks'),
+        'statistic_results': os.path.join(workspace, 'data', 'statistics'),
+        'sentiment_by_tract': os.path.join(workspace, 'data', 'tract_sentiment'),
+        'outputs_dir': os.path.join(root, 'outputs'),
+        'analysis_years': list(years),
+    }
+
+
+def write_synthetic_workspace(root, n_blocks=20000, n_tweets=200000, years=(2020,), n_days=7,
+                              n_states=2, seed=0, verbose=True):
+    """
+    Generate all pipeline inputs under root (skipped if synthetic.json already matches;
+    otherwise <root>/inputs is wiped and regenerated)
+
+    Returns:
+        (config dict also written to <root>/setting.json, generation parameters)
+    """
+    from sentiment_io import sentiment_file_name, write_sentiment
+
+    params = {'n_blocks': n_blocks, 'n_tweets': n_tweets, 'years': list(years), 'n_days': n_days,
+              'n_states': n_states, 'seed': seed, 'layout': LAYOUT_VERSION}
+    config = workspace_config(root, years)
+    manifest_path = os.path.join(root, 'synthetic.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == params:
+                return config, params
+        os.remove(manifest_path)
+    # Start from an empty inputs directory: day files, year directories or PLACES releases
+    # of the previous parameters would otherwise be read alongside the new ones
+    shutil.rmtree(os.path.join(root, 'inputs'), ignore_errors=True)
+
+    if verbose:
+        print(f"Generating synthetic inputs in {root}: {n_blocks:,} blocks, {n_tweets:,} tweets, "
+              f"years {list(years)} x {n_days} days")
+    for key in ('geo_tweets_archive_base_path', 'sentiment_file_base_path', 'census_data_2020',
+                'census_pop', 'places_data'):
+        os.makedirs(config[key], exist_ok=True)
+
+    blocks = synthetic_blocks(n_blocks, n_states=n_states, seed=seed)
+    # Raw state zips; the national block files are built from them by 0.3.8
+    write_state_zips(blocks, config['census_data_2020'])
+    pd.DataFrame({'GEO_ID': '1000000US' + blocks['GEOID20'], 'P1_001N': blocks['population']}).to_parquet(
+        os.path.join(config['census_pop'], 'census_pop.parquet'), index=False)
+
+    tweets, tract_effect = synthetic_tweets(blocks, n_tweets, years, n_days, seed=seed)
+    for name, day in tweets.groupby('file', sort=True):
+        year = name[:4]
+        tweet_dir = os.path.join(config['geo_tweets_archive_base_path'], year)
+        sentiment_dir = os.path.join(config['sentiment_file_base_path'], year)
+        os.makedirs(tweet_dir, exist_ok=True)
+        os.makedirs(sentiment_dir, exist_ok=True)
+        tweet_file = f'{name}.csv.gz'
+        day.drop(columns=['score', 'file']).to_csv(os.path.join(tweet_dir, tweet_file), sep='\t',
+                                                   index=False, compression='gzip')
+        write_sentiment(day[['message_id', 'score']],
+                        os.path.join(sentiment_dir, sentiment_file_name(tweet_file, 'parquet')))
+
+    for year in years:
+        synthetic_places(blocks, tract_effect, year, seed=seed).to_csv(os.path.join(
+            config['places_data'],
+            f'PLACES__Census_Tract_Data_(GIS_Friendly_Format)_{year}_release_synthetic.csv'), index=False)
+
+    with open(os.path.join(root, 'setting.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+    with open(manifest_path, 'w') as f:
+        json.dump(params, f, indent=2)
+    return config, params